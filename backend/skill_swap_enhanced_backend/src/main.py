@@ -12,8 +12,19 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# JSON logs through a background writer; configured before anything logs
+from src.services.logging_config import configure_logging, install_request_ids
+configure_logging()
+
 # Import models and routes
 from src.models.user import init_db
+from src.models.token_revocation import is_token_revoked, RevocationUnavailable
+from src.services.mail_queue import start_mail_workers
+from src.services.image_pipeline import start_image_workers
+from src.services.scheduler import start_scheduler
+from src.services.google_oauth import warm_google_certs
+from src.services.metrics import instrument_app
+from src.services.tracing import install_tracing
 from src.routes.auth import auth_bp
 from src.routes.user import user_bp
 from src.routes.swap_request import swap_request_bp
@@ -21,6 +32,9 @@ from src.routes.session import session_bp
 from src.routes.badge import badge_bp
 from src.routes.notification import notification_bp
 from src.routes.skill_suggestion import skill_suggestion_bp
+from src.routes.scheduler import scheduler_bp
+from src.routes.dashboard import dashboard_bp
+from src.routes.health import health_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -34,9 +48,31 @@ app.config['MONGODB_URI'] = os.getenv('MONGODB_URI')
 CORS(app, origins="*", supports_credentials=True)
 jwt = JWTManager(app)
 
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    # In-memory lookup; revocations from other processes arrive on a short refresh
+    return is_token_revoked(jwt_payload['jti'])
+
+@app.errorhandler(RevocationUnavailable)
+def revocation_unavailable(error):
+    # Fail closed: a token can't be accepted before revocations have been loaded once
+    return {"error": "Service temporarily unavailable"}, 503, {'Retry-After': str(error.retry_after)}
+
+# Request ids for log lines, request latency histograms for /metrics, and per-request span trees
+install_request_ids(app)
+instrument_app(app)
+install_tracing(app)
+
 # Initialize database
 init_db()
 
+# Start background email delivery, image uploads and scheduled jobs
+start_mail_workers()
+start_image_workers()
+start_scheduler()
+# Keep Google's signing certificates out of the first OAuth login's latency
+warm_google_certs()
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(user_bp, url_prefix='/api')
@@ -45,6 +81,10 @@ app.register_blueprint(session_bp, url_prefix='/api')
 app.register_blueprint(badge_bp, url_prefix='/api')
 app.register_blueprint(notification_bp, url_prefix='/api')
 app.register_blueprint(skill_suggestion_bp, url_prefix='/api')
+app.register_blueprint(scheduler_bp, url_prefix='/api')
+app.register_blueprint(dashboard_bp, url_prefix='/api')
+# Probes live at the root, outside the /api prefix
+app.register_blueprint(health_bp)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
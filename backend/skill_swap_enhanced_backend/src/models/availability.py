@@ -0,0 +1,136 @@
+import re
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# users.availability_schedule, alongside the free-text `availability` shown on profiles:
+#   timezone    IANA name the slots are written in, e.g. 'Europe/Berlin'
+#   weekly      [{day: 0-6 (Monday is 0), start: 'HH:MM', end: 'HH:MM'}]
+#   exceptions  [{date: 'YYYY-MM-DD', slots: [{start, end}]}]; an exception replaces
+#               that day's weekly slots, so an empty slot list is a day off
+# Users without a schedule are treated as available at any time.
+MAX_WEEKLY_SLOTS = 70
+MAX_EXCEPTIONS = 366
+MAX_SLOTS_PER_EXCEPTION = 10
+
+_TIME = re.compile(r'^([01]\d|2[0-3]):([0-5]\d)$')
+
+def _parse_time(value):
+    if value == '24:00':
+        return 24 * 60
+    match = _TIME.match(value) if isinstance(value, str) else None
+    if not match:
+        raise ValueError(f'Invalid time {value!r}, expected HH:MM')
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+def _format_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+def _normalize_slots(slots):
+    """Sorted, merged (start, end) minute pairs from a list of {start, end}"""
+    if not isinstance(slots, list):
+        raise ValueError('slots must be a list')
+    pairs = []
+    for slot in slots:
+        if not isinstance(slot, dict):
+            raise ValueError('Each slot needs a start and an end')
+        start, end = _parse_time(slot.get('start')), _parse_time(slot.get('end'))
+        if end <= start:
+            raise ValueError('A slot must end after it starts')
+        pairs.append((start, end))
+    merged = []
+    for start, end in sorted(pairs):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def normalize_schedule(schedule):
+    """Validated availability schedule in its stored form, or None to clear it; raises ValueError"""
+    if schedule is None:
+        return None
+    if not isinstance(schedule, dict):
+        raise ValueError('availability_schedule must be an object')
+
+    tz_name = schedule.get('timezone') or 'UTC'
+    try:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ValueError(f'Unknown timezone {tz_name!r}')
+
+    weekly = schedule.get('weekly') or []
+    if not isinstance(weekly, list) or len(weekly) > MAX_WEEKLY_SLOTS:
+        raise ValueError(f'weekly must be a list of at most {MAX_WEEKLY_SLOTS} slots')
+    by_day = {}
+    for slot in weekly:
+        day = slot.get('day') if isinstance(slot, dict) else None
+        if not isinstance(day, int) or not 0 <= day <= 6:
+            raise ValueError('Each weekly slot needs a day from 0 (Monday) to 6 (Sunday)')
+        by_day.setdefault(day, []).append(slot)
+
+    exceptions = schedule.get('exceptions') or []
+    if not isinstance(exceptions, list) or len(exceptions) > MAX_EXCEPTIONS:
+        raise ValueError(f'exceptions must be a list of at most {MAX_EXCEPTIONS} days')
+    normalized_exceptions = {}
+    for exception in exceptions:
+        if not isinstance(exception, dict):
+            raise ValueError('Each exception needs a date')
+        try:
+            day = date.fromisoformat(exception.get('date'))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid exception date {exception.get('date')!r}")
+        slots = exception.get('slots') or []
+        if not isinstance(slots, list) or len(slots) > MAX_SLOTS_PER_EXCEPTION:
+            raise ValueError(f'slots must be a list of at most {MAX_SLOTS_PER_EXCEPTION} slots per exception')
+        normalized_exceptions[day.isoformat()] = _normalize_slots(slots)
+
+    return {
+        'timezone': tz_name,
+        'weekly': [
+            {'day': day, 'start': _format_time(start), 'end': _format_time(end)}
+            for day in sorted(by_day) for start, end in _normalize_slots(by_day[day])
+        ],
+        'exceptions': [
+            {'date': day, 'slots': [{'start': _format_time(start), 'end': _format_time(end)} for start, end in slots]}
+            for day, slots in sorted(normalized_exceptions.items())
+        ]
+    }
+
+def _to_utc(day, minutes, zone):
+    # Wall-clock time on that local day ('24:00' is midnight of the next), so DST shifts apply
+    local = (datetime.combine(day, time(0)) + timedelta(minutes=minutes)).replace(tzinfo=zone)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+def available_intervals(schedule, start, end):
+    """Sorted, merged naive-UTC (start, end) intervals within [start, end) covered by the schedule"""
+    if not schedule:
+        return [(start, end)]
+    zone = ZoneInfo(schedule.get('timezone') or 'UTC')
+    weekly = {}
+    for slot in schedule.get('weekly', []):
+        weekly.setdefault(slot['day'], []).append((_parse_time(slot['start']), _parse_time(slot['end'])))
+    exceptions = {
+        exception['date']: [(_parse_time(slot['start']), _parse_time(slot['end'])) for slot in exception['slots']]
+        for exception in schedule.get('exceptions', [])
+    }
+
+    # Local days can straddle UTC days by up to 14 hours either way
+    day = (start - timedelta(days=1)).date()
+    last_day = (end + timedelta(days=1)).date()
+    intervals = []
+    while day <= last_day:
+        slots = exceptions.get(day.isoformat(), weekly.get(day.weekday(), []))
+        for slot_start, slot_end in slots:
+            interval_start = max(_to_utc(day, slot_start, zone), start)
+            interval_end = min(_to_utc(day, slot_end, zone), end)
+            if interval_end > interval_start:
+                intervals.append((interval_start, interval_end))
+        day += timedelta(days=1)
+
+    merged = []
+    for interval_start, interval_end in sorted(intervals):
+        if merged and interval_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], interval_end))
+        else:
+            merged.append((interval_start, interval_end))
+    return merged
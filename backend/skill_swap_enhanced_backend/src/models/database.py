@@ -0,0 +1,341 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+import pymongo
+from pymongo import MongoClient, monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from src.services import metrics
+from src.services.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+MONGO_DATABASE = os.getenv('MONGO_DATABASE', 'skillswap')
+
+# Connection pool, per server. Each WSGI worker process has its own pool, so
+# keep MONGO_MAX_POOL_SIZE x workers under the cluster's connection limit.
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 5))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_MAX_CONNECTING = int(os.getenv('MONGO_MAX_CONNECTING', 4))
+# A request waits at most this long for a free connection instead of queueing forever
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 30000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+
+# Default writes wait for a majority; counters that can be rebuilt settle for the primary
+MONGO_WRITE_CONCERN = os.getenv('MONGO_WRITE_CONCERN', 'majority')
+MONGO_WRITE_TIMEOUT_MS = int(os.getenv('MONGO_WRITE_TIMEOUT_MS', 5000))
+# Analytics reads may be served by a secondary at most this far behind (90s is the server minimum)
+MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_ANALYTICS_MAX_STALENESS_SECONDS', 120))
+
+# Commands slower than this are counted and kept for /api/database/stats
+MONGO_SLOW_COMMAND_MS = float(os.getenv('MONGO_SLOW_COMMAND_MS', 100))
+# Readiness looks at checkouts within this window
+MONGO_HEALTH_WINDOW_SECONDS = float(os.getenv('MONGO_HEALTH_WINDOW_SECONDS', 30))
+# Share of the pool checked out at which a server is reported as saturated
+MONGO_POOL_SATURATION_RATIO = float(os.getenv('MONGO_POOL_SATURATION_RATIO', 0.9))
+# Checkout waits above this within the window fail readiness
+MONGO_CHECKOUT_WAIT_LIMIT_MS = float(os.getenv('MONGO_CHECKOUT_WAIT_LIMIT_MS', 500))
+MONGO_PING_TIMEOUT_SECONDS = float(os.getenv('MONGO_PING_TIMEOUT_SECONDS', 2))
+
+# Operation classes. Handles for each are created once and returned by get_db(workload).
+#   default    primary reads, majority writes: users, sessions, requests, accounting
+#   analytics  leaderboard and stats reads, which tolerate some lag and may use a secondary
+#   ephemeral  rate-limit counters and similar short-lived data, acknowledged by the primary only
+DEFAULT_WORKLOAD = 'default'
+ANALYTICS_WORKLOAD = 'analytics'
+EPHEMERAL_WORKLOAD = 'ephemeral'
+
+def _write_concern(w):
+    if w.isdigit():
+        w = int(w)
+    return WriteConcern(w=w, wtimeout=MONGO_WRITE_TIMEOUT_MS)
+
+WORKLOADS = {
+    DEFAULT_WORKLOAD: {
+        'read_preference': ReadPreference.PRIMARY,
+        'write_concern': _write_concern(MONGO_WRITE_CONCERN)
+    },
+    ANALYTICS_WORKLOAD: {
+        'read_preference': SecondaryPreferred(max_staleness=MONGO_ANALYTICS_MAX_STALENESS_SECONDS),
+        'read_concern': ReadConcern('local'),
+        'write_concern': _write_concern(MONGO_WRITE_CONCERN)
+    },
+    EPHEMERAL_WORKLOAD: {
+        'read_preference': ReadPreference.PRIMARY,
+        'write_concern': WriteConcern(w=1)
+    },
+}
+
+command_seconds = metrics.histogram(
+    'mongodb_command_duration_seconds',
+    'MongoDB command latency by command and collection',
+    ('command', 'collection', 'outcome')
+)
+checkout_wait_seconds = metrics.histogram(
+    'mongodb_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5)
+)
+checkout_failures_total = metrics.counter(
+    'mongodb_pool_checkout_failures_total',
+    'Connection checkouts that failed, by reason',
+    ('reason',)
+)
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks checked-out connections and checkout waits per server"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_out = {}
+        self._pool_sizes = {}
+        # (monotonic time, wait ms, failure reason or None) for recent checkouts
+        self._recent = deque(maxlen=10000)
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_ms = 0.0
+        self.max_checkout_wait_ms = 0.0
+        self.pool_clears = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool_sizes[event.address] = event.options.get('maxPoolSize', MONGO_MAX_POOL_SIZE)
+            self._checked_out.setdefault(event.address, 0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pool_sizes.pop(event.address, None)
+            self._checked_out.pop(event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        wait_ms = event.duration * 1000
+        checkout_failures_total.inc(reason=event.reason)
+        with self._lock:
+            self.checkout_failures += 1
+            self._recent.append((time.monotonic(), wait_ms, event.reason))
+
+    def connection_checked_out(self, event):
+        wait_ms = event.duration * 1000
+        checkout_wait_seconds.observe(event.duration)
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_wait_ms += wait_ms
+            self.max_checkout_wait_ms = max(self.max_checkout_wait_ms, wait_ms)
+            self._checked_out[event.address] = self._checked_out.get(event.address, 0) + 1
+            self._recent.append((time.monotonic(), wait_ms, None))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._checked_out[event.address] = max(0, self._checked_out.get(event.address, 0) - 1)
+
+    def checked_out_by_server(self):
+        with self._lock:
+            return [
+                ({'server': f'{host}:{port}'}, self._checked_out.get((host, port), 0))
+                for host, port in self._pool_sizes
+            ]
+
+    def stats(self, window=MONGO_HEALTH_WINDOW_SECONDS):
+        since = time.monotonic() - window
+        with self._lock:
+            recent = [checkout for checkout in self._recent if checkout[0] >= since]
+            servers = {
+                f'{host}:{port}': {
+                    'checked_out': self._checked_out.get((host, port), 0),
+                    'max_pool_size': size,
+                    'saturation': round(self._checked_out.get((host, port), 0) / size, 3) if size else None
+                }
+                for (host, port), size in self._pool_sizes.items()
+            }
+            waits = sorted(wait_ms for _, wait_ms, reason in recent if reason is None)
+            return {
+                'servers': servers,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_checkout_wait_ms': round(self.checkout_wait_ms / self.checkouts, 2) if self.checkouts else None,
+                'max_checkout_wait_ms': round(self.max_checkout_wait_ms, 2),
+                'pool_clears': self.pool_clears,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'window_seconds': window,
+                'window_checkouts': len(waits),
+                'window_failures': sum(1 for _, _, reason in recent if reason is not None),
+                'window_p95_wait_ms': round(waits[int(len(waits) * 0.95)], 2) if waits else None,
+                'window_max_wait_ms': round(waits[-1], 2) if waits else None
+            }
+
+class CommandMonitor(monitoring.CommandListener):
+    """Per-command timings, with the slowest recent commands kept for inspection"""
+
+    def __init__(self, slow_ms=MONGO_SLOW_COMMAND_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        # request id -> collection, since only the started event carries the command body
+        self._pending = {}
+        self._commands = {}
+        self.slow_commands = deque(maxlen=100)
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else None
+
+    def _finished(self, event, failed):
+        duration_ms = event.duration_micros / 1000
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), None)
+        command_seconds.observe(
+            duration_ms / 1000,
+            command=event.command_name,
+            collection=collection or '',
+            outcome='error' if failed else 'ok'
+        )
+        # Listener events arrive on the thread that ran the command, inside its request's span
+        record_span(f'mongodb.{event.command_name}', duration_ms / 1000,
+                    error='failed' if failed else None, collection=collection)
+        with self._lock:
+            metric = self._commands.setdefault(
+                event.command_name, {'count': 0, 'failures': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0}
+            )
+            metric['count'] += 1
+            metric['total_ms'] += duration_ms
+            metric['max_ms'] = max(metric['max_ms'], duration_ms)
+            if failed:
+                metric['failures'] += 1
+            if duration_ms >= self.slow_ms:
+                metric['slow'] += 1
+                self.slow_commands.append({
+                    'command': event.command_name,
+                    'database': event.database_name,
+                    'collection': collection,
+                    'duration_ms': round(duration_ms, 2),
+                    'failed': failed,
+                    'at': time.time()
+                })
+        if duration_ms >= self.slow_ms:
+            logger.warning("Slow MongoDB command: %s on %s took %.1fms", event.command_name, collection, duration_ms,
+                           extra={'command': event.command_name, 'collection': collection,
+                                  'duration_ms': round(duration_ms, 1)})
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def stats(self):
+        with self._lock:
+            commands = {
+                name: {
+                    'count': metric['count'],
+                    'failures': metric['failures'],
+                    'slow': metric['slow'],
+                    'avg_ms': round(metric['total_ms'] / metric['count'], 2) if metric['count'] else None,
+                    'max_ms': round(metric['max_ms'], 2)
+                }
+                for name, metric in self._commands.items()
+            }
+            return {
+                'slow_threshold_ms': self.slow_ms,
+                'commands': commands,
+                'slow_commands': list(self.slow_commands)
+            }
+
+pool_monitor = PoolMonitor()
+command_monitor = CommandMonitor()
+
+metrics.gauge(
+    'mongodb_pool_checked_out_connections',
+    'Connections currently checked out, per server',
+    pool_monitor.checked_out_by_server,
+    ('server',)
+)
+metrics.gauge('mongodb_pool_max_size', 'Configured connection pool size per server', lambda: MONGO_MAX_POOL_SIZE)
+
+def create_client(uri):
+    """A MongoClient with explicit pool limits and timeouts, reporting to the monitors above"""
+    return MongoClient(
+        uri,
+        appname=os.getenv('MONGO_APP_NAME', 'skillswap-backend'),
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        maxConnecting=MONGO_MAX_CONNECTING,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        retryWrites=True,
+        retryReads=True,
+        event_listeners=[pool_monitor, command_monitor]
+    )
+
+def workload_databases(client, name=MONGO_DATABASE):
+    """One Database handle per operation class, sharing the client's pool"""
+    return {workload: client.get_database(name, **options) for workload, options in WORKLOADS.items()}
+
+def ping(client, timeout=MONGO_PING_TIMEOUT_SECONDS):
+    """(ok, error message) for a round trip to the primary"""
+    try:
+        with pymongo.timeout(timeout):
+            client.admin.command('ping')
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+def pool_health(client):
+    """(healthy, report) for readiness checks"""
+    checks = {}
+    if client is None:
+        return False, {'checks': {'configured': 'MongoDB URI not configured'}}
+
+    ok, error = ping(client)
+    checks['ping'] = 'ok' if ok else error
+
+    # A busy pool is fine while checkouts keep up; waits and timeouts mean requests are stalling
+    pool = pool_monitor.stats()
+    if pool['window_failures']:
+        checks['checkout'] = f"{pool['window_failures']} checkout failures in the last {pool['window_seconds']:g}s"
+    elif pool['window_max_wait_ms'] is not None and pool['window_max_wait_ms'] > MONGO_CHECKOUT_WAIT_LIMIT_MS:
+        checks['checkout'] = f"checkout waited {pool['window_max_wait_ms']}ms"
+    else:
+        checks['checkout'] = 'ok'
+
+    healthy = all(result == 'ok' for result in checks.values())
+    saturated = [
+        address for address, server in pool['servers'].items()
+        if server['saturation'] is not None and server['saturation'] >= MONGO_POOL_SATURATION_RATIO
+    ]
+    return healthy, {'checks': checks, 'saturated_servers': saturated, 'pool': pool}
+
+def database_stats():
+    return {'pool': pool_monitor.stats(), 'commands': command_monitor.stats()}
@@ -0,0 +1,63 @@
+import os
+import threading
+from cachetools import TTLCache
+from flask_jwt_extended import create_access_token
+
+# Access tokens carry the profile version they were issued against, so a
+# process can tell whether its cached profile is at least as new as the token.
+PROFILE_VERSION_CLAIM = 'pv'
+
+# Snapshots are dropped on local writes; writes made by other processes are
+# picked up when a newer token arrives or after the TTL.
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv('PROFILE_CACHE_TTL_SECONDS', 60))
+
+# Fields answered by /auth/verify
+PROFILE_FIELDS = [
+    'name', 'email', 'photo_url', 'bio', 'skills_teach', 'skills_learn', 'availability',
+    'is_public', 'badge_level', 'total_sessions_taught', 'rating', 'version'
+]
+
+_profiles = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+
+def issue_access_token(user_id, profile_version):
+    return create_access_token(
+        identity=str(user_id),
+        additional_claims={PROFILE_VERSION_CLAIM: profile_version or 0}
+    )
+
+def profile_snapshot(user):
+    return {
+        'id': str(user._id),
+        'name': user.name,
+        'email': user.email,
+        'photo_url': user.photo_url,
+        'bio': user.bio,
+        'skills_teach': user.skills_teach,
+        'skills_learn': user.skills_learn,
+        'availability': user.availability,
+        'is_public': user.is_public,
+        'badge_level': user.badge_level,
+        'total_sessions_taught': user.total_sessions_taught,
+        'rating': user.rating
+    }
+
+def get_cached_profile(user_id, min_version=None):
+    """(version, snapshot) cached for the user if it is at least min_version, else None"""
+    with _lock:
+        cached = _profiles.get(str(user_id))
+    if cached is None or (min_version is not None and cached[0] < min_version):
+        return None
+    return cached
+
+def cache_profile(user_id, version, snapshot):
+    with _lock:
+        current = _profiles.get(str(user_id))
+        # A slower reader must not replace a newer snapshot
+        if current is None or current[0] <= (version or 0):
+            _profiles[str(user_id)] = (version or 0, snapshot)
+
+def invalidate_profile(user_id):
+    with _lock:
+        _profiles.pop(str(user_id), None)
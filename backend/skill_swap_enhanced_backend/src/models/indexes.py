@@ -0,0 +1,287 @@
+import sys
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Declarative index registry: collection name -> indexes the blueprints rely on.
+# Every index is named so ensure_indexes() and check_indexes() can compare by name.
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='users_email', unique=True),
+        IndexModel([('google_id', ASCENDING)], name='users_google_id'),
+        IndexModel([('is_public', ASCENDING), ('_id', ASCENDING)], name='users_public_id'),
+        IndexModel([('is_public', ASCENDING), ('total_sessions_taught', DESCENDING)], name='users_public_taught'),
+        IndexModel([('skills_normalized', ASCENDING), ('_id', ASCENDING)], name='users_skills_normalized'),
+        IndexModel([('skills_learn', ASCENDING)], name='users_skills_learn'),
+        IndexModel([('updated_at', ASCENDING)], name='users_updated_at'),
+        IndexModel(
+            [('name', TEXT), ('bio', TEXT), ('skills_teach', TEXT), ('skills_learn', TEXT)],
+            name='users_directory_text',
+            weights={'name': 10, 'skills_teach': 5, 'skills_learn': 5, 'bio': 1}
+        ),
+    ],
+    'swap_requests': [
+        IndexModel([('requester_id', ASCENDING), ('created_at', DESCENDING)], name='swap_requests_requester_created'),
+        IndexModel([('target_user_id', ASCENDING), ('created_at', DESCENDING)], name='swap_requests_target_created'),
+        IndexModel(
+            [('requester_id', ASCENDING), ('target_user_id', ASCENDING), ('status', ASCENDING)],
+            name='swap_requests_pair_status'
+        ),
+    ],
+    'sessions': [
+        # _id breaks ties on the start time for keyset paging; the indexes that
+        # preceded these (sessions_*_date) are prefixes and are retired below
+        IndexModel([('teacher_id', ASCENDING), ('scheduled_date', DESCENDING), ('_id', DESCENDING)],
+                   name='sessions_teacher_date_id'),
+        IndexModel([('student_id', ASCENDING), ('scheduled_date', DESCENDING), ('_id', DESCENDING)],
+                   name='sessions_student_date_id'),
+        IndexModel([('status', ASCENDING), ('scheduled_date', ASCENDING)], name='sessions_status_date'),
+        IndexModel([('status', ASCENDING), ('updated_at', ASCENDING)], name='sessions_status_updated'),
+        IndexModel([('completion_id', ASCENDING)], name='sessions_completion_id', sparse=True),
+        IndexModel(
+            [('completed_at', ASCENDING)],
+            name='sessions_accounting_pending',
+            partialFilterExpression={'accounting': 'pending'}
+        ),
+        IndexModel([('updated_at', ASCENDING)], name='sessions_updated'),
+    ],
+    # Calendar reads go by _id ('<user_id>:<day>'); this one finds the buckets
+    # holding a session when it is moved or deleted
+    'session_buckets': [
+        IndexModel([('sessions.session_id', ASCENDING)], name='session_buckets_session_id'),
+    ],
+    'notifications': [
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)], name='notifications_user_created'),
+        IndexModel([('user_id', ASCENDING), ('read', ASCENDING)], name='notifications_user_read'),
+        IndexModel([('data.session_id', ASCENDING), ('type', ASCENDING)], name='notifications_session_type'),
+        # At most one reminder per session, participant and reminder window;
+        # reminders not tied to a session are left unconstrained
+        IndexModel(
+            [('data.session_id', ASCENDING), ('user_id', ASCENDING), ('data.reminder_window', ASCENDING)],
+            name='notifications_session_reminder_window_unique',
+            unique=True,
+            partialFilterExpression={'type': 'session_reminder', 'data.session_id': {'$exists': True}}
+        ),
+    ],
+    'email_outbox': [
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)], name='email_outbox_status_due'),
+        IndexModel([('status', ASCENDING), ('claimed_at', ASCENDING)], name='email_outbox_status_claimed'),
+    ],
+    'image_uploads': [
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)], name='image_uploads_status_due'),
+        IndexModel([('status', ASCENDING), ('claimed_at', ASCENDING)], name='image_uploads_status_claimed'),
+    ],
+    'teacher_monthly_stats': [
+        IndexModel([('month', ASCENDING), ('sessions', DESCENDING)], name='teacher_monthly_stats_month_sessions'),
+    ],
+    'revoked_tokens': [
+        # Revocations only matter until the token would have expired anyway
+        IndexModel([('expires_at', ASCENDING)], name='revoked_tokens_ttl', expireAfterSeconds=0),
+        IndexModel([('revoked_at', ASCENDING)], name='revoked_tokens_revoked_at'),
+    ],
+    'rate_limits': [
+        IndexModel([('expires_at', ASCENDING)], name='rate_limits_ttl', expireAfterSeconds=0),
+    ],
+    'scheduler_runs': [
+        IndexModel([('job', ASCENDING), ('started_at', DESCENDING)], name='scheduler_runs_job_started'),
+        # Keep 30 days of run history
+        IndexModel([('started_at', ASCENDING)], name='scheduler_runs_ttl', expireAfterSeconds=30 * 24 * 3600),
+    ],
+}
+
+# Representative query shape for each hot route, used by check mode to explain plans.
+# Placeholder values only need the right type.
+_SAMPLE_ID = ObjectId('000000000000000000000000')
+_SAMPLE_DATE = datetime(2000, 1, 1)
+
+QUERY_SHAPES = [
+    {'route': 'auth.login', 'collection': 'users', 'filter': {'email': 'user@example.com'}},
+    {'route': 'auth.google_callback', 'collection': 'users', 'filter': {'google_id': 'google-sub'}},
+    {'route': 'user.get_users', 'collection': 'users',
+     'filter': {'is_public': True, '_id': {'$gt': _SAMPLE_ID}}, 'sort': {'_id': 1}},
+    {'route': 'user.get_users[skill]', 'collection': 'users',
+     'filter': {'is_public': True, 'skills_normalized': 'python'}, 'sort': {'_id': 1}},
+    {'route': 'badge.get_leaderboard', 'collection': 'users',
+     'filter': {'is_public': True, 'total_sessions_taught': {'$gt': 0}}, 'sort': {'total_sessions_taught': -1}},
+    {'route': 'leaderboard.refresh', 'collection': 'users', 'filter': {'updated_at': {'$gt': _SAMPLE_DATE}}},
+    {'route': 'skill_suggestion.get_skill_suggestions', 'collection': 'users',
+     'filter': {'skills_learn': {'$in': ['Python']}, '_id': {'$ne': _SAMPLE_ID}, 'is_public': True}},
+    {'route': 'swap_request.create_swap_request', 'collection': 'swap_requests',
+     'filter': {'requester_id': _SAMPLE_ID, 'target_user_id': _SAMPLE_ID, 'status': 'pending'}},
+    {'route': 'swap_request.get_sent_requests', 'collection': 'swap_requests',
+     'filter': {'requester_id': _SAMPLE_ID}, 'sort': {'created_at': -1}},
+    {'route': 'swap_request.get_received_requests', 'collection': 'swap_requests',
+     'filter': {'target_user_id': _SAMPLE_ID}, 'sort': {'created_at': -1}},
+    {'route': 'session.get_user_sessions', 'collection': 'sessions',
+     'filter': {'$or': [{'teacher_id': _SAMPLE_ID}, {'student_id': _SAMPLE_ID}]},
+     'sort': {'scheduled_date': -1, '_id': -1}},
+    {'route': 'session.get_user_sessions[after]', 'collection': 'sessions',
+     'filter': {'$or': [
+         {'teacher_id': _SAMPLE_ID, 'scheduled_date': {'$lte': _SAMPLE_DATE},
+          '$or': [{'scheduled_date': {'$lt': _SAMPLE_DATE}}, {'scheduled_date': _SAMPLE_DATE, '_id': {'$lt': _SAMPLE_ID}}]},
+         {'student_id': _SAMPLE_ID, 'scheduled_date': {'$lte': _SAMPLE_DATE},
+          '$or': [{'scheduled_date': {'$lt': _SAMPLE_DATE}}, {'scheduled_date': _SAMPLE_DATE, '_id': {'$lt': _SAMPLE_ID}}]}
+     ]},
+     'sort': {'scheduled_date': -1, '_id': -1}},
+    {'route': 'session.get_upcoming_sessions', 'collection': 'sessions',
+     'filter': {'$or': [
+         {'teacher_id': _SAMPLE_ID, 'scheduled_date': {'$gte': _SAMPLE_DATE}, 'status': 'scheduled'},
+         {'student_id': _SAMPLE_ID, 'scheduled_date': {'$gte': _SAMPLE_DATE}, 'status': 'scheduled'}
+     ]},
+     'sort': {'scheduled_date': 1}},
+    {'route': 'participant_snapshots.refresh_user_snapshots', 'collection': 'sessions',
+     'filter': {'teacher_id': _SAMPLE_ID, '$or': [{'teacher.version': {'$lt': 1}}, {'teacher': {'$exists': False}}]}},
+    {'route': 'participant_snapshots.refresh_user_snapshots', 'collection': 'swap_requests',
+     'filter': {'target_user_id': _SAMPLE_ID,
+                '$or': [{'target_user.version': {'$lt': 1}}, {'target_user': {'$exists': False}}]}},
+    {'route': 'session.get_calendar', 'collection': 'session_buckets',
+     'filter': {'_id': {'$in': ['user-id:2000-01-01', 'user-id:2000-01-02']}}},
+    {'route': 'session_buckets.index_sessions', 'collection': 'session_buckets',
+     'filter': {'sessions.session_id': {'$in': [_SAMPLE_ID]}}},
+    {'route': 'scheduler.session_buckets_reconcile', 'collection': 'sessions',
+     'filter': {'updated_at': {'$gt': _SAMPLE_DATE}}},
+    {'route': 'notification.send_session_reminders', 'collection': 'sessions',
+     'filter': {'scheduled_date': {'$gte': _SAMPLE_DATE}, 'status': 'scheduled'}},
+    {'route': 'badge.get_badge_stats', 'collection': 'teacher_monthly_stats',
+     'filter': {'month': '2000-01'}, 'sort': {'sessions': -1}},
+    {'route': 'notification.get_user_notifications', 'collection': 'notifications',
+     'filter': {'user_id': _SAMPLE_ID}, 'sort': {'created_at': -1}},
+    {'route': 'notification.mark_all_notifications_read', 'collection': 'notifications',
+     'filter': {'user_id': _SAMPLE_ID, 'read': False}},
+    {'route': 'notification.send_session_reminders[dedupe]', 'collection': 'notifications',
+     'filter': {'data.session_id': 'session-id', 'type': 'session_reminder'}},
+    {'route': 'scheduler.session_reminders[changed]', 'collection': 'sessions',
+     'filter': {'status': 'scheduled', 'updated_at': {'$gt': _SAMPLE_DATE}}},
+    {'route': 'session_accounting.claim_sessions', 'collection': 'sessions', 'filter': {'completion_id': 'id'}},
+    {'route': 'session_accounting.recover_pending_accounting', 'collection': 'sessions',
+     'filter': {'accounting': 'pending', 'completed_at': {'$lt': _SAMPLE_DATE}}},
+    {'route': 'token_revocation.refresh', 'collection': 'revoked_tokens',
+     'filter': {'revoked_at': {'$gt': _SAMPLE_DATE}}},
+    {'route': 'image_pipeline.claim_job', 'collection': 'image_uploads',
+     'filter': {'status': 'pending', 'next_attempt_at': {'$lte': _SAMPLE_DATE}}, 'sort': {'next_attempt_at': 1}},
+    {'route': 'mail_queue.claim_batch', 'collection': 'email_outbox',
+     'filter': {'status': 'pending', 'next_attempt_at': {'$lte': _SAMPLE_DATE}}, 'sort': {'next_attempt_at': 1}},
+]
+
+# Indexes replaced by a differently named definition; dropped by ensure_indexes()
+RETIRED_INDEXES = {
+    'sessions': ['sessions_teacher_date', 'sessions_student_date'],
+    'notifications': ['notifications_session_reminder_unique'],
+}
+
+def ensure_indexes(database):
+    """Create every registered index and drop retired ones. Safe to run on every startup."""
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            # One index at a time so a single conflict doesn't block the rest
+            try:
+                created.extend(database[collection_name].create_indexes([index]))
+            except OperationFailure as e:
+                logger.warning("Index %s on %s not created: %s", index.document['name'], collection_name, e)
+    for collection_name, names in RETIRED_INDEXES.items():
+        existing = database[collection_name].index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                database[collection_name].drop_index(name)
+                logger.info("Dropped retired index %s on %s", name, collection_name)
+            except OperationFailure as e:
+                logger.warning("Retired index %s on %s not dropped: %s", name, collection_name, e)
+    return created
+
+def _plan_stages(plan):
+    """Flatten a winning plan into the list of stage names it uses"""
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages.extend(_plan_stages(plan['inputStage']))
+    for child in plan.get('inputStages', []):
+        stages.extend(_plan_stages(child))
+    # Slot-based engine wraps the classic plan under queryPlan
+    if 'queryPlan' in plan:
+        stages.extend(_plan_stages(plan['queryPlan']))
+    return [stage for stage in stages if stage]
+
+def explain_query_shape(database, shape):
+    command = {'find': shape['collection'], 'filter': shape['filter']}
+    if shape.get('sort'):
+        command['sort'] = shape['sort']
+    explanation = database.command('explain', command, verbosity='queryPlanner')
+    stages = _plan_stages(explanation['queryPlanner']['winningPlan'])
+    return {
+        'route': shape['route'],
+        'collection': shape['collection'],
+        'stages': stages,
+        'index_bounded': 'COLLSCAN' not in stages,
+        'in_memory_sort': 'SORT' in stages
+    }
+
+def check_indexes(database):
+    """Report missing and unused indexes, and the plan each route's query shape gets.
+
+    Usage counts come from $indexStats and reset when mongod restarts, so an
+    index reported as unused may simply not have been hit since then.
+    """
+    report = {'missing': [], 'unused': [], 'plans': []}
+
+    for collection_name, indexes in INDEXES.items():
+        existing = database[collection_name].index_information()
+        for index in indexes:
+            name = index.document['name']
+            if name not in existing:
+                report['missing'].append({'collection': collection_name, 'index': name})
+
+        try:
+            stats = database[collection_name].aggregate([{'$indexStats': {}}])
+            for stat in stats:
+                if stat['name'] != '_id_' and stat['accesses']['ops'] == 0:
+                    report['unused'].append({
+                        'collection': collection_name,
+                        'index': stat['name'],
+                        'since': stat['accesses']['since']
+                    })
+        except OperationFailure as e:
+            logger.warning("$indexStats unavailable for %s: %s", collection_name, e)
+
+    for shape in QUERY_SHAPES:
+        try:
+            report['plans'].append(explain_query_shape(database, shape))
+        except OperationFailure as e:
+            report['plans'].append({'route': shape['route'], 'collection': shape['collection'], 'error': str(e)})
+
+    return report
+
+def print_index_report(report):
+    for item in report['missing']:
+        print(f"MISSING  {item['collection']}.{item['index']}")
+    for item in report['unused']:
+        print(f"UNUSED   {item['collection']}.{item['index']} (since {item['since']})")
+    for plan in report['plans']:
+        if 'error' in plan:
+            print(f"ERROR    {plan['route']}: {plan['error']}")
+            continue
+        status = 'OK' if plan['index_bounded'] and not plan['in_memory_sort'] else 'WARN'
+        print(f"{status:<8} {plan['route']}: {' <- '.join(plan['stages'])}")
+
+if __name__ == '__main__':
+    # Run from the backend directory: python -m src.models.indexes [--check]
+    from dotenv import load_dotenv
+    from src.models.user import init_db, get_db
+
+    load_dotenv()
+    init_db()
+    database = get_db()
+    if database is None:
+        sys.exit(1)
+
+    if '--check' in sys.argv:
+        index_report = check_indexes(database)
+        print_index_report(index_report)
+        sys.exit(1 if index_report['missing'] or any(
+            'error' in plan or not plan['index_bounded'] for plan in index_report['plans']
+        ) else 0)
@@ -0,0 +1,170 @@
+import os
+import time
+import hashlib
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+from src.models.user import get_db
+from src.models.database import ANALYTICS_WORKLOAD, DEFAULT_WORKLOAD
+
+# How often a process looks for users changed by other processes
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv('LEADERBOARD_REFRESH_SECONDS', 5))
+# Full rebuild interval, which also drops users deleted outright
+LEADERBOARD_RELOAD_SECONDS = float(os.getenv('LEADERBOARD_RELOAD_SECONDS', 3600))
+# Changes are re-read slightly behind the last sync to absorb clock skew between writers
+SYNC_OVERLAP = timedelta(seconds=5)
+
+LEADERBOARD_FIELDS = {
+    'name': 1, 'photo_url': 1, 'total_sessions_taught': 1, 'badge_level': 1,
+    'rating': 1, 'skills_teach': 1, 'is_public': 1, 'updated_at': 1
+}
+
+class Leaderboard:
+    """Public teachers ranked by sessions taught, kept sorted in memory.
+
+    `_keys` holds (-total_sessions_taught, user_id) in ascending order, so rank
+    lookups are a bisect and updates a remove plus insort.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Only one thread talks to MongoDB at a time; the others keep serving the current ranking
+        self._refresh_lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._loaded_at = None
+        self._checked_at = 0.0
+        self._synced_at = None
+        self.version = 0
+
+    @staticmethod
+    def _is_ranked(user_data):
+        return user_data.get('is_public', True) and user_data.get('total_sessions_taught', 0) > 0
+
+    @staticmethod
+    def _entry(user_data):
+        return {
+            '_id': str(user_data['_id']),
+            'name': user_data['name'],
+            'photo_url': user_data.get('photo_url', ''),
+            'total_sessions_taught': user_data['total_sessions_taught'],
+            'badge_level': user_data.get('badge_level', 'Bronze'),
+            'rating': user_data.get('rating', 0.0),
+            'skills_teach': user_data.get('skills_teach', [])[:3]  # Show only first 3 skills
+        }
+
+    def _apply(self, user_data):
+        """Insert, move or drop one user; caller holds the lock"""
+        user_id = str(user_data['_id'])
+        current = self._entries.pop(user_id, None)
+        if current is not None:
+            key = (-current['total_sessions_taught'], user_id)
+            index = bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+        if self._is_ranked(user_data):
+            entry = self._entry(user_data)
+            self._entries[user_id] = entry
+            insort(self._keys, (-entry['total_sessions_taught'], user_id))
+
+        if current is not None or user_id in self._entries:
+            self.version += 1
+
+    def load(self, db):
+        users = db.users.find(
+            {'is_public': True, 'total_sessions_taught': {'$gt': 0}},
+            LEADERBOARD_FIELDS
+        )
+        entries = {}
+        synced_at = None
+        for user_data in users:
+            entries[str(user_data['_id'])] = self._entry(user_data)
+            if user_data.get('updated_at') and (synced_at is None or user_data['updated_at'] > synced_at):
+                synced_at = user_data['updated_at']
+
+        keys = sorted((-entry['total_sessions_taught'], user_id) for user_id, entry in entries.items())
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._synced_at = synced_at
+            self._loaded_at = time.monotonic()
+            self._checked_at = self._loaded_at
+            self.version += 1
+
+    def refresh(self, db, changes_db=None):
+        """Reload when stale, otherwise apply users changed since the last sync.
+
+        Full reloads read `db`; the change scan reads `changes_db` (default
+        `db`), which must not lag, since a change that replicates after the
+        scan has passed its updated_at would never be picked up.
+        """
+        now = time.monotonic()
+        stale = self._loaded_at is None or now - self._loaded_at > LEADERBOARD_RELOAD_SECONDS
+        if not stale and now - self._checked_at < LEADERBOARD_REFRESH_SECONDS:
+            return
+        # Wait only when there is nothing to serve yet
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if self._loaded_at is None or now - self._loaded_at > LEADERBOARD_RELOAD_SECONDS:
+                self.load(db)
+            elif now - self._checked_at >= LEADERBOARD_REFRESH_SECONDS:
+                self._apply_changes(changes_db if changes_db is not None else db)
+        finally:
+            self._refresh_lock.release()
+
+    def _apply_changes(self, db):
+        self._checked_at = time.monotonic()
+        query = {}
+        if self._synced_at is not None:
+            query['updated_at'] = {'$gt': self._synced_at - SYNC_OVERLAP}
+        changed = list(db.users.find(query, LEADERBOARD_FIELDS))
+        with self._lock:
+            for user_data in changed:
+                self._apply(user_data)
+                if user_data.get('updated_at') and (self._synced_at is None or user_data['updated_at'] > self._synced_at):
+                    self._synced_at = user_data['updated_at']
+
+    def record(self, user_data):
+        """Apply a change made by this process without waiting for the next refresh"""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._apply(user_data)
+
+    def page(self, offset=0, limit=50):
+        with self._lock:
+            keys = self._keys[offset:offset + limit]
+            entries = [dict(self._entries[user_id], rank=offset + index + 1)
+                       for index, (_, user_id) in enumerate(keys)]
+            return entries, len(self._keys)
+
+    def rank_of(self, user_id):
+        """(rank, entry) for a user, or (None, None) when they aren't ranked"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, None
+            rank = bisect_left(self._keys, (-entry['total_sessions_taught'], user_id)) + 1
+            return rank, dict(entry, rank=rank)
+
+    @staticmethod
+    def etag(entries, total):
+        """Content hash, so every process serving the same page returns the same tag"""
+        digest = hashlib.sha1(str(total).encode('utf-8'))
+        for entry in entries:
+            digest.update(f"{entry['_id']}:{entry['total_sessions_taught']}:{entry['badge_level']}:"
+                          f"{entry['name']}:{entry['photo_url']}".encode('utf-8'))
+        return digest.hexdigest()
+
+leaderboard = Leaderboard()
+
+def current_leaderboard():
+    """The process-wide leaderboard, refreshed from MongoDB when due"""
+    # Full reloads tolerate replication lag, so they may be served by a secondary;
+    # incremental scans go to the primary so no change is skipped
+    db = get_db(ANALYTICS_WORKLOAD)
+    if db is not None:
+        leaderboard.refresh(db, get_db(DEFAULT_WORKLOAD))
+    return leaderboard
@@ -0,0 +1,57 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+# Short-lived named locks, one document per name in the locks collection:
+#   _id         the lock name, e.g. 'schedule:<user_id>' or 'session:<session_id>'
+#   owner       token of the holder, so only the holder releases it
+#   expires_at  a lock outlives a crashed holder by at most its TTL
+LOCK_TTL_SECONDS = int(os.getenv('LOCK_TTL_SECONDS', 10))
+LOCK_WAIT_SECONDS = float(os.getenv('LOCK_WAIT_SECONDS', 2))
+LOCK_RETRY_AFTER = 1
+LOCK_POLL_SECONDS = 0.05
+
+class LockBusy(Exception):
+    """A lock stayed held by another writer; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after=LOCK_RETRY_AFTER):
+        super().__init__('Lock is held by another writer')
+        self.retry_after = retry_after
+
+def _acquire(db, name, owner, ttl_seconds):
+    now = datetime.utcnow()
+    try:
+        # Matches only a missing or expired lock; a live one makes the upsert collide on _id
+        db.locks.find_one_and_update(
+            {'_id': name, 'expires_at': {'$lt': now}},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+@contextmanager
+def named_locks(db, names, ttl_seconds=LOCK_TTL_SECONDS, wait_seconds=LOCK_WAIT_SECONDS):
+    """Hold every lock in `names` for the block, or raise LockBusy.
+
+    Locks are taken in sorted order, so two writers sharing names can't
+    deadlock, and each call has its own owner token.
+    """
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_seconds
+    held = []
+    try:
+        for name in sorted(set(names)):
+            while not _acquire(db, name, owner, ttl_seconds):
+                if time.monotonic() >= deadline:
+                    raise LockBusy()
+                time.sleep(LOCK_POLL_SECONDS)
+            held.append(name)
+        yield
+    finally:
+        for name in held:
+            db.locks.delete_one({'_id': name, 'owner': owner})
@@ -0,0 +1,22 @@
+import hmac
+import os
+from functools import wraps
+from flask import request, jsonify
+
+# Shared secret for operational endpoints (pool stats, traces, job runs); the
+# scheduler trigger token is used when no separate operator token is set.
+# Unset disables those endpoints rather than opening them to every user.
+OPERATOR_TOKEN = os.getenv('OPERATOR_TOKEN') or os.getenv('SCHEDULER_TRIGGER_TOKEN')
+OPERATOR_TOKEN_HEADER = 'X-Operator-Token'
+
+def operator_required(view):
+    """Reject requests that don't present the operator token"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not OPERATOR_TOKEN:
+            return jsonify({'error': 'Operator endpoints are disabled'}), 403
+        presented = request.headers.get(OPERATOR_TOKEN_HEADER, '')
+        if not hmac.compare_digest(presented.encode('utf-8'), OPERATOR_TOKEN.encode('utf-8')):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
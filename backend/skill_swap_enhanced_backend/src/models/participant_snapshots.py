@@ -0,0 +1,122 @@
+import logging
+from bson import ObjectId
+from pymongo import UpdateMany
+
+logger = logging.getLogger(__name__)
+
+# List views show each participant's name, photo and a few skills. Rather than
+# joining users on every read, swap requests and sessions carry a small copy:
+#   {name, photo_url, skills_teach: first HEADLINE_SKILLS, version}
+# written when the document is created and refreshed by the
+# participant_snapshot_refresh job when a profile changes. `version` is the
+# user's profile version, so a late refresh never replaces a newer snapshot.
+HEADLINE_SKILLS = 3
+
+SNAPSHOT_SOURCE_FIELDS = {'name': 1, 'photo_url': 1, 'skills_teach': 1, 'version': 1}
+
+# (collection, id field, snapshot field)
+SNAPSHOT_TARGETS = (
+    ('swap_requests', 'requester_id', 'requester'),
+    ('swap_requests', 'target_user_id', 'target_user'),
+    ('sessions', 'teacher_id', 'teacher'),
+    ('sessions', 'student_id', 'student'),
+)
+
+BACKFILL_BATCH_SIZE = 500
+
+def build_snapshot(user):
+    return {
+        'name': user.get('name'),
+        'photo_url': user.get('photo_url') or '',
+        'skills_teach': list(user.get('skills_teach') or [])[:HEADLINE_SKILLS],
+        'version': user.get('version') or 0
+    }
+
+def snapshot_users(db, user_ids):
+    """{user ObjectId: snapshot} in one read"""
+    user_ids = list({ObjectId(user_id) for user_id in user_ids})
+    if not user_ids:
+        return {}
+    return {
+        user['_id']: build_snapshot(user)
+        for user in db.users.find({'_id': {'$in': user_ids}}, SNAPSHOT_SOURCE_FIELDS)
+    }
+
+def _stale(field, version):
+    return {'$or': [{f'{field}.version': {'$lt': version}}, {field: {'$exists': False}}]}
+
+def refresh_user_snapshots(db, users):
+    """Fan a batch of changed users out to every document that shows them.
+
+    One UpdateMany per user and target, sent as a single bulk write per
+    collection; each only touches documents holding an older snapshot.
+    """
+    updates = {}
+    for user in users:
+        snapshot = build_snapshot(user)
+        for collection, id_field, field in SNAPSHOT_TARGETS:
+            updates.setdefault(collection, []).append(UpdateMany(
+                dict(_stale(field, snapshot['version']), **{id_field: user['_id']}),
+                {'$set': {field: snapshot}}
+            ))
+    modified = 0
+    for collection, requests in updates.items():
+        modified += db[collection].bulk_write(requests, ordered=False).modified_count
+    return modified
+
+def refresh_changed_snapshots(db, since):
+    """Refresh snapshots of every user whose profile changed after `since`"""
+    users_seen = 0
+    modified = 0
+    batch = []
+    for user in db.users.find({'updated_at': {'$gt': since}}, SNAPSHOT_SOURCE_FIELDS):
+        batch.append(user)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            modified += refresh_user_snapshots(db, batch)
+            users_seen += len(batch)
+            batch = []
+    if batch:
+        modified += refresh_user_snapshots(db, batch)
+    return {'users_checked': users_seen + len(batch), 'documents_refreshed': modified}
+
+def backfill_snapshots(db):
+    """Add snapshots to documents written before they existed"""
+    user_ids = set()
+    for collection, id_field, field in SNAPSHOT_TARGETS:
+        user_ids.update(db[collection].distinct(id_field, {field: {'$exists': False}}))
+    users = list(db.users.find({'_id': {'$in': list(user_ids)}}, SNAPSHOT_SOURCE_FIELDS)) if user_ids else []
+    modified = 0
+    for index in range(0, len(users), BACKFILL_BATCH_SIZE):
+        modified += refresh_user_snapshots(db, users[index:index + BACKFILL_BATCH_SIZE])
+    return {'users_checked': len(users), 'documents_refreshed': modified}
+
+def fill_missing_snapshots(db, documents, targets):
+    """Fill snapshots absent from documents read before the backfill reached them.
+
+    `targets` is a list of (id field, snapshot field); missing users are read
+    in one query, and documents are patched in memory only.
+    """
+    missing = {
+        document[id_field] for document in documents for id_field, field in targets
+        if not document.get(field)
+    }
+    if not missing:
+        return documents
+    snapshots = snapshot_users(db, missing)
+    for document in documents:
+        for id_field, field in targets:
+            if not document.get(field):
+                document[field] = snapshots.get(document[id_field]) or build_snapshot({})
+    return documents
+
+def participant_view(document, id_field, field, include_skills=False):
+    """The participant as list responses show it"""
+    snapshot = document.get(field) or {}
+    view = {
+        '_id': str(document[id_field]),
+        'name': snapshot.get('name'),
+        'photo_url': snapshot.get('photo_url') or ''
+    }
+    if include_skills:
+        view['skills_teach'] = snapshot.get('skills_teach', [])
+    return view
@@ -0,0 +1,196 @@
+import logging
+import os
+import math
+import hashlib
+import time
+import threading
+from datetime import datetime
+from functools import wraps
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from src.models.user import get_db
+from src.models.database import EPHEMERAL_WORKLOAD
+
+logger = logging.getLogger(__name__)
+
+# 'mongo' shares counters between workers; 'memory' keeps them per process (local development)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'mongo')
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# Honour X-Forwarded-For only behind a proxy that sets it
+RATE_LIMIT_TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+
+class Limit:
+    def __init__(self, name, key, limit, window_seconds):
+        self.name = name
+        # 'ip' or 'email'
+        self.key = key
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+# Per-route policies; every limit in a policy must pass
+RATE_LIMIT_POLICIES = {
+    'login': [
+        Limit('login-ip', 'ip', 30, 60),
+        Limit('login-email', 'email', 10, 300),
+    ],
+    'register': [
+        Limit('register-ip', 'ip', 10, 3600),
+        Limit('register-email', 'email', 5, 3600),
+    ],
+}
+
+def _window(now, window_seconds):
+    """(current window index, fraction of it elapsed)"""
+    position = now / window_seconds
+    index = math.floor(position)
+    return index, position - index
+
+class MemoryBackend:
+    """Sliding-window counters in process memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._last_prune = time.time()
+
+    def hit(self, counter_key, window_seconds, now):
+        index, _ = _window(now, window_seconds)
+        with self._lock:
+            current = self._counts.get((counter_key, window_seconds, index), 0) + 1
+            self._counts[(counter_key, window_seconds, index)] = current
+            previous = self._counts.get((counter_key, window_seconds, index - 1), 0)
+            if now - self._last_prune > 60:
+                self._prune(now)
+        return current, previous
+
+    def _prune(self, now):
+        """Drop windows older than the previous one; caller holds the lock"""
+        self._last_prune = now
+        self._counts = {
+            key: count for key, count in self._counts.items()
+            if key[2] >= math.floor(now / key[1]) - 1
+        }
+
+class MongoBackend:
+    """Sliding-window counters shared through the rate_limits collection.
+
+    One document per counter and window. Closed windows never change, so
+    their counts are cached locally and a check costs one round trip.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._closed = {}
+
+    def hit(self, counter_key, window_seconds, now):
+        # Counters are short-lived and rebuilt by traffic, so a primary acknowledgement is enough
+        db = get_db(EPHEMERAL_WORKLOAD)
+        index, _ = _window(now, window_seconds)
+        document = db.rate_limits.find_one_and_update(
+            {'_id': f'{counter_key}:{index}'},
+            {
+                '$inc': {'count': 1},
+                # Removed by the TTL index once it can no longer be the previous window
+                '$setOnInsert': {'expires_at': datetime.utcfromtimestamp((index + 2) * window_seconds)}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        previous_id = f'{counter_key}:{index - 1}'
+        with self._lock:
+            previous = self._closed.get(previous_id)
+        if previous is None:
+            previous_document = db.rate_limits.find_one({'_id': previous_id}, {'count': 1})
+            previous = previous_document['count'] if previous_document else 0
+            with self._lock:
+                if len(self._closed) > 100000:
+                    self._closed.clear()
+                self._closed[previous_id] = previous
+        return document['count'], previous
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        # counter key -> time until which it is known to be over its limit
+        self._blocked = {}
+
+    def check(self, limit, key_value, now=None):
+        """Count one attempt; returns seconds to wait when the limit is exceeded, else 0"""
+        now = now or time.time()
+        counter_key = f'{limit.name}:{key_value}'
+
+        # Counters already known to be over the limit are turned away without any I/O
+        with self._lock:
+            blocked_until = self._blocked.get(counter_key)
+            if blocked_until is not None:
+                if blocked_until > now:
+                    return math.ceil(blocked_until - now)
+                del self._blocked[counter_key]
+
+        current, previous = self.backend.hit(counter_key, limit.window_seconds, now)
+        index, elapsed = _window(now, limit.window_seconds)
+        # Sliding window estimate: the previous window weighted by how much of it still overlaps
+        estimate = current + previous * (1 - elapsed)
+        if estimate <= limit.limit:
+            return 0
+
+        retry_after = (index + 1) * limit.window_seconds - now
+        with self._lock:
+            if len(self._blocked) > 100000:
+                self._blocked.clear()
+            self._blocked[counter_key] = now + retry_after
+        return math.ceil(retry_after)
+
+_limiter = None
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        use_mongo = RATE_LIMIT_BACKEND == 'mongo' and get_db() is not None
+        _limiter = RateLimiter(MongoBackend() if use_mongo else MemoryBackend())
+    return _limiter
+
+def client_ip():
+    if RATE_LIMIT_TRUST_PROXY and request.access_route:
+        # The proxy appends the address it saw; entries before it come from the client
+        return request.access_route[-1]
+    return request.remote_addr or 'unknown'
+
+def _key_value(limit):
+    if limit.key == 'ip':
+        return client_ip()
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    if not isinstance(email, str) or not email.strip():
+        return None
+    # Counter ids are stored, so keep addresses out of them
+    return hashlib.sha1(email.strip().lower().encode('utf-8')).hexdigest()
+
+def rate_limited(policy):
+    """Reject requests over any limit of `policy` with 429 before the view runs"""
+    limits = RATE_LIMIT_POLICIES[policy]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMIT_ENABLED:
+                limiter = get_rate_limiter()
+                for limit in limits:
+                    key_value = _key_value(limit)
+                    if key_value is None:
+                        continue
+                    try:
+                        retry_after = limiter.check(limit, key_value)
+                    except Exception:
+                        # Fail open: a counter outage must not lock everyone out
+                        logger.exception("Rate limit error")
+                        continue
+                    if retry_after:
+                        response = jsonify({'error': 'Too many attempts, please try again later'})
+                        response.headers['Retry-After'] = str(retry_after)
+                        return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
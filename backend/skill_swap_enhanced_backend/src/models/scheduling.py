@@ -0,0 +1,139 @@
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from src.models.availability import available_intervals
+from src.models.locks import named_locks
+from src.models.session_buckets import calendar_entries, busy_blocks, BUSY_STATUSES, BUCKET_LOOKBACK_DAYS
+
+# Buckets are keyed by start day and read back BUCKET_LOOKBACK_DAYS, so no
+# session may be longer than that or an overlap could go unseen
+MAX_SESSION_MINUTES = BUCKET_LOOKBACK_DAYS * 24 * 60
+
+DEFAULT_SUGGESTION_COUNT = 5
+MAX_SUGGESTION_COUNT = 20
+DEFAULT_SUGGESTION_DAYS = 14
+DEFAULT_SLOT_STEP_MINUTES = 30
+
+@contextmanager
+def participant_locks(db, user_ids):
+    """Serialize check-then-write on these participants' calendars; raises LockBusy"""
+    with named_locks(db, [f'schedule:{user_id}' for user_id in user_ids]):
+        yield
+
+class IntervalIndex:
+    """Sorted, non-overlapping [start, end) intervals with O(log n) lookups.
+
+    Overlapping input is merged, so the starts and ends are both ascending and
+    a single bisect finds the only interval that can contain a point.
+    """
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def overlapping(self, start, end):
+        """The first interval overlapping [start, end), or None"""
+        index = bisect_right(self.ends, start)
+        if index < len(self.starts) and self.starts[index] < end:
+            return self.starts[index], self.ends[index]
+        return None
+
+    def covers(self, start, end):
+        """Whether one interval contains all of [start, end)"""
+        index = bisect_right(self.starts, start) - 1
+        return index >= 0 and self.ends[index] >= end
+
+    def intersect(self, other):
+        """Intervals covered by both indexes"""
+        result = []
+        # Walk both lists together; each step discards the interval that ends first
+        i = j = 0
+        while i < len(self.starts) and j < len(other.starts):
+            start = max(self.starts[i], other.starts[j])
+            end = min(self.ends[i], other.ends[j])
+            if start < end:
+                result.append((start, end))
+            if self.ends[i] < other.ends[j]:
+                i += 1
+            else:
+                j += 1
+        return IntervalIndex(result)
+
+def busy_index(db, user_ids, start, end):
+    """Merged busy time of every user over [start, end)"""
+    intervals = []
+    for user_id in user_ids:
+        intervals.extend(busy_blocks(calendar_entries(db, user_id, start, end)))
+    return IntervalIndex(intervals)
+
+def availability_index(schedules, start, end):
+    """Time within [start, end) that every schedule offers; a missing schedule offers all of it"""
+    index = IntervalIndex([(start, end)])
+    for schedule in schedules:
+        if schedule:
+            index = index.intersect(IntervalIndex(available_intervals(schedule, start, end)))
+    return index
+
+def find_conflicts(db, user_ids, start, end, exclude_id=None):
+    """(user_id, bucket entry) for each session of these users overlapping [start, end)"""
+    conflicts = []
+    for user_id in user_ids:
+        for entry in calendar_entries(db, user_id, start, end):
+            if entry['session_id'] != exclude_id and entry['status'] in BUSY_STATUSES:
+                conflicts.append((user_id, entry))
+    return conflicts
+
+def outside_availability(schedules_by_user, start, end):
+    """Ids of users whose published schedule does not cover [start, end)"""
+    return [
+        user_id for user_id, schedule in schedules_by_user.items()
+        if schedule and not IntervalIndex(available_intervals(schedule, start, end)).covers(start, end)
+    ]
+
+def _align(moment, step):
+    """Round up to the next multiple of step since midnight"""
+    midnight = datetime(moment.year, moment.month, moment.day)
+    remainder = (moment - midnight) % step
+    return moment if not remainder else moment + (step - remainder)
+
+def suggest_slots(available, busy, duration, count, step):
+    """The first `count` non-overlapping slots of `duration` inside `available` that miss `busy`.
+
+    Candidates start on `step` boundaries. A candidate that hits a busy
+    interval jumps straight past it, so the search costs O(count + busy
+    intervals skipped) index lookups rather than one per step.
+    """
+    slots = []
+    for window_start, window_end in available:
+        candidate = _align(window_start, step)
+        while candidate + duration <= window_end and len(slots) < count:
+            conflict = busy.overlapping(candidate, candidate + duration)
+            if conflict:
+                candidate = _align(conflict[1], step)
+                continue
+            slots.append((candidate, candidate + duration))
+            candidate = _align(candidate + duration, step)
+        if len(slots) >= count:
+            break
+    return slots
+
+def suggest_mutual_slots(db, users, start, end, duration, count=DEFAULT_SUGGESTION_COUNT,
+                         step=timedelta(minutes=DEFAULT_SLOT_STEP_MINUTES)):
+    """Next free slots shared by `users`, a {user_id: availability_schedule} mapping"""
+    available = availability_index(users.values(), start, end)
+    busy = busy_index(db, list(users), start, end)
+    return suggest_slots(available, busy, duration, count, step)
@@ -0,0 +1,143 @@
+import uuid
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from src.models.user import badge_for_sessions, BADGE_LEVEL_THRESHOLDS
+from src.models.leaderboard import leaderboard, LEADERBOARD_FIELDS
+from src.models.identity import invalidate_profile
+from src.models.stats_rollups import record_badge_change, record_sessions_completed
+from src.models.session_buckets import sync_sessions
+
+# Completion accounting works like an outbox on the session document:
+#   1. claim   - the session flips to completed with accounting 'pending' in one conditional
+#                update, so a session can only ever be claimed once
+#   2. apply   - teacher/student counters move with $inc; each user keeps the ids of the last
+#                ACCOUNTED_SESSION_WINDOW sessions it counted, and the $inc is filtered on that
+#                list, so re-applying after a crash never counts a session twice
+#   3. badges  - conditional $set that only moves a badge up from the level it was read at
+#   4. rollups - monthly and global completion counts; written before the mark below, so a
+#                crash re-runs them (the rollup reconcile job repairs a double count)
+#   5. applied - the session is marked done; recover_pending_accounting() re-runs 2-5 for
+#                sessions left pending by a process that died mid-way
+ACCOUNTED_SESSION_WINDOW = 100
+
+# Sessions still pending after this long are assumed abandoned by their writer
+PENDING_ACCOUNTING_GRACE = timedelta(seconds=60)
+
+MAX_BULK_COMPLETE = 500
+
+SESSION_ACCOUNTING_FIELDS = {'teacher_id': 1, 'student_id': 1, 'scheduled_date': 1}
+
+def _badge_minimum(badge_level):
+    for minimum, level in BADGE_LEVEL_THRESHOLDS:
+        if level == badge_level:
+            return minimum
+    return 0
+
+def claim_sessions(db, session_ids, extra_fields=None):
+    """Mark sessions completed; returns the ones this call moved to completed.
+
+    Sessions that were already completed are left alone and not returned.
+    """
+    if not session_ids:
+        return []
+    now = datetime.utcnow()
+    completion_id = uuid.uuid4().hex
+    update = dict(extra_fields or {})
+    update.update({
+        'status': 'completed',
+        'accounting': 'pending',
+        'completion_id': completion_id,
+        'completed_at': now,
+        'updated_at': now
+    })
+    db.sessions.update_many(
+        {'_id': {'$in': list(session_ids)}, 'status': {'$ne': 'completed'}},
+        {'$set': update}
+    )
+    return list(db.sessions.find({'completion_id': completion_id}, SESSION_ACCOUNTING_FIELDS))
+
+def _counter_update(user_id, session_id, field, now):
+    return UpdateOne(
+        {'_id': user_id, 'accounted_sessions': {'$ne': session_id}},
+        {
+            # The version bump tells other processes their cached profile is stale
+            '$inc': {field: 1, 'version': 1},
+            '$push': {'accounted_sessions': {'$each': [session_id], '$slice': -ACCOUNTED_SESSION_WINDOW}},
+            '$set': {'updated_at': now}
+        }
+    )
+
+def _promote_badges(db, teacher_ids):
+    """Raise badges for teachers whose counts crossed a threshold.
+
+    Returns the teachers' current leaderboard fields keyed by id.
+    """
+    teachers = {teacher['_id']: teacher for teacher in db.users.find({'_id': {'$in': list(teacher_ids)}}, LEADERBOARD_FIELDS)}
+    for teacher in teachers.values():
+        old_badge = teacher.get('badge_level', 'Bronze')
+        new_badge = badge_for_sessions(teacher.get('total_sessions_taught', 0))
+        if _badge_minimum(new_badge) <= _badge_minimum(old_badge):
+            continue
+        # Only the writer that sees the old level moves it, so the rollup counts the change once
+        result = db.users.update_one(
+            {'_id': teacher['_id'], 'badge_level': old_badge,
+             'total_sessions_taught': {'$gte': _badge_minimum(new_badge)}},
+            {'$set': {'badge_level': new_badge, 'updated_at': datetime.utcnow()}, '$inc': {'version': 1}}
+        )
+        if result.modified_count:
+            record_badge_change(old_badge, new_badge)
+            teacher['badge_level'] = new_badge
+    return teachers
+
+def _record_completions(sessions, teachers):
+    record_sessions_completed([
+        (session['teacher_id'], session['scheduled_date'], teachers.get(session['teacher_id'], {}))
+        for session in sessions
+    ])
+
+def apply_accounting(db, sessions):
+    """Apply counters, badges and rollups for claimed sessions, then mark them applied"""
+    if not sessions:
+        return {}
+    now = datetime.utcnow()
+    updates = []
+    for session in sessions:
+        updates.append(_counter_update(session['teacher_id'], session['_id'], 'total_sessions_taught', now))
+        updates.append(_counter_update(session['student_id'], session['_id'], 'total_sessions_attended', now))
+    db.users.bulk_write(updates, ordered=False)
+    for session in sessions:
+        invalidate_profile(session['teacher_id'])
+        invalidate_profile(session['student_id'])
+
+    teachers = _promote_badges(db, {session['teacher_id'] for session in sessions})
+    for teacher in teachers.values():
+        leaderboard.record(teacher)
+
+    # Sessions already marked applied were counted by an earlier run
+    session_ids = [session['_id'] for session in sessions]
+    pending = {session['_id'] for session in db.sessions.find(
+        {'_id': {'$in': session_ids}, 'accounting': 'pending'}, {'_id': 1}
+    )}
+    _record_completions([session for session in sessions if session['_id'] in pending], teachers)
+    db.sessions.update_many(
+        {'_id': {'$in': session_ids}, 'accounting': 'pending'},
+        {'$set': {'accounting': 'applied'}}
+    )
+    return teachers
+
+def complete_sessions(db, session_ids, extra_fields=None):
+    """Complete sessions and count them exactly once. Returns the ids completed by this call."""
+    sessions = claim_sessions(db, session_ids, extra_fields)
+    sync_sessions(db, session_ids=[session['_id'] for session in sessions])
+    apply_accounting(db, sessions)
+    return [session['_id'] for session in sessions]
+
+def recover_pending_accounting(db, now=None):
+    """Finish accounting for sessions whose completing process died before applying it"""
+    now = now or datetime.utcnow()
+    sessions = list(db.sessions.find(
+        {'accounting': 'pending', 'completed_at': {'$lt': now - PENDING_ACCOUNTING_GRACE}},
+        SESSION_ACCOUNTING_FIELDS
+    ).limit(MAX_BULK_COMPLETE))
+    apply_accounting(db, sessions)
+    return {'sessions_recovered': len(sessions)}
@@ -0,0 +1,193 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from src.models.locks import named_locks
+
+logger = logging.getLogger(__name__)
+
+# session_buckets holds one document per participant and day:
+#   _id       '<user_id>:YYYY-MM-DD' (the day the session starts, UTC)
+#   sessions  [{session_id, start, end, status, skill, role, with_id}]
+# so a month view is a single _id $in read of at most ~32 documents. Buckets are
+# updated whenever a session is written; session_buckets_reconcile re-indexes
+# recently changed sessions to repair anything a failed write left behind.
+# Bucket writes for one session hold its 'session:<id>' lock (see locks).
+CALENDAR_MAX_DAYS = 62
+# Sessions are bucketed by start day, so reads look this many days back for
+# sessions that started earlier and run into the requested range
+BUCKET_LOOKBACK_DAYS = 1
+
+# Statuses that occupy time for free/busy purposes
+BUSY_STATUSES = ('scheduled', 'completed')
+
+SESSION_BUCKET_FIELDS = {
+    'teacher_id': 1, 'student_id': 1, 'scheduled_date': 1, 'duration': 1, 'status': 1, 'skill': 1
+}
+
+REINDEX_BATCH_SIZE = 500
+
+def utc_naive(moment):
+    # Freshly parsed request dates may carry an offset; stored dates are naive UTC
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def day_start(moment):
+    return datetime(moment.year, moment.month, moment.day)
+
+def bucket_id(user_id, day):
+    return f'{user_id}:{day:%Y-%m-%d}'
+
+def _entry(session, role):
+    start = utc_naive(session['scheduled_date'])
+    return {
+        'session_id': session['_id'],
+        'start': start,
+        'end': start + timedelta(minutes=int(session.get('duration') or 0)),
+        'status': session.get('status'),
+        'skill': session.get('skill'),
+        'role': role,
+        'with_id': session['student_id'] if role == 'teacher' else session['teacher_id']
+    }
+
+def _session_locks(db, session_ids):
+    # Re-indexing pulls old entries and pushes new ones in separate writes; two
+    # re-indexes of one session interleaving could leave it in two buckets
+    return named_locks(db, [f'session:{session_id}' for session_id in session_ids])
+
+def _pull_entries(db, session_ids):
+    db.session_buckets.update_many(
+        {'sessions.session_id': {'$in': list(session_ids)}},
+        {'$pull': {'sessions': {'session_id': {'$in': list(session_ids)}}}, '$set': {'updated_at': datetime.utcnow()}}
+    )
+
+def _write_entries(db, sessions):
+    now = datetime.utcnow()
+    _pull_entries(db, [session['_id'] for session in sessions])
+    updates = []
+    for session in sessions:
+        day = day_start(utc_naive(session['scheduled_date']))
+        for role in ('teacher', 'student'):
+            user_id = session[f'{role}_id']
+            updates.append(UpdateOne(
+                {'_id': bucket_id(user_id, day)},
+                {
+                    '$push': {'sessions': _entry(session, role)},
+                    '$set': {'updated_at': now},
+                    '$setOnInsert': {'user_id': user_id, 'day': day}
+                },
+                upsert=True
+            ))
+    db.session_buckets.bulk_write(updates, ordered=False)
+
+def index_sessions(db, sessions):
+    """Place sessions just written, as given, in their participants' day buckets"""
+    sessions = list(sessions)
+    if not sessions:
+        return
+    with _session_locks(db, [session['_id'] for session in sessions]):
+        _write_entries(db, sessions)
+
+def unindex_sessions(db, session_ids):
+    if not session_ids:
+        return
+    with _session_locks(db, session_ids):
+        _pull_entries(db, session_ids)
+
+def reindex_session_ids(db, session_ids):
+    """Re-read sessions and re-bucket them; ids that no longer exist are removed.
+
+    The read happens under the sessions' locks, so whichever re-index runs
+    last writes the latest state of each session.
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return 0
+    with _session_locks(db, session_ids):
+        sessions = list(db.sessions.find({'_id': {'$in': session_ids}}, SESSION_BUCKET_FIELDS))
+        if sessions:
+            _write_entries(db, sessions)
+        found = {session['_id'] for session in sessions}
+        missing = [session_id for session_id in session_ids if session_id not in found]
+        if missing:
+            _pull_entries(db, missing)
+    return len(sessions)
+
+def sync_sessions(db, session_ids=None, sessions=None, deleted_ids=None):
+    """Best-effort bucket update after a session write.
+
+    A failure here must not fail the write it follows; the reconcile job picks
+    the session up again from its updated_at.
+    """
+    try:
+        if sessions:
+            index_sessions(db, sessions)
+        if session_ids:
+            reindex_session_ids(db, session_ids)
+        if deleted_ids:
+            unindex_sessions(db, deleted_ids)
+    except Exception:
+        logger.exception("Session bucket sync error")
+
+def reindex_changed_sessions(db, since):
+    """Re-bucket every session updated after `since`, in batches"""
+    total = 0
+    batch = []
+    # Only ids are scanned; each batch is re-read under its locks
+    for session in db.sessions.find({'updated_at': {'$gt': since}}, {'_id': 1}):
+        batch.append(session['_id'])
+        if len(batch) >= REINDEX_BATCH_SIZE:
+            total += reindex_session_ids(db, batch)
+            batch = []
+    return total + reindex_session_ids(db, batch)
+
+def rebuild_session_buckets(db):
+    """Re-bucket every session; entries are replaced in place, so calendars stay readable meanwhile"""
+    return reindex_changed_sessions(db, datetime(1970, 1, 1))
+
+def calendar_entries(db, user_id, start, end):
+    """A user's sessions overlapping [start, end), ordered by start time"""
+    first_day = day_start(start) - timedelta(days=BUCKET_LOOKBACK_DAYS)
+    days = (day_start(end - timedelta(microseconds=1)) - first_day).days + 1
+    bucket_ids = [bucket_id(user_id, first_day + timedelta(days=offset)) for offset in range(days)]
+
+    entries = {}
+    for bucket in db.session_buckets.find({'_id': {'$in': bucket_ids}}, {'sessions': 1}):
+        for entry in bucket.get('sessions', []):
+            if entry['end'] > start and entry['start'] < end:
+                # Concurrent re-indexing can briefly leave a session in two buckets
+                entries[entry['session_id']] = entry
+    return sorted(entries.values(), key=lambda entry: (entry['start'], entry['session_id']))
+
+def busy_blocks(entries):
+    """Merged [start, end) intervals covered by sessions that occupy time"""
+    intervals = sorted(
+        (entry['start'], entry['end']) for entry in entries
+        if entry['status'] in BUSY_STATUSES and entry['end'] > entry['start']
+    )
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def free_blocks(busy_lists, start, end, min_duration=timedelta(0)):
+    """Gaps in [start, end) that are free in every busy list, at least min_duration long"""
+    busy = busy_blocks([
+        {'start': block_start, 'end': block_end, 'status': BUSY_STATUSES[0]}
+        for blocks in busy_lists for block_start, block_end in blocks
+    ])
+    free = []
+    cursor = start
+    for block_start, block_end in busy:
+        if block_start > cursor:
+            free.append((cursor, min(block_start, end)))
+        cursor = max(cursor, block_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        free.append((cursor, end))
+    return [(free_start, free_end) for free_start, free_end in free
+            if free_end - free_start >= min_duration and free_end > free_start]
@@ -0,0 +1,79 @@
+import base64
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from src.models.participant_snapshots import fill_missing_snapshots
+
+# Session history paging limits
+DEFAULT_SESSION_PAGE_SIZE = 50
+MAX_SESSION_PAGE_SIZE = 200
+
+SESSION_STATUSES = ('scheduled', 'completed', 'cancelled', 'missed')
+
+_EPOCH = datetime(1970, 1, 1)
+
+def encode_session_cursor(scheduled_date, session_id):
+    """Opaque `after` token for the (scheduled_date, _id) position of a session"""
+    delta = scheduled_date.replace(tzinfo=None) - _EPOCH
+    millis = delta.days * 86400000 + delta.seconds * 1000 + delta.microseconds // 1000
+    raw = f'{millis}:{session_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8').rstrip('=')
+
+def decode_session_cursor(cursor):
+    """(scheduled_date, ObjectId) from an `after` token, or raise ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        millis, session_id = base64.urlsafe_b64decode(padded.encode('utf-8')).decode('utf-8').split(':')
+        # Whole milliseconds, as BSON stores dates
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(session_id)
+    except (InvalidId, ValueError, TypeError, UnicodeDecodeError, OverflowError):
+        raise ValueError('Invalid cursor')
+
+def find_user_sessions(db, user_id, limit=DEFAULT_SESSION_PAGE_SIZE, after=None,
+                       start=None, end=None, statuses=None):
+    """One page of a user's sessions, newest first.
+
+    Ordered by (scheduled_date, _id) descending so the `after` cursor is stable
+    even when several sessions share a start time. Each $or branch is bounded by
+    the sessions_*_date_id indexes, and participants come from the snapshots
+    stored on each session, so nothing is joined. Returns (sessions, next_cursor).
+    """
+    limit = max(1, min(int(limit), MAX_SESSION_PAGE_SIZE))
+    user_oid = ObjectId(user_id)
+
+    date_range = {}
+    if start is not None:
+        date_range['$gte'] = start
+    if end is not None:
+        date_range['$lt'] = end
+
+    conditions = {}
+    keyset = None
+    if after:
+        after_date, after_id = decode_session_cursor(after)
+        # The $lte bounds the index scan; the $or resolves ties on the start time
+        date_range['$lte'] = after_date
+        keyset = {'$or': [
+            {'scheduled_date': {'$lt': after_date}},
+            {'scheduled_date': after_date, '_id': {'$lt': after_id}}
+        ]}
+    if date_range:
+        conditions['scheduled_date'] = date_range
+    if statuses:
+        conditions['status'] = {'$in': list(statuses)}
+    if keyset:
+        conditions.update(keyset)
+
+    query = {'$or': [
+        dict(conditions, teacher_id=user_oid),
+        dict(conditions, student_id=user_oid)
+    ]}
+    # One extra row tells whether another page exists
+    sessions = list(db.sessions.find(query).sort([('scheduled_date', -1), ('_id', -1)]).limit(limit + 1))
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        last = sessions[-1]
+        next_cursor = encode_session_cursor(last['scheduled_date'], last['_id'])
+    fill_missing_snapshots(db, sessions, [('teacher_id', 'teacher'), ('student_id', 'student')])
+    return sessions, next_cursor
@@ -0,0 +1,203 @@
+from datetime import datetime
+from pymongo import UpdateOne
+from src.models.user import get_db
+
+# Rollup documents live in stats_rollups:
+#   'global'        badge distribution, public user count, completed session count
+#   'month:YYYY-MM' completed sessions in that month
+# Per-teacher monthly counters live in teacher_monthly_stats, one document per (month, teacher).
+GLOBAL_ROLLUP_ID = 'global'
+
+BADGE_LEVELS = ['Bronze', 'Silver', 'Gold', 'Platinum']
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+def _inc_global(db, increments):
+    db.stats_rollups.update_one(
+        {'_id': GLOBAL_ROLLUP_ID},
+        {'$inc': increments, '$set': {'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+def record_user_created(badge_level='Bronze', is_public=True):
+    db = get_db()
+    if db is None:
+        return
+    increments = {f'badge_distribution.{badge_level}': 1}
+    if is_public:
+        increments['total_users'] = 1
+    _inc_global(db, increments)
+
+def record_visibility_change(is_public):
+    db = get_db()
+    if db is None:
+        return
+    _inc_global(db, {'total_users': 1 if is_public else -1})
+
+def record_badge_change(old_badge, new_badge):
+    db = get_db()
+    if db is None or old_badge == new_badge:
+        return
+    _inc_global(db, {f'badge_distribution.{old_badge}': -1, f'badge_distribution.{new_badge}': 1})
+
+def record_sessions_completed(completions):
+    """Count completed sessions.
+
+    `completions` is a list of (teacher_id, scheduled_date, teacher) where
+    teacher is a dict with name, photo_url and badge_level for the snapshot.
+    """
+    db = get_db()
+    if db is None or not completions:
+        return
+
+    now = datetime.utcnow()
+    month_totals = {}
+    teacher_updates = []
+    for teacher_id, scheduled_date, teacher in completions:
+        month = month_key(scheduled_date)
+        month_totals[month] = month_totals.get(month, 0) + 1
+        teacher_updates.append(UpdateOne(
+            {'_id': f'{month}:{teacher_id}'},
+            {
+                '$inc': {'sessions': 1},
+                '$set': {
+                    'month': month,
+                    'teacher_id': teacher_id,
+                    'name': teacher.get('name'),
+                    'photo_url': teacher.get('photo_url', ''),
+                    'badge_level': teacher.get('badge_level', 'Bronze'),
+                    'updated_at': now
+                }
+            },
+            upsert=True
+        ))
+
+    _inc_global(db, {'total_sessions': len(completions)})
+    db.stats_rollups.bulk_write([
+        UpdateOne({'_id': f'month:{month}'}, {'$inc': {'sessions': count}, '$set': {'month': month, 'updated_at': now}}, upsert=True)
+        for month, count in month_totals.items()
+    ], ordered=False)
+    db.teacher_monthly_stats.bulk_write(teacher_updates, ordered=False)
+
+def rebuild_rollups(db, months=None):
+    """Recompute rollups from the source collections.
+
+    Global counters are always rebuilt. Monthly counters are rebuilt for the
+    given 'YYYY-MM' months, or for every month when months is None.
+    Returns a summary of what was written.
+    """
+    now = datetime.utcnow()
+    distribution = {level: 0 for level in BADGE_LEVELS}
+    for badge in db.users.aggregate([{'$group': {'_id': '$badge_level', 'count': {'$sum': 1}}}]):
+        if badge['_id'] in distribution:
+            distribution[badge['_id']] = badge['count']
+
+    db.stats_rollups.update_one(
+        {'_id': GLOBAL_ROLLUP_ID},
+        {'$set': {
+            'badge_distribution': distribution,
+            'total_users': db.users.count_documents({'is_public': True}),
+            'total_sessions': db.sessions.count_documents({'status': 'completed'}),
+            'updated_at': now,
+            'rebuilt_at': now
+        }},
+        upsert=True
+    )
+
+    match = {'status': 'completed'}
+    if months is not None:
+        starts = [datetime.strptime(month, '%Y-%m') for month in months]
+        match['scheduled_date'] = {'$gte': min(starts)}
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': {
+                'month': {'$dateToString': {'format': '%Y-%m', 'date': '$scheduled_date'}},
+                'teacher_id': '$teacher_id'
+            },
+            'sessions': {'$sum': 1}
+        }},
+        {'$lookup': {
+            'from': 'users',
+            'localField': '_id.teacher_id',
+            'foreignField': '_id',
+            'as': 'teacher'
+        }},
+        {'$unwind': '$teacher'},
+        {'$project': {'sessions': 1, 'teacher.name': 1, 'teacher.photo_url': 1, 'teacher.badge_level': 1}}
+    ]
+
+    teacher_updates = []
+    month_totals = {}
+    for row in db.sessions.aggregate(pipeline):
+        month = row['_id']['month']
+        if months is not None and month not in months:
+            continue
+        month_totals[month] = month_totals.get(month, 0) + row['sessions']
+        teacher_updates.append(UpdateOne(
+            {'_id': f"{month}:{row['_id']['teacher_id']}"},
+            {'$set': {
+                'month': month,
+                'teacher_id': row['_id']['teacher_id'],
+                'sessions': row['sessions'],
+                'name': row['teacher']['name'],
+                'photo_url': row['teacher'].get('photo_url', ''),
+                'badge_level': row['teacher'].get('badge_level', 'Bronze'),
+                'updated_at': now
+            }},
+            upsert=True
+        ))
+
+    if teacher_updates:
+        db.teacher_monthly_stats.bulk_write(teacher_updates, ordered=False)
+    for month, count in month_totals.items():
+        db.stats_rollups.update_one(
+            {'_id': f'month:{month}'},
+            {'$set': {'month': month, 'sessions': count, 'updated_at': now}},
+            upsert=True
+        )
+
+    return {
+        'badge_distribution': distribution,
+        'months_rebuilt': sorted(month_totals),
+        'teacher_rows': len(teacher_updates)
+    }
+
+def get_global_rollup(db):
+    rollup = db.stats_rollups.find_one({'_id': GLOBAL_ROLLUP_ID})
+    if rollup is None:
+        # First request after deployment: build everything once, reading back from
+        # the primary since `db` may be a secondary-preferred handle
+        primary = get_db()
+        rebuild_rollups(primary)
+        rollup = primary.stats_rollups.find_one({'_id': GLOBAL_ROLLUP_ID})
+    distribution = {level: 0 for level in BADGE_LEVELS}
+    distribution.update({
+        level: count for level, count in rollup.get('badge_distribution', {}).items() if level in distribution
+    })
+    return {
+        'badge_distribution': distribution,
+        'total_users': rollup.get('total_users', 0),
+        'total_sessions': rollup.get('total_sessions', 0),
+        'updated_at': rollup.get('updated_at')
+    }
+
+def get_monthly_leaders(db, month, limit=5):
+    leaders = db.teacher_monthly_stats.find({'month': month}).sort('sessions', -1).limit(limit)
+    return [{
+        '_id': str(leader['teacher_id']),
+        'name': leader['name'],
+        'photo_url': leader.get('photo_url', ''),
+        'sessions_this_month': leader['sessions'],
+        'badge_level': leader.get('badge_level', 'Bronze')
+    } for leader in leaders]
+
+def get_month_snapshot(db, month, limit=20):
+    rollup = db.stats_rollups.find_one({'_id': f'month:{month}'}) or {}
+    return {
+        'month': month,
+        'total_sessions': rollup.get('sessions', 0),
+        'leaders': get_monthly_leaders(db, month, limit)
+    }
@@ -0,0 +1,170 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from src.models.user import get_db
+
+logger = logging.getLogger(__name__)
+
+# How often a process picks up tokens revoked by other processes
+REVOCATION_REFRESH_SECONDS = float(os.getenv('REVOCATION_REFRESH_SECONDS', 2))
+# Full rebuild interval; the bloom filter can't forget entries, so expired JTIs are dropped here
+REVOCATION_RELOAD_SECONDS = float(os.getenv('REVOCATION_RELOAD_SECONDS', 3600))
+# Expected live revocations and target false-positive rate for sizing the filter
+REVOCATION_EXPECTED_TOKENS = int(os.getenv('REVOCATION_EXPECTED_TOKENS', 100000))
+REVOCATION_FALSE_POSITIVE_RATE = float(os.getenv('REVOCATION_FALSE_POSITIVE_RATE', 0.001))
+# Revocations are re-read slightly behind the last sync to absorb clock skew between writers
+SYNC_OVERLAP = timedelta(seconds=5)
+# Bounds how long requests wait on a load while MongoDB is unreachable
+REVOCATION_LOAD_TIMEOUT_SECONDS = float(os.getenv('REVOCATION_LOAD_TIMEOUT_SECONDS', 2))
+
+class RevocationUnavailable(Exception):
+    """No revocation list has been loaded yet, so no token can be accepted"""
+
+    def __init__(self, retry_after=math.ceil(REVOCATION_REFRESH_SECONDS)):
+        super().__init__('Token revocation list unavailable')
+        self.retry_after = retry_after
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings, using double hashing on one blake2b digest"""
+
+    def __init__(self, expected_items, false_positive_rate):
+        # Standard sizing: m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(64, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / expected_items * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    """Revoked token ids mirrored from MongoDB into memory.
+
+    The bloom filter answers the common "not revoked" case without taking a
+    lock; only its rare positives are confirmed against the exact set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._bloom = BloomFilter(REVOCATION_EXPECTED_TOKENS, REVOCATION_FALSE_POSITIVE_RATE)
+        self._revoked = set()
+        self._loaded_at = None
+        self._checked_at = 0.0
+        self._synced_at = None
+        self._failed_at = None
+
+    def load(self, db):
+        now = datetime.utcnow()
+        bloom = BloomFilter(REVOCATION_EXPECTED_TOKENS, REVOCATION_FALSE_POSITIVE_RATE)
+        revoked = set()
+        synced_at = now
+        # The TTL monitor runs about once a minute, so skip documents it hasn't removed yet
+        for token in db.revoked_tokens.find({'expires_at': {'$gt': now}}, {'revoked_at': 1}):
+            bloom.add(token['_id'])
+            revoked.add(token['_id'])
+            synced_at = max(synced_at, token['revoked_at'])
+        with self._lock:
+            self._bloom = bloom
+            self._revoked = revoked
+            self._synced_at = synced_at
+            self._loaded_at = time.monotonic()
+            self._checked_at = self._loaded_at
+
+    def _apply_changes(self, db):
+        self._checked_at = time.monotonic()
+        query = {}
+        if self._synced_at is not None:
+            query['revoked_at'] = {'$gt': self._synced_at - SYNC_OVERLAP}
+        for token in db.revoked_tokens.find(query, {'revoked_at': 1}):
+            self._add(token['_id'])
+            if self._synced_at is None or token['revoked_at'] > self._synced_at:
+                self._synced_at = token['revoked_at']
+
+    def refresh(self, db):
+        """Reload when stale, otherwise pull revocations made since the last sync.
+
+        A failed read keeps serving the last loaded list. Before the first
+        load succeeds there is nothing to answer from, so this fails closed
+        with RevocationUnavailable.
+        """
+        now = time.monotonic()
+        stale = self._loaded_at is None or now - self._loaded_at > REVOCATION_RELOAD_SECONDS
+        if not stale and now - self._checked_at < REVOCATION_REFRESH_SECONDS:
+            return
+        if self._loaded_at is None and self._failed_at is not None and now - self._failed_at < REVOCATION_REFRESH_SECONDS:
+            # Don't queue every request behind another timeout right after a failed load
+            raise RevocationUnavailable()
+        # Wait only when nothing has been loaded yet
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            with pymongo.timeout(REVOCATION_LOAD_TIMEOUT_SECONDS):
+                if self._loaded_at is None or now - self._loaded_at > REVOCATION_RELOAD_SECONDS:
+                    self.load(db)
+                elif now - self._checked_at >= REVOCATION_REFRESH_SECONDS:
+                    self._apply_changes(db)
+            self._failed_at = None
+        except PyMongoError:
+            logger.exception("Token revocation refresh error")
+            self._failed_at = time.monotonic()
+            self._checked_at = self._failed_at
+            if self._loaded_at is None:
+                raise RevocationUnavailable()
+        finally:
+            self._refresh_lock.release()
+
+    def _add(self, jti):
+        with self._lock:
+            self._bloom.add(jti)
+            self._revoked.add(jti)
+
+    def contains(self, jti):
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            return jti in self._revoked
+
+    def revoke(self, db, tokens):
+        """Persist revocations; tokens is a list of (jti, user_id, expires_at)"""
+        now = datetime.utcnow()
+        db.revoked_tokens.bulk_write([
+            UpdateOne(
+                {'_id': jti},
+                {'$set': {'user_id': user_id, 'expires_at': expires_at, 'revoked_at': now}},
+                upsert=True
+            )
+            for jti, user_id, expires_at in tokens
+        ], ordered=False)
+        for jti, _, _ in tokens:
+            self._add(jti)
+
+revocation_list = RevocationList()
+
+def revoke_token(jti, user_id, expires_at):
+    db = get_db()
+    if db is None:
+        raise Exception("Database not initialized")
+    revocation_list.revoke(db, [(jti, user_id, expires_at)])
+
+def is_token_revoked(jti):
+    db = get_db()
+    if db is not None:
+        revocation_list.refresh(db)
+    return revocation_list.contains(jti)
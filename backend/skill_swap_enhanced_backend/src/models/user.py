@@ -1,28 +1,199 @@
+import logging
 import os
+import re
+import base64
+import threading
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import ASCENDING
 from bson import ObjectId
+from bson.errors import InvalidId
 import bcrypt
+from src.models.indexes import ensure_indexes
+from src.models.database import create_client, workload_databases, ping, DEFAULT_WORKLOAD
+from src.models.identity import invalidate_profile
+
+logger = logging.getLogger(__name__)
 
 # MongoDB connection
 client = None
 db = None
+# Handles per operation class (see src.models.database.WORKLOADS)
+databases = {}
+# Set once indexes and startup backfills have run against a reachable server
+_setup_done = False
+_setup_lock = threading.Lock()
+
+# Fields that may be returned by the public user directory
+PUBLIC_USER_FIELDS = [
+    'name', 'email', 'google_id', 'photo_url', 'bio', 'skills_teach', 'skills_learn',
+    'availability', 'availability_schedule', 'is_public', 'created_at', 'updated_at',
+    'total_sessions_taught', 'total_sessions_attended', 'rating', 'badge_level', 'notification_preferences'
+]
+
+# Directory search paging limits
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Counting stops here so the total stays cheap on very large directories
+SEARCH_COUNT_CAP = 10000
+
+# bcrypt cost factor for new hashes; existing hashes are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
 
 def init_db():
-    global client, db
+    global client, db, databases
     mongodb_uri = os.getenv('MONGODB_URI')
     if mongodb_uri:
-        client = MongoClient(mongodb_uri)
-        db = client.skillswap
-        print("Connected to MongoDB")
+        client = create_client(mongodb_uri)
+        databases = workload_databases(client)
+        db = databases[DEFAULT_WORKLOAD]
+        # The client connects lazily; keep the handles so a later recovery needs no restart
+        if ensure_db_setup():
+            logger.info("Connected to MongoDB")
     else:
-        print("MongoDB URI not found in environment variables")
+        logger.warning("MongoDB URI not found in environment variables")
+
+def ensure_db_setup():
+    """Create indexes and run startup backfills once the server is reachable.
+
+    True once setup has completed. Readiness checks and the scheduler call this,
+    so a process that booted while MongoDB was down catches up when it returns.
+    """
+    global _setup_done
+    if _setup_done:
+        return True
+    if client is None or not _setup_lock.acquire(blocking=False):
+        return False
+    try:
+        if _setup_done:
+            return True
+        ok, error = ping(client)
+        if not ok:
+            logger.error("MongoDB ping failed, database setup deferred: %s", error)
+            return False
+        ensure_indexes(db)
+        backfill_skills_normalized(db)
+        _setup_done = True
+        return True
+    except Exception:
+        logger.exception("Database setup error")
+        return False
+    finally:
+        _setup_lock.release()
+
+def get_db(workload=None):
+    """The database handle for an operation class; the default handle when none is given"""
+    if workload is None:
+        return db
+    return databases.get(workload, db)
+
+def normalize_skills(*skill_lists):
+    """Lowercased, de-duplicated skills used by the directory skill index"""
+    normalized = set()
+    for skills in skill_lists:
+        for skill in skills or []:
+            if isinstance(skill, str) and skill.strip():
+                normalized.add(skill.strip().lower())
+    return sorted(normalized)
+
+def backfill_skills_normalized(database):
+    """Compute the skill index field server-side for documents that predate it"""
+    try:
+        database.users.update_many(
+            {'skills_normalized': {'$exists': False}},
+            [{
+                '$set': {
+                    'skills_normalized': {
+                        '$setUnion': [
+                            {'$map': {'input': {'$ifNull': ['$skills_teach', []]}, 'in': {'$toLower': {'$trim': {'input': '$$this'}}}}},
+                            {'$map': {'input': {'$ifNull': ['$skills_learn', []]}, 'in': {'$toLower': {'$trim': {'input': '$$this'}}}}}
+                        ]
+                    }
+                }
+            }]
+        )
+    except Exception:
+        logger.exception("Skill index backfill error")
 
-def get_db():
-    return db
+def encode_cursor(object_id):
+    return base64.urlsafe_b64encode(str(object_id).encode('utf-8')).decode('utf-8').rstrip('=')
+
+def decode_cursor(cursor):
+    """Turn an opaque `after` token back into an ObjectId, or raise ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(padded.encode('utf-8')).decode('utf-8'))
+    except (InvalidId, ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def default_notification_preferences():
+    return {
+        "email_notifications": True,
+        "session_reminders": True,
+        "new_requests": True
+    }
+
+# (minimum sessions taught, badge), highest first
+BADGE_LEVEL_THRESHOLDS = (
+    (50, 'Platinum'),
+    (25, 'Gold'),
+    (10, 'Silver'),
+    (0, 'Bronze'),
+)
+
+def badge_for_sessions(total_sessions_taught):
+    for minimum, badge_level in BADGE_LEVEL_THRESHOLDS:
+        if total_sessions_taught >= minimum:
+            return badge_level
+    return 'Bronze'
+
+# Stored user fields in serialization order, with the value used when a document lacks one.
+# Callables are invoked so each user gets its own list/dict/timestamp.
+USER_FIELD_DEFAULTS = (
+    ('name', None),
+    ('email', None),
+    ('password', None),
+    ('google_id', None),
+    ('photo_url', None),
+    ('bio', ''),
+    ('skills_teach', list),
+    ('skills_learn', list),
+    ('availability', ''),
+    # Structured weekly slots and exceptions (see src.models.availability); None means always available
+    ('availability_schedule', None),
+    ('is_public', True),
+    ('created_at', datetime.utcnow),
+    ('updated_at', datetime.utcnow),
+    ('total_sessions_taught', 0),
+    ('total_sessions_attended', 0),
+    ('rating', 0.0),
+    ('badge_level', 'Bronze'),
+    ('notification_preferences', default_notification_preferences),
+    # Bumped on every update; documents written before versioning count as version 0
+    ('version', 0),
+)
+
+USER_FIELDS = tuple(field for field, _ in USER_FIELD_DEFAULTS)
+
+class ConcurrentModificationError(Exception):
+    """The user document changed since it was read"""
+
+def build_projection(fields):
+    """Normalize a list of field names or a Mongo projection dict; None means every field"""
+    if fields is None:
+        return None
+    if isinstance(fields, dict):
+        return fields
+    return {field: 1 for field in fields}
 
 class User:
+    # Slots keep per-user memory small on list paths; a field left out of a
+    # projection stays unset instead of being filled with a default.
+    __slots__ = ('_id', '_dirty', '_array_ops') + USER_FIELDS
+
     def __init__(self, name, email, password=None, google_id=None, photo_url=None):
+        object.__setattr__(self, '_dirty', set())
+        object.__setattr__(self, '_array_ops', {})
+        now = datetime.utcnow()
         self.name = name
         self.email = email
         self.password = self.hash_password(password) if password else None
@@ -32,209 +203,258 @@ class User:
         self.skills_teach = []
         self.skills_learn = []
         self.availability = ""
+        self.availability_schedule = None
         self.is_public = True
-        self.created_at = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+        self.created_at = now
+        self.updated_at = now
         self.total_sessions_taught = 0
         self.total_sessions_attended = 0
         self.rating = 0.0
         self.badge_level = "Bronze"
-        self.notification_preferences = {
-            "email_notifications": True,
-            "session_reminders": True,
-            "new_requests": True
-        }
+        self.notification_preferences = default_notification_preferences()
+        self.version = 1
+
+    def __setattr__(self, name, value):
+        # Assigning a stored field marks it for the next save(); assigning an equal
+        # value doesn't. In-place list/dict edits aren't seen, so use push()/pull()
+        # or mark_dirty() for those.
+        if name in USER_FIELDS:
+            try:
+                unchanged = getattr(self, name) == value
+            except AttributeError:
+                unchanged = False
+            if not unchanged:
+                self._dirty.add(name)
+                self._array_ops.pop(name, None)
+        object.__setattr__(self, name, value)
+
+    def mark_dirty(self, field):
+        self._dirty.add(field)
+        self._array_ops.pop(field, None)
+
+    def push(self, field, *values):
+        """Append to a list field, saved as $push"""
+        getattr(self, field).extend(values)
+        self._queue_array_op(field, '$push', values)
+
+    def pull(self, field, *values):
+        """Remove values from a list field, saved as $pull"""
+        object.__setattr__(self, field, [value for value in getattr(self, field) if value not in values])
+        self._queue_array_op(field, '$pull', values)
+
+    def _queue_array_op(self, field, operator, values):
+        if field in self._dirty:
+            # Already rewritten wholesale by $set
+            return
+        ops = self._array_ops.setdefault(field, {})
+        ops.setdefault(operator, []).extend(values)
+        if len(ops) > 1:
+            # $push and $pull can't target the same field in one update
+            self.mark_dirty(field)
+
+    @classmethod
+    def from_document(cls, user_data, projection=None):
+        """Build a User from a raw users document without running __init__.
+
+        With a projection, only the projected fields are populated; the rest
+        are left unset so callers can't mistake a default for stored data.
+        """
+        user = cls.__new__(cls)
+        object.__setattr__(user, '_dirty', set())
+        object.__setattr__(user, '_array_ops', {})
+        user._id = user_data.get('_id')
+        included = None
+        if projection is not None:
+            included = {field for field, flag in projection.items() if flag}
+        for field, default in USER_FIELD_DEFAULTS:
+            if field in user_data:
+                object.__setattr__(user, field, user_data[field])
+            elif included is None or field in included:
+                object.__setattr__(user, field, default() if callable(default) else default)
+        return user
 
     @staticmethod
-    def hash_password(password):
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    def _find_one(query, fields=None):
+        db = get_db()
+        if db is None:
+            return None
+        
+        projection = build_projection(fields)
+        user_data = db.users.find_one(query, projection)
+        if user_data:
+            return User.from_document(user_data, projection)
+        return None
+
+    @staticmethod
+    def hash_password(password, rounds=BCRYPT_ROUNDS):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
     @staticmethod
     def check_password(password, hashed):
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
     def to_dict(self):
-        return {
-            "_id": getattr(self, '_id', None),
-            "name": self.name,
-            "email": self.email,
-            "google_id": self.google_id,
-            "photo_url": self.photo_url,
-            "bio": self.bio,
-            "skills_teach": self.skills_teach,
-            "skills_learn": self.skills_learn,
-            "availability": self.availability,
-            "is_public": self.is_public,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "total_sessions_taught": self.total_sessions_taught,
-            "total_sessions_attended": self.total_sessions_attended,
-            "rating": self.rating,
-            "badge_level": self.badge_level,
-            "notification_preferences": self.notification_preferences
-        }
+        """Loaded fields as a dict; the password hash is never included"""
+        user_dict = {"_id": getattr(self, '_id', None)}
+        for field in USER_FIELDS:
+            if field != 'password' and hasattr(self, field):
+                user_dict[field] = getattr(self, field)
+        return user_dict
 
-    def save(self):
+    def _build_update(self):
+        """Minimal update document for the fields changed since load"""
+        changes = {field: getattr(self, field) for field in self._dirty}
+        update = {}
+        for field, ops in self._array_ops.items():
+            for operator, values in ops.items():
+                if operator == '$push':
+                    update.setdefault('$push', {})[field] = {'$each': values}
+                else:
+                    update.setdefault('$pull', {})[field] = {'$in': values}
+        skills_changed = {'skills_teach', 'skills_learn'} & (self._dirty | set(self._array_ops))
+        # The skill index can only be rebuilt when both skill lists were loaded
+        if skills_changed and hasattr(self, 'skills_teach') and hasattr(self, 'skills_learn'):
+            changes['skills_normalized'] = normalize_skills(self.skills_teach, self.skills_learn)
+        changes.pop('version', None)
+        if changes:
+            update['$set'] = changes
+        return update
+
+    def save(self, check_version=False):
+        """Insert a new user, or write only the fields changed since it was loaded.
+
+        With check_version the update only applies if the stored version still
+        matches the loaded one, and ConcurrentModificationError is raised otherwise.
+        """
         db = get_db()
         if db is None:
             raise Exception("Database not initialized")
         
-        self.updated_at = datetime.utcnow()
-        user_data = self.to_dict()
-        
-        if hasattr(self, '_id') and self._id:
-            # Update existing user
-            user_data.pop('_id')
-            result = db.users.update_one(
-                {"_id": self._id},
-                {"$set": user_data}
-            )
-            return result.modified_count > 0
-        else:
+        if not getattr(self, '_id', None):
             # Create new user
+            self.updated_at = datetime.utcnow()
+            user_data = self.to_dict()
+            user_data.pop('_id')
+            if getattr(self, 'password', None):
+                user_data['password'] = self.password
+            user_data['skills_normalized'] = normalize_skills(self.skills_teach, self.skills_learn)
             result = db.users.insert_one(user_data)
             self._id = result.inserted_id
+            self._clear_changes()
+            return True
+        
+        if not self._dirty and not self._array_ops:
             return True
+        
+        self.updated_at = datetime.utcnow()
+        update = self._build_update()
+        update['$inc'] = {'version': 1}
+        query = {"_id": self._id}
+        if check_version:
+            if not hasattr(self, 'version'):
+                raise ValueError("version must be loaded to check it")
+            query['version'] = self.version if self.version else {'$in': [0, None]}
+        
+        # Update existing user
+        result = db.users.update_one(query, update)
+        if check_version and result.matched_count == 0:
+            raise ConcurrentModificationError(f"User {self._id} was modified concurrently")
+        if hasattr(self, 'version'):
+            object.__setattr__(self, 'version', (self.version or 0) + 1)
+        self._clear_changes()
+        invalidate_profile(self._id)
+        return result.modified_count > 0
+
+    def _clear_changes(self):
+        self._dirty.clear()
+        self._array_ops.clear()
 
     @staticmethod
-    def find_by_email(email):
-        db = get_db()
-        if db is None:
+    def find_by_email(email, fields=None):
+        return User._find_one({"email": email}, fields)
+
+    @staticmethod
+    def find_by_id(user_id, fields=None):
+        try:
+            return User._find_one({"_id": ObjectId(user_id)}, fields)
+        except (InvalidId, TypeError):
             return None
-        
-        user_data = db.users.find_one({"email": email})
-        if user_data:
-            user = User(user_data['name'], user_data['email'])
-            user._id = user_data['_id']
-            user.password = user_data.get('password')
-            user.google_id = user_data.get('google_id')
-            user.photo_url = user_data.get('photo_url')
-            user.bio = user_data.get('bio', '')
-            user.skills_teach = user_data.get('skills_teach', [])
-            user.skills_learn = user_data.get('skills_learn', [])
-            user.availability = user_data.get('availability', '')
-            user.is_public = user_data.get('is_public', True)
-            user.created_at = user_data.get('created_at', datetime.utcnow())
-            user.updated_at = user_data.get('updated_at', datetime.utcnow())
-            user.total_sessions_taught = user_data.get('total_sessions_taught', 0)
-            user.total_sessions_attended = user_data.get('total_sessions_attended', 0)
-            user.rating = user_data.get('rating', 0.0)
-            user.badge_level = user_data.get('badge_level', 'Bronze')
-            user.notification_preferences = user_data.get('notification_preferences', {
-                "email_notifications": True,
-                "session_reminders": True,
-                "new_requests": True
-            })
-            return user
-        return None
 
     @staticmethod
-    def find_by_id(user_id):
+    def find_by_google_id(google_id, fields=None):
+        return User._find_one({"google_id": google_id}, fields)
+
+    @staticmethod
+    def find_many_by_ids(user_ids, fields=None):
+        """Load several users with one $in query, keyed by their ObjectId"""
         db = get_db()
         if db is None:
-            return None
+            return {}
         
-        try:
-            user_data = db.users.find_one({"_id": ObjectId(user_id)})
-            if user_data:
-                user = User(user_data['name'], user_data['email'])
-                user._id = user_data['_id']
-                user.password = user_data.get('password')
-                user.google_id = user_data.get('google_id')
-                user.photo_url = user_data.get('photo_url')
-                user.bio = user_data.get('bio', '')
-                user.skills_teach = user_data.get('skills_teach', [])
-                user.skills_learn = user_data.get('skills_learn', [])
-                user.availability = user_data.get('availability', '')
-                user.is_public = user_data.get('is_public', True)
-                user.created_at = user_data.get('created_at', datetime.utcnow())
-                user.updated_at = user_data.get('updated_at', datetime.utcnow())
-                user.total_sessions_taught = user_data.get('total_sessions_taught', 0)
-                user.total_sessions_attended = user_data.get('total_sessions_attended', 0)
-                user.rating = user_data.get('rating', 0.0)
-                user.badge_level = user_data.get('badge_level', 'Bronze')
-                user.notification_preferences = user_data.get('notification_preferences', {
-                    "email_notifications": True,
-                    "session_reminders": True,
-                    "new_requests": True
-                })
-                return user
-        except:
-            pass
-        return None
+        object_ids = [ObjectId(user_id) for user_id in user_ids]
+        projection = build_projection(fields)
+        return {
+            user_data['_id']: User.from_document(user_data, projection)
+            for user_data in db.users.find({"_id": {"$in": object_ids}}, projection)
+        }
 
     @staticmethod
-    def find_by_google_id(google_id):
+    def get_all_public_users(fields=None):
         db = get_db()
         if db is None:
-            return None
+            return []
         
-        user_data = db.users.find_one({"google_id": google_id})
-        if user_data:
-            user = User(user_data['name'], user_data['email'])
-            user._id = user_data['_id']
-            user.password = user_data.get('password')
-            user.google_id = user_data.get('google_id')
-            user.photo_url = user_data.get('photo_url')
-            user.bio = user_data.get('bio', '')
-            user.skills_teach = user_data.get('skills_teach', [])
-            user.skills_learn = user_data.get('skills_learn', [])
-            user.availability = user_data.get('availability', '')
-            user.is_public = user_data.get('is_public', True)
-            user.created_at = user_data.get('created_at', datetime.utcnow())
-            user.updated_at = user_data.get('updated_at', datetime.utcnow())
-            user.total_sessions_taught = user_data.get('total_sessions_taught', 0)
-            user.total_sessions_attended = user_data.get('total_sessions_attended', 0)
-            user.rating = user_data.get('rating', 0.0)
-            user.badge_level = user_data.get('badge_level', 'Bronze')
-            user.notification_preferences = user_data.get('notification_preferences', {
-                "email_notifications": True,
-                "session_reminders": True,
-                "new_requests": True
-            })
-            return user
-        return None
+        projection = build_projection(fields)
+        return [
+            User.from_document(user_data, projection)
+            for user_data in db.users.find({"is_public": True}, projection)
+        ]
 
     @staticmethod
-    def get_all_public_users():
+    def search_public_users(search='', skill=None, limit=DEFAULT_SEARCH_LIMIT, after=None, fields=None):
+        """Page through public users with filtering done by MongoDB.
+
+        `search` matches whole words through the text index, or a skill prefix
+        through the normalized skill index. `skill` is an exact skill match.
+        Results are ordered by `_id` so the `after` cursor is stable.
+        Returns (documents, next_cursor, total_estimate, total_is_exact).
+        """
         db = get_db()
         if db is None:
-            return []
-        
-        users = []
-        for user_data in db.users.find({"is_public": True}):
-            user = User(user_data['name'], user_data['email'])
-            user._id = user_data['_id']
-            user.password = user_data.get('password')
-            user.google_id = user_data.get('google_id')
-            user.photo_url = user_data.get('photo_url')
-            user.bio = user_data.get('bio', '')
-            user.skills_teach = user_data.get('skills_teach', [])
-            user.skills_learn = user_data.get('skills_learn', [])
-            user.availability = user_data.get('availability', '')
-            user.is_public = user_data.get('is_public', True)
-            user.created_at = user_data.get('created_at', datetime.utcnow())
-            user.updated_at = user_data.get('updated_at', datetime.utcnow())
-            user.total_sessions_taught = user_data.get('total_sessions_taught', 0)
-            user.total_sessions_attended = user_data.get('total_sessions_attended', 0)
-            user.rating = user_data.get('rating', 0.0)
-            user.badge_level = user_data.get('badge_level', 'Bronze')
-            user.notification_preferences = user_data.get('notification_preferences', {
-                "email_notifications": True,
-                "session_reminders": True,
-                "new_requests": True
-            })
-            users.append(user)
-        return users
+            return [], None, 0, True
+
+        query = {'is_public': True}
+        if search:
+            term = search.strip().lower()
+            query['$or'] = [
+                {'$text': {'$search': search}},
+                {'skills_normalized': {'$regex': '^' + re.escape(term)}}
+            ]
+        if skill:
+            query['skills_normalized'] = skill.strip().lower()
+
+        # Fields requested by the caller, never the password hash
+        projection = {field: 1 for field in (fields or PUBLIC_USER_FIELDS) if field in PUBLIC_USER_FIELDS}
+        if not projection:
+            projection = {field: 1 for field in PUBLIC_USER_FIELDS}
+
+        limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+        page_query = dict(query)
+        if after:
+            page_query['_id'] = {'$gt': decode_cursor(after)}
+
+        # Fetch one extra document to know whether another page exists
+        documents = list(db.users.find(page_query, projection).sort('_id', ASCENDING).limit(limit + 1))
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(documents[-1]['_id'])
+
+        # The total ignores the cursor so it stays the same on every page
+        total = db.users.count_documents(query, limit=SEARCH_COUNT_CAP)
+        return documents, next_cursor, total, total < SEARCH_COUNT_CAP
 
     def update_badge_level(self):
         """Update badge level based on sessions taught"""
-        if self.total_sessions_taught >= 50:
-            self.badge_level = "Platinum"
-        elif self.total_sessions_taught >= 25:
-            self.badge_level = "Gold"
-        elif self.total_sessions_taught >= 10:
-            self.badge_level = "Silver"
-        else:
-            self.badge_level = "Bronze"
+        self.badge_level = badge_for_sessions(self.total_sessions_taught)
 
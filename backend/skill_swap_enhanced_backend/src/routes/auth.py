@@ -1,15 +1,25 @@
+import logging
 import os
 import json
+from datetime import datetime
 from flask import Blueprint, request, jsonify, redirect, url_for, session
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from google.auth.transport import requests
-from google.oauth2 import id_token
-from google_auth_oauthlib.flow import Flow
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 import cloudinary
 import cloudinary.uploader
 from src.models.user import User, get_db
+from src.models.identity import (
+    PROFILE_VERSION_CLAIM, PROFILE_FIELDS, issue_access_token, profile_snapshot, get_cached_profile, cache_profile
+)
+from src.models.stats_rollups import record_user_created
+from src.models.token_revocation import revoke_token
+from src.models.rate_limit import rate_limited
+from src.models.operator_auth import operator_required
+from src.services.password_hasher import password_hasher, HasherBusy
+from src.services.google_oauth import authorization_request, exchange_code, id_token_verifier
 from email_validator import validate_email, EmailNotValidError
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint('auth', __name__)
 
 # Configure Cloudinary
@@ -19,23 +29,13 @@ cloudinary.config(
     api_secret=os.getenv('CLOUDINARY_API_SECRET')
 )
 
-# Google OAuth configuration
-GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
-GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
-GOOGLE_CALLBACK_URL = os.getenv('GOOGLE_CALLBACK_URL')
-
-# Google OAuth flow configuration
-client_config = {
-    "web": {
-        "client_id": GOOGLE_CLIENT_ID,
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "redirect_uris": [GOOGLE_CALLBACK_URL]
-    }
-}
+def _hasher_busy_response(error):
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limited('register')
 def register():
     try:
         data = request.get_json()
@@ -51,20 +51,22 @@ def register():
             return jsonify({'error': 'Invalid email format'}), 400
         
         # Check if user already exists
-        existing_user = User.find_by_email(data['email'])
+        existing_user = User.find_by_email(data['email'], fields=['email'])
         if existing_user:
             return jsonify({'error': 'User with this email already exists'}), 400
         
-        # Create new user
+        # Create new user; the password is hashed on the bounded hashing pool
         user = User(
             name=data['name'],
-            email=data['email'],
-            password=data['password']
+            email=data['email']
         )
+        user.password = password_hasher.hash(data['password'])
         
         if user.save():
+            record_user_created(user.badge_level, user.is_public)
+            
             # Create JWT token
-            access_token = create_access_token(identity=str(user._id))
+            access_token = issue_access_token(user._id, user.version)
             
             return jsonify({
                 'success': True,
@@ -83,11 +85,14 @@ def register():
         else:
             return jsonify({'error': 'Failed to create user'}), 500
             
-    except Exception as e:
-        print(f"Registration error: {str(e)}")
+    except HasherBusy as e:
+        return _hasher_busy_response(e)
+    except Exception:
+        logger.exception("Registration error")
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limited('login')
 def login():
     try:
         data = request.get_json()
@@ -102,11 +107,20 @@ def login():
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Check password
-        if not user.password or not User.check_password(data['password'], user.password):
+        if not user.password or not password_hasher.verify(data['password'], user.password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with an older cost factor while the plaintext is at hand
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(data['password'])
+                user.save()
+            except HasherBusy:
+                # Not worth failing the login over; it is retried next time
+                pass
+        
         # Create JWT token
-        access_token = create_access_token(identity=str(user._id))
+        access_token = issue_access_token(user._id, user.version)
         
         return jsonify({
             'success': True,
@@ -128,33 +142,26 @@ def login():
             }
         }), 200
         
-    except Exception as e:
-        print(f"Login error: {str(e)}")
+    except HasherBusy as e:
+        return _hasher_busy_response(e)
+    except Exception:
+        logger.exception("Login error")
         return jsonify({'error': 'Internal server error'}), 500
 
 @auth_bp.route('/google', methods=['GET'])
 def google_login():
     try:
-        # Create flow instance
-        flow = Flow.from_client_config(
-            client_config,
-            scopes=['openid', 'email', 'profile']
-        )
-        flow.redirect_uri = GOOGLE_CALLBACK_URL
-        
         # Generate authorization URL
-        authorization_url, state = flow.authorization_url(
-            access_type='offline',
-            include_granted_scopes='true'
-        )
+        authorization_url, state, code_verifier = authorization_request()
         
-        # Store state in session for security
+        # Store state and the PKCE verifier in session for the callback
         session['state'] = state
+        session['code_verifier'] = code_verifier
         
         return redirect(authorization_url)
         
-    except Exception as e:
-        print(f"Google login error: {str(e)}")
+    except Exception:
+        logger.exception("Google login error")
         return jsonify({'error': 'Failed to initiate Google login'}), 500
 
 @auth_bp.route('/google/callback', methods=['GET'])
@@ -165,30 +172,14 @@ def google_callback():
             return redirect(f"http://localhost:5173/login?error=invalid_state")
         
         # Check for error in callback
-        if request.args.get('error'):
+        if request.args.get('error') or not request.args.get('code'):
             return redirect(f"http://localhost:5173/login?error=google_auth_failed")
         
-        # Create flow instance
-        flow = Flow.from_client_config(
-            client_config,
-            scopes=['openid', 'email', 'profile'],
-            state=session['state']
-        )
-        flow.redirect_uri = GOOGLE_CALLBACK_URL
-        
         # Fetch token
-        flow.fetch_token(authorization_response=request.url)
+        tokens = exchange_code(request.args['code'], session.pop('code_verifier', None))
         
-        # Get user info from Google
-        credentials = flow.credentials
-        request_session = requests.Request()
-        
-        # Verify the token and get user info
-        idinfo = id_token.verify_oauth2_token(
-            credentials.id_token,
-            request_session,
-            GOOGLE_CLIENT_ID
-        )
+        # Verify the token against the cached Google certificates and get user info
+        idinfo = id_token_verifier.verify(tokens['id_token'])
         
         google_id = idinfo['sub']
         email = idinfo['email']
@@ -215,9 +206,10 @@ def google_callback():
                     photo_url=picture
                 )
                 user.save()
+                record_user_created(user.badge_level, user.is_public)
         
         # Create JWT token
-        access_token = create_access_token(identity=str(user._id))
+        access_token = issue_access_token(user._id, user.version)
         
         # Redirect to frontend with token and user data
         user_data = {
@@ -241,8 +233,8 @@ def google_callback():
         
         return redirect(f"http://localhost:5173/auth/google/callback?token={access_token}&user={encoded_user_data}")
         
-    except Exception as e:
-        print(f"Google callback error: {str(e)}")
+    except Exception:
+        logger.exception("Google callback error")
         return redirect(f"http://localhost:5173/login?error=google_auth_failed")
 
 @auth_bp.route('/verify', methods=['GET'])
@@ -250,46 +242,48 @@ def google_callback():
 def verify_token():
     try:
         current_user_id = get_jwt_identity()
-        user = User.find_by_id(current_user_id)
+        token_version = get_jwt().get(PROFILE_VERSION_CLAIM)
         
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        # Answered from the profile cache unless the token is newer than the cached snapshot
+        cached = get_cached_profile(current_user_id, token_version)
+        if cached is None:
+            cached = _load_profile(current_user_id)
+            if cached is None:
+                return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
             'success': True,
-            'user': {
-                'id': str(user._id),
-                'name': user.name,
-                'email': user.email,
-                'photo_url': user.photo_url,
-                'bio': user.bio,
-                'skills_teach': user.skills_teach,
-                'skills_learn': user.skills_learn,
-                'availability': user.availability,
-                'is_public': user.is_public,
-                'badge_level': user.badge_level,
-                'total_sessions_taught': user.total_sessions_taught,
-                'rating': user.rating
-            }
+            'user': cached[1]
         }), 200
         
-    except Exception as e:
-        print(f"Token verification error: {str(e)}")
+    except Exception:
+        logger.exception("Token verification error")
         return jsonify({'error': 'Invalid token'}), 401
 
+def _load_profile(user_id):
+    """Read the profile from MongoDB and cache it; (version, snapshot) or None"""
+    user = User.find_by_id(user_id, fields=PROFILE_FIELDS)
+    if not user:
+        return None
+    snapshot = profile_snapshot(user)
+    cache_profile(user_id, user.version, snapshot)
+    return user.version, snapshot
+
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
     try:
-        # In a more sophisticated setup, you might want to blacklist the token
-        # For now, we'll just return success and let the frontend handle token removal
+        # Revoke this token until it would have expired anyway
+        claims = get_jwt()
+        revoke_token(claims['jti'], get_jwt_identity(), datetime.utcfromtimestamp(claims['exp']))
+        
         return jsonify({
             'success': True,
             'message': 'Logged out successfully'
         }), 200
         
-    except Exception as e:
-        print(f"Logout error: {str(e)}")
+    except Exception:
+        logger.exception("Logout error")
         return jsonify({'error': 'Logout failed'}), 500
 
 @auth_bp.route('/refresh', methods=['POST'])
@@ -297,20 +291,35 @@ def logout():
 def refresh():
     try:
         current_user_id = get_jwt_identity()
-        user = User.find_by_id(current_user_id)
+        token_version = get_jwt().get(PROFILE_VERSION_CLAIM)
         
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        cached = get_cached_profile(current_user_id, token_version)
+        if cached is None:
+            cached = _load_profile(current_user_id)
+            if cached is None:
+                return jsonify({'error': 'User not found'}), 404
         
-        # Create new access token
-        new_token = create_access_token(identity=str(user._id))
+        # Create new access token carrying the newest profile version we know of
+        new_token = issue_access_token(current_user_id, cached[0])
         
         return jsonify({
             'success': True,
             'token': new_token
         }), 200
         
-    except Exception as e:
-        print(f"Token refresh error: {str(e)}")
+    except Exception:
+        logger.exception("Token refresh error")
         return jsonify({'error': 'Token refresh failed'}), 500
 
+@auth_bp.route('/password-hasher/stats', methods=['GET'])
+@operator_required
+def password_hasher_stats():
+    try:
+        return jsonify({
+            'success': True,
+            'stats': password_hasher.stats()
+        }), 200
+        
+    except Exception:
+        logger.exception("Password hasher stats error")
+        return jsonify({'error': 'Failed to fetch password hasher stats'}), 500
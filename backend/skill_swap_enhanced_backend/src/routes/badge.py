@@ -1,8 +1,16 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from bson import ObjectId
-from src.models.user import get_db, User
+from src.models.user import get_db, User, ConcurrentModificationError
+from src.models.leaderboard import current_leaderboard
+from src.models.database import ANALYTICS_WORKLOAD
+from src.models.stats_rollups import (
+    get_global_rollup, get_monthly_leaders, get_month_snapshot, month_key, record_badge_change
+)
+
+logger = logging.getLogger(__name__)
 
 badge_bp = Blueprint('badge', __name__)
 
@@ -14,257 +22,215 @@ BADGE_THRESHOLDS = {
     'Platinum': 50
 }
 
+MAX_LEADERBOARD_PAGE = 100
+
+# Fields badge_info() reads
+BADGE_INFO_FIELDS = ['total_sessions_taught', 'badge_level', 'skills_teach', 'created_at']
+
 @badge_bp.route('/badges/leaderboard', methods=['GET'])
 def get_leaderboard():
     try:
-        db = get_db()
-        if db is None:
+        if get_db() is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get top users by sessions taught
-        pipeline = [
-            {
-                '$match': {
-                    'is_public': True,
-                    'total_sessions_taught': {'$gt': 0}
-                }
-            },
-            {
-                '$sort': {'total_sessions_taught': -1}
-            },
-            {
-                '$limit': 50
-            },
-            {
-                '$project': {
-                    'name': 1,
-                    'photo_url': 1,
-                    'total_sessions_taught': 1,
-                    'badge_level': 1,
-                    'rating': 1,
-                    'skills_teach': 1
-                }
-            }
-        ]
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = min(max(1, int(request.args.get('limit', 50))), MAX_LEADERBOARD_PAGE)
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
         
-        top_users = list(db.users.aggregate(pipeline))
+        # Served from the in-memory ranking instead of sorting the users collection
+        board = current_leaderboard()
+        leaderboard, total = board.page(offset, limit)
+        etag = board.etag(leaderboard, total)
         
-        # Format response
-        leaderboard = []
-        for i, user in enumerate(top_users):
-            user_data = {
-                '_id': str(user['_id']),
-                'rank': i + 1,
-                'name': user['name'],
-                'photo_url': user.get('photo_url', ''),
-                'total_sessions_taught': user['total_sessions_taught'],
-                'badge_level': user['badge_level'],
-                'rating': user.get('rating', 0.0),
-                'skills_teach': user.get('skills_teach', [])[:3]  # Show only first 3 skills
-            }
-            leaderboard.append(user_data)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        response = make_response(jsonify({
+            'success': True,
+            'leaderboard': leaderboard,
+            'total': total,
+            'offset': offset,
+            'version': etag
+        }), 200)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception:
+        logger.exception("Get leaderboard error")
+        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
+
+@badge_bp.route('/badges/leaderboard/rank/<user_id>', methods=['GET'])
+def get_leaderboard_rank(user_id):
+    try:
+        if get_db() is None:
+            return jsonify({'error': 'Database not available'}), 500
+        
+        rank, entry = current_leaderboard().rank_of(user_id)
+        if rank is None:
+            return jsonify({'error': 'User is not on the leaderboard'}), 404
         
         return jsonify({
             'success': True,
-            'leaderboard': leaderboard
+            'rank': rank,
+            'entry': entry
         }), 200
         
-    except Exception as e:
-        print(f"Get leaderboard error: {str(e)}")
-        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
+    except Exception:
+        logger.exception("Get leaderboard rank error")
+        return jsonify({'error': 'Failed to fetch leaderboard rank'}), 500
 
 @badge_bp.route('/badges/stats', methods=['GET'])
 def get_badge_stats():
     try:
-        db = get_db()
+        db = get_db(ANALYTICS_WORKLOAD)
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get badge distribution
-        pipeline = [
-            {
-                '$group': {
-                    '_id': '$badge_level',
-                    'count': {'$sum': 1}
-                }
-            }
-        ]
-        
-        badge_distribution = list(db.users.aggregate(pipeline))
-        
-        # Format badge distribution
-        distribution = {
-            'Bronze': 0,
-            'Silver': 0,
-            'Gold': 0,
-            'Platinum': 0
-        }
-        
-        for badge in badge_distribution:
-            if badge['_id'] in distribution:
-                distribution[badge['_id']] = badge['count']
-        
-        # Get total stats
-        total_users = db.users.count_documents({'is_public': True})
-        total_sessions = db.sessions.count_documents({'status': 'completed'})
+        # Counters are maintained at write time, so this is a rollup read
+        rollup = get_global_rollup(db)
         
         # Get most active users this month
-        from datetime import datetime, timedelta
-        start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        monthly_active_pipeline = [
-            {
-                '$match': {
-                    'scheduled_date': {'$gte': start_of_month},
-                    'status': 'completed'
-                }
-            },
-            {
-                '$group': {
-                    '_id': '$teacher_id',
-                    'sessions_this_month': {'$sum': 1}
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': '_id',
-                    'foreignField': '_id',
-                    'as': 'user'
-                }
-            },
-            {
-                '$unwind': '$user'
-            },
-            {
-                '$sort': {'sessions_this_month': -1}
-            },
-            {
-                '$limit': 5
-            }
-        ]
-        
-        monthly_active = list(db.sessions.aggregate(monthly_active_pipeline))
-        
-        # Format monthly active users
-        monthly_leaders = []
-        for user in monthly_active:
-            user_data = {
-                '_id': str(user['user']['_id']),
-                'name': user['user']['name'],
-                'photo_url': user['user'].get('photo_url', ''),
-                'sessions_this_month': user['sessions_this_month'],
-                'badge_level': user['user']['badge_level']
-            }
-            monthly_leaders.append(user_data)
+        monthly_leaders = get_monthly_leaders(db, month_key(datetime.utcnow()))
         
         return jsonify({
             'success': True,
             'stats': {
-                'badge_distribution': distribution,
-                'total_users': total_users,
-                'total_sessions': total_sessions,
+                'badge_distribution': rollup['badge_distribution'],
+                'total_users': rollup['total_users'],
+                'total_sessions': rollup['total_sessions'],
                 'monthly_leaders': monthly_leaders,
-                'badge_thresholds': BADGE_THRESHOLDS
+                'badge_thresholds': BADGE_THRESHOLDS,
+                'updated_at': rollup['updated_at']
             }
         }), 200
         
-    except Exception as e:
-        print(f"Get badge stats error: {str(e)}")
+    except Exception:
+        logger.exception("Get badge stats error")
         return jsonify({'error': 'Failed to fetch badge stats'}), 500
 
+@badge_bp.route('/badges/stats/monthly/<month>', methods=['GET'])
+def get_monthly_badge_stats(month):
+    try:
+        db = get_db(ANALYTICS_WORKLOAD)
+        if db is None:
+            return jsonify({'error': 'Database not available'}), 500
+        
+        # Validate month format (YYYY-MM)
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            return jsonify({'error': 'Month must be in YYYY-MM format'}), 400
+        
+        return jsonify({
+            'success': True,
+            'snapshot': get_month_snapshot(db, month)
+        }), 200
+        
+    except Exception:
+        logger.exception("Get monthly badge stats error")
+        return jsonify({'error': 'Failed to fetch monthly stats'}), 500
+
 @badge_bp.route('/badges/user/<user_id>', methods=['GET'])
 def get_user_badges(user_id):
     try:
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=BADGE_INFO_FIELDS)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Calculate progress to next badge
-        current_sessions = user.total_sessions_taught
-        current_badge = user.badge_level
-        
-        # Find next badge level
-        next_badge = None
-        sessions_to_next = 0
-        
-        badge_levels = ['Bronze', 'Silver', 'Gold', 'Platinum']
-        current_index = badge_levels.index(current_badge) if current_badge in badge_levels else 0
-        
-        if current_index < len(badge_levels) - 1:
-            next_badge = badge_levels[current_index + 1]
-            sessions_to_next = BADGE_THRESHOLDS[next_badge] - current_sessions
-        
-        # Get user's achievements
-        achievements = []
-        
-        # Basic achievements
-        if current_sessions >= 1:
-            achievements.append({
-                'title': 'First Session',
-                'description': 'Completed your first teaching session',
-                'icon': '🎯',
-                'earned_at': user.created_at
-            })
-        
-        if current_sessions >= 5:
-            achievements.append({
-                'title': 'Getting Started',
-                'description': 'Taught 5 sessions',
-                'icon': '🌟',
-                'earned_at': user.created_at
-            })
-        
-        if current_sessions >= 10:
-            achievements.append({
-                'title': 'Silver Teacher',
-                'description': 'Reached Silver badge level',
-                'icon': '🥈',
-                'earned_at': user.created_at
-            })
-        
-        if current_sessions >= 25:
-            achievements.append({
-                'title': 'Gold Teacher',
-                'description': 'Reached Gold badge level',
-                'icon': '🥇',
-                'earned_at': user.created_at
-            })
-        
-        if current_sessions >= 50:
-            achievements.append({
-                'title': 'Platinum Master',
-                'description': 'Reached Platinum badge level',
-                'icon': '💎',
-                'earned_at': user.created_at
-            })
-        
-        # Skill-based achievements
-        if len(user.skills_teach) >= 5:
-            achievements.append({
-                'title': 'Multi-Skilled',
-                'description': 'Teaching 5 or more skills',
-                'icon': '🎨',
-                'earned_at': user.created_at
-            })
-        
         return jsonify({
             'success': True,
-            'badge_info': {
-                'current_badge': current_badge,
-                'next_badge': next_badge,
-                'current_sessions': current_sessions,
-                'sessions_to_next': sessions_to_next,
-                'progress_percentage': min(100, (current_sessions / BADGE_THRESHOLDS.get(next_badge, current_sessions + 1)) * 100) if next_badge else 100,
-                'achievements': achievements,
-                'badge_thresholds': BADGE_THRESHOLDS
-            }
+            'badge_info': badge_info(user)
         }), 200
         
-    except Exception as e:
-        print(f"Get user badges error: {str(e)}")
+    except Exception:
+        logger.exception("Get user badges error")
         return jsonify({'error': 'Failed to fetch user badges'}), 500
 
+def badge_info(user):
+    """Badge progress and achievements for a user loaded with BADGE_INFO_FIELDS"""
+    # Calculate progress to next badge
+    current_sessions = user.total_sessions_taught
+    current_badge = user.badge_level
+    
+    # Find next badge level
+    next_badge = None
+    sessions_to_next = 0
+    
+    badge_levels = ['Bronze', 'Silver', 'Gold', 'Platinum']
+    current_index = badge_levels.index(current_badge) if current_badge in badge_levels else 0
+    
+    if current_index < len(badge_levels) - 1:
+        next_badge = badge_levels[current_index + 1]
+        sessions_to_next = BADGE_THRESHOLDS[next_badge] - current_sessions
+    
+    # Get user's achievements
+    achievements = []
+    
+    # Basic achievements
+    if current_sessions >= 1:
+        achievements.append({
+            'title': 'First Session',
+            'description': 'Completed your first teaching session',
+            'icon': '🎯',
+            'earned_at': user.created_at
+        })
+    
+    if current_sessions >= 5:
+        achievements.append({
+            'title': 'Getting Started',
+            'description': 'Taught 5 sessions',
+            'icon': '🌟',
+            'earned_at': user.created_at
+        })
+    
+    if current_sessions >= 10:
+        achievements.append({
+            'title': 'Silver Teacher',
+            'description': 'Reached Silver badge level',
+            'icon': '🥈',
+            'earned_at': user.created_at
+        })
+    
+    if current_sessions >= 25:
+        achievements.append({
+            'title': 'Gold Teacher',
+            'description': 'Reached Gold badge level',
+            'icon': '🥇',
+            'earned_at': user.created_at
+        })
+    
+    if current_sessions >= 50:
+        achievements.append({
+            'title': 'Platinum Master',
+            'description': 'Reached Platinum badge level',
+            'icon': '💎',
+            'earned_at': user.created_at
+        })
+    
+    # Skill-based achievements
+    if len(user.skills_teach) >= 5:
+        achievements.append({
+            'title': 'Multi-Skilled',
+            'description': 'Teaching 5 or more skills',
+            'icon': '🎨',
+            'earned_at': user.created_at
+        })
+    
+    return {
+        'current_badge': current_badge,
+        'next_badge': next_badge,
+        'current_sessions': current_sessions,
+        'sessions_to_next': sessions_to_next,
+        'progress_percentage': min(100, (current_sessions / BADGE_THRESHOLDS.get(next_badge, current_sessions + 1)) * 100) if next_badge else 100,
+        'achievements': achievements,
+        'badge_thresholds': BADGE_THRESHOLDS
+    }
+
 @badge_bp.route('/badges/update/<user_id>', methods=['POST'])
 @jwt_required()
 def update_user_badge(user_id):
@@ -275,17 +241,23 @@ def update_user_badge(user_id):
         if current_user_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=['total_sessions_taught', 'badge_level', 'version'])
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         # Update badge level based on sessions taught
         old_badge = user.badge_level
         user.update_badge_level()
-        user.save()
+        try:
+            # A session completion may be promoting the same badge right now
+            user.save(check_version=True)
+        except ConcurrentModificationError:
+            return jsonify({'error': 'Badge was updated concurrently, please retry'}), 409
         
         new_badge = user.badge_level
         badge_upgraded = old_badge != new_badge
+        if badge_upgraded:
+            record_badge_change(old_badge, new_badge)
         
         return jsonify({
             'success': True,
@@ -295,7 +267,7 @@ def update_user_badge(user_id):
             'badge_upgraded': badge_upgraded
         }), 200
         
-    except Exception as e:
-        print(f"Update user badge error: {str(e)}")
+    except Exception:
+        logger.exception("Update user badge error")
         return jsonify({'error': 'Failed to update badge'}), 500
 
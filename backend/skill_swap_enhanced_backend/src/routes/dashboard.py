@@ -0,0 +1,95 @@
+import logging
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import get_db, User
+from src.routes.badge import badge_info, BADGE_INFO_FIELDS
+from src.routes.user import user_stats, USER_STATS_FIELDS
+from src.routes.swap_request import list_sent_requests, list_received_requests
+from src.routes.session import list_upcoming_sessions
+from src.routes.notification import list_user_notifications
+from src.services.dashboard import section_runner, select_fields
+
+logger = logging.getLogger(__name__)
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+DASHBOARD_SECTIONS = (
+    'stats', 'badge_info', 'sent_requests', 'received_requests', 'upcoming_sessions', 'notifications'
+)
+
+# One users read serves every section built from the profile
+DASHBOARD_USER_FIELDS = sorted(set(BADGE_INFO_FIELDS) | set(USER_STATS_FIELDS))
+
+def _from_user(db, user_id, build):
+    def load(memo):
+        user = memo.get(('user', user_id), lambda: User.find_by_id(user_id, fields=DASHBOARD_USER_FIELDS))
+        return build(user) if user else None
+    return load
+
+def _section_loaders(db, user_id):
+    return {
+        'stats': _from_user(db, user_id, user_stats),
+        'badge_info': _from_user(db, user_id, badge_info),
+        'sent_requests': lambda memo: list_sent_requests(db, user_id),
+        'received_requests': lambda memo: list_received_requests(db, user_id),
+        'upcoming_sessions': lambda memo: list_upcoming_sessions(db, user_id),
+        'notifications': lambda memo: list_user_notifications(db, user_id)
+    }
+
+def _parse_fields(value):
+    """{section: [field, ...]} from 'section.field,section.field'"""
+    fields = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        section, _, field = item.partition('.')
+        if section not in DASHBOARD_SECTIONS or not field:
+            raise ValueError(item)
+        fields.setdefault(section, []).append(field)
+    return fields
+
+@dashboard_bp.route('/dashboard/<user_id>', methods=['GET'])
+@jwt_required()
+def get_dashboard(user_id):
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Check if user is requesting their own dashboard
+        if current_user_id != user_id:
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        sections = DASHBOARD_SECTIONS
+        if request.args.get('sections'):
+            sections = [section.strip() for section in request.args['sections'].split(',') if section.strip()]
+            if any(section not in DASHBOARD_SECTIONS for section in sections):
+                return jsonify({'error': f"sections must be from: {', '.join(DASHBOARD_SECTIONS)}"}), 400
+
+        # Optional per-section field selection, e.g. fields=notifications.title,stats.badge_level
+        try:
+            fields = _parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid field {e}, expected section.field'}), 400
+
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Database not available'}), 500
+
+        # Sections run concurrently, so the response takes as long as the slowest one
+        loaders = _section_loaders(db, user_id)
+        results, errors = section_runner.run({section: loaders[section] for section in sections})
+
+        response = {
+            'success': True,
+            'dashboard': {
+                section: select_fields(results[section], fields.get(section))
+                for section in sections if section in results
+            }
+        }
+        if errors:
+            response['errors'] = errors
+        return jsonify(response), 200
+
+    except Exception:
+        logger.exception("Get dashboard error")
+        return jsonify({'error': 'Failed to load dashboard'}), 500
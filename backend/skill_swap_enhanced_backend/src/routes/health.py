@@ -0,0 +1,67 @@
+import logging
+from flask import Blueprint, request, jsonify, Response
+from src.models.operator_auth import operator_required
+from src.models import user as user_model
+from src.models.database import pool_health, database_stats
+from src.services.metrics import render_metrics, CONTENT_TYPE
+from src.services.tracing import recent_traces
+
+logger = logging.getLogger(__name__)
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz', methods=['GET'])
+def liveness():
+    # The process is up; dependencies are checked by /readyz
+    return jsonify({'status': 'ok'}), 200
+
+@health_bp.route('/readyz', methods=['GET'])
+def readiness():
+    try:
+        healthy, report = pool_health(user_model.client)
+        # Finishes index setup skipped because MongoDB was down at boot
+        if healthy and not user_model.ensure_db_setup():
+            healthy = False
+            report['checks']['setup'] = 'Database setup pending'
+        report['status'] = 'ok' if healthy else 'unavailable'
+        return jsonify(report), 200 if healthy else 503
+
+    except Exception:
+        logger.exception("Readiness check error")
+        return jsonify({'status': 'unavailable', 'error': 'Readiness check failed'}), 503
+
+@health_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Per-process values; scrape every worker, or run one worker per scrape target
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+@health_bp.route('/api/database/stats', methods=['GET'])
+@operator_required
+def get_database_stats():
+    try:
+        return jsonify({
+            'success': True,
+            'stats': database_stats()
+        }), 200
+
+    except Exception:
+        logger.exception("Database stats error")
+        return jsonify({'error': 'Failed to fetch database stats'}), 500
+
+@health_bp.route('/api/traces', methods=['GET'])
+@operator_required
+def get_recent_traces():
+    try:
+        try:
+            limit = min(int(request.args.get('limit', 20)), 200)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+
+        return jsonify({
+            'success': True,
+            'traces': recent_traces(limit)
+        }), 200
+
+    except Exception:
+        logger.exception("Get traces error")
+        return jsonify({'error': 'Failed to fetch traces'}), 500
@@ -1,44 +1,20 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
+from datetime import datetime
 from bson import ObjectId
-import smtplib
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
+from pymongo.errors import DuplicateKeyError
 import os
 from src.models.user import get_db, User
+from src.services.mail_queue import enqueue_email
+from src.services.scheduler import run_job
+
+logger = logging.getLogger(__name__)
 
 notification_bp = Blueprint('notification', __name__)
 
-# Email configuration
-EMAIL_ID = os.getenv('EMAIL_ID')
-APP_PASSWORD = os.getenv('APP_PASSWORD')
-
-def send_email(to_email, subject, body):
-    """Send email notification"""
-    try:
-        if not EMAIL_ID or not APP_PASSWORD:
-            print("Email credentials not configured")
-            return False
-        
-        msg = MimeMultipart()
-        msg['From'] = EMAIL_ID
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MimeText(body, 'html'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_ID, APP_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_ID, to_email, text)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Email sending error: {str(e)}")
-        return False
+# Shared secret for external reminder triggers; unset keeps the endpoint open
+SCHEDULER_TRIGGER_TOKEN = os.getenv('SCHEDULER_TRIGGER_TOKEN')
 
 @notification_bp.route('/notifications/user/<user_id>', methods=['GET'])
 @jwt_required()
@@ -54,34 +30,38 @@ def get_user_notifications(user_id):
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get user notifications
-        notifications = list(db.notifications.find(
-            {'user_id': ObjectId(user_id)}
-        ).sort('created_at', -1).limit(50))
-        
-        # Format response
-        formatted_notifications = []
-        for notification in notifications:
-            formatted_notification = {
-                '_id': str(notification['_id']),
-                'type': notification['type'],
-                'title': notification['title'],
-                'message': notification['message'],
-                'read': notification.get('read', False),
-                'created_at': notification['created_at'],
-                'data': notification.get('data', {})
-            }
-            formatted_notifications.append(formatted_notification)
-        
         return jsonify({
             'success': True,
-            'notifications': formatted_notifications
+            'notifications': list_user_notifications(db, user_id)
         }), 200
         
-    except Exception as e:
-        print(f"Get user notifications error: {str(e)}")
+    except Exception:
+        logger.exception("Get user notifications error")
         return jsonify({'error': 'Failed to fetch notifications'}), 500
 
+def list_user_notifications(db, user_id):
+    """The user's 50 most recent notifications, newest first"""
+    # Get user notifications
+    notifications = list(db.notifications.find(
+        {'user_id': ObjectId(user_id)}
+    ).sort('created_at', -1).limit(50))
+    
+    # Format response
+    formatted_notifications = []
+    for notification in notifications:
+        formatted_notification = {
+            '_id': str(notification['_id']),
+            'type': notification['type'],
+            'title': notification['title'],
+            'message': notification['message'],
+            'read': notification.get('read', False),
+            'created_at': notification['created_at'],
+            'data': notification.get('data', {})
+        }
+        formatted_notifications.append(formatted_notification)
+    
+    return formatted_notifications
+
 @notification_bp.route('/notifications/<notification_id>/read', methods=['PUT'])
 @jwt_required()
 def mark_notification_read(notification_id):
@@ -115,8 +95,8 @@ def mark_notification_read(notification_id):
         else:
             return jsonify({'error': 'Failed to mark notification as read'}), 500
             
-    except Exception as e:
-        print(f"Mark notification read error: {str(e)}")
+    except Exception:
+        logger.exception("Mark notification read error")
         return jsonify({'error': 'Failed to mark notification as read'}), 500
 
 @notification_bp.route('/notifications/mark-all-read', methods=['PUT'])
@@ -140,8 +120,8 @@ def mark_all_notifications_read():
             'message': f'{result.modified_count} notifications marked as read'
         }), 200
         
-    except Exception as e:
-        print(f"Mark all notifications read error: {str(e)}")
+    except Exception:
+        logger.exception("Mark all notifications read error")
         return jsonify({'error': 'Failed to mark notifications as read'}), 500
 
 @notification_bp.route('/notifications/send', methods=['POST'])
@@ -157,7 +137,7 @@ def send_notification():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Check if target user exists
-        target_user = User.find_by_id(data['user_id'])
+        target_user = User.find_by_id(data['user_id'], fields=['email', 'notification_preferences'])
         if not target_user:
             return jsonify({'error': 'Target user not found'}), 404
         
@@ -176,9 +156,13 @@ def send_notification():
             'data': data.get('data', {})
         }
         
-        result = db.notifications.insert_one(notification_data)
+        try:
+            result = db.notifications.insert_one(notification_data)
+        except DuplicateKeyError:
+            return jsonify({'error': 'A reminder for this session was already sent'}), 409
         
-        # Send email notification if user has email notifications enabled
+        # Queue an email if user has email notifications enabled
+        email_id = None
         if (target_user.notification_preferences.get('email_notifications', True) and 
             data['type'] in ['session_reminder', 'new_request', 'request_accepted']):
             
@@ -197,150 +181,49 @@ def send_notification():
             </html>
             """
             
-            send_email(target_user.email, email_subject, email_body)
+            email_id = enqueue_email(target_user.email, email_subject, email_body)
         
         if result.inserted_id:
             return jsonify({
                 'success': True,
                 'message': 'Notification sent successfully',
-                'notification_id': str(result.inserted_id)
+                'notification_id': str(result.inserted_id),
+                'email_id': str(email_id) if email_id else None
             }), 201
         else:
             return jsonify({'error': 'Failed to send notification'}), 500
             
-    except Exception as e:
-        print(f"Send notification error: {str(e)}")
+    except Exception:
+        logger.exception("Send notification error")
         return jsonify({'error': 'Failed to send notification'}), 500
 
 @notification_bp.route('/notifications/session-reminders', methods=['POST'])
 def send_session_reminders():
-    """Send reminders for upcoming sessions (to be called by a cron job)"""
+    """Trigger the 24h reminder job now (the built-in scheduler also runs it)"""
     try:
-        db = get_db()
-        if db is None:
-            return jsonify({'error': 'Database not available'}), 500
+        # When a trigger token is configured, external callers must present it
+        if SCHEDULER_TRIGGER_TOKEN and request.headers.get('X-Scheduler-Token') != SCHEDULER_TRIGGER_TOKEN:
+            return jsonify({'error': 'Unauthorized'}), 401
         
-        # Find sessions starting in the next 24 hours
-        now = datetime.utcnow()
-        tomorrow = now + timedelta(hours=24)
-        
-        upcoming_sessions = list(db.sessions.find({
-            'scheduled_date': {'$gte': now, '$lte': tomorrow},
-            'status': 'scheduled'
-        }))
+        if get_db() is None:
+            return jsonify({'error': 'Database not available'}), 500
         
-        reminders_sent = 0
+        run = run_job('session_reminders_24h', trigger='api')
+        if run is None:
+            return jsonify({'error': 'Session reminders are already running'}), 409
         
-        for session in upcoming_sessions:
-            # Get teacher and student details
-            teacher = User.find_by_id(str(session['teacher_id']))
-            student = User.find_by_id(str(session['student_id']))
-            
-            if not teacher or not student:
-                continue
-            
-            # Check if reminder already sent
-            existing_reminder = db.notifications.find_one({
-                'user_id': {'$in': [session['teacher_id'], session['student_id']]},
-                'type': 'session_reminder',
-                'data.session_id': str(session['_id'])
-            })
-            
-            if existing_reminder:
-                continue
-            
-            # Create reminder message
-            session_time = session['scheduled_date'].strftime('%Y-%m-%d at %H:%M UTC')
-            
-            # Send reminder to teacher
-            if teacher.notification_preferences.get('session_reminders', True):
-                teacher_notification = {
-                    'user_id': session['teacher_id'],
-                    'type': 'session_reminder',
-                    'title': 'Upcoming Teaching Session',
-                    'message': f'You have a session to teach "{session["skill"]}" to {student.name} on {session_time}',
-                    'read': False,
-                    'created_at': datetime.utcnow(),
-                    'data': {
-                        'session_id': str(session['_id']),
-                        'participant_name': student.name,
-                        'skill': session['skill']
-                    }
-                }
-                db.notifications.insert_one(teacher_notification)
-                
-                # Send email
-                if teacher.notification_preferences.get('email_notifications', True):
-                    email_subject = "SkillSwap: Upcoming Teaching Session"
-                    email_body = f"""
-                    <html>
-                    <body>
-                        <h2>Session Reminder</h2>
-                        <p>Hi {teacher.name},</p>
-                        <p>You have an upcoming teaching session:</p>
-                        <ul>
-                            <li><strong>Skill:</strong> {session['skill']}</li>
-                            <li><strong>Student:</strong> {student.name}</li>
-                            <li><strong>Date & Time:</strong> {session_time}</li>
-                            <li><strong>Duration:</strong> {session['duration']} minutes</li>
-                        </ul>
-                        {f'<p><strong>Meeting Link:</strong> <a href="{session["meeting_link"]}">{session["meeting_link"]}</a></p>' if session.get('meeting_link') else ''}
-                        <p>Best regards,<br>The SkillSwap Team</p>
-                    </body>
-                    </html>
-                    """
-                    send_email(teacher.email, email_subject, email_body)
-                
-                reminders_sent += 1
-            
-            # Send reminder to student
-            if student.notification_preferences.get('session_reminders', True):
-                student_notification = {
-                    'user_id': session['student_id'],
-                    'type': 'session_reminder',
-                    'title': 'Upcoming Learning Session',
-                    'message': f'You have a session to learn "{session["skill"]}" from {teacher.name} on {session_time}',
-                    'read': False,
-                    'created_at': datetime.utcnow(),
-                    'data': {
-                        'session_id': str(session['_id']),
-                        'participant_name': teacher.name,
-                        'skill': session['skill']
-                    }
-                }
-                db.notifications.insert_one(student_notification)
-                
-                # Send email
-                if student.notification_preferences.get('email_notifications', True):
-                    email_subject = "SkillSwap: Upcoming Learning Session"
-                    email_body = f"""
-                    <html>
-                    <body>
-                        <h2>Session Reminder</h2>
-                        <p>Hi {student.name},</p>
-                        <p>You have an upcoming learning session:</p>
-                        <ul>
-                            <li><strong>Skill:</strong> {session['skill']}</li>
-                            <li><strong>Teacher:</strong> {teacher.name}</li>
-                            <li><strong>Date & Time:</strong> {session_time}</li>
-                            <li><strong>Duration:</strong> {session['duration']} minutes</li>
-                        </ul>
-                        {f'<p><strong>Meeting Link:</strong> <a href="{session["meeting_link"]}">{session["meeting_link"]}</a></p>' if session.get('meeting_link') else ''}
-                        <p>Best regards,<br>The SkillSwap Team</p>
-                    </body>
-                    </html>
-                    """
-                    send_email(student.email, email_subject, email_body)
-                
-                reminders_sent += 1
+        if run['status'] != 'succeeded':
+            return jsonify({'error': 'Failed to send session reminders'}), 500
         
         return jsonify({
             'success': True,
-            'message': f'{reminders_sent} session reminders sent'
+            'message': f"{run['metrics']['reminders_created']} session reminders sent",
+            'run_id': str(run['_id']),
+            'metrics': run['metrics']
         }), 200
         
-    except Exception as e:
-        print(f"Send session reminders error: {str(e)}")
+    except Exception:
+        logger.exception("Send session reminders error")
         return jsonify({'error': 'Failed to send session reminders'}), 500
 
 @notification_bp.route('/notifications/preferences/<user_id>', methods=['PUT'])
@@ -353,7 +236,7 @@ def update_notification_preferences(user_id):
         if current_user_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=['notification_preferences'])
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -370,7 +253,7 @@ def update_notification_preferences(user_id):
             'preferences': user.notification_preferences
         }), 200
         
-    except Exception as e:
-        print(f"Update notification preferences error: {str(e)}")
+    except Exception:
+        logger.exception("Update notification preferences error")
         return jsonify({'error': 'Failed to update notification preferences'}), 500
 
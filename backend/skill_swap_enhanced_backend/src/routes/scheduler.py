@@ -0,0 +1,49 @@
+import logging
+from flask import Blueprint, request, jsonify
+from src.models.operator_auth import operator_required
+from src.services.scheduler import JOBS, get_job_runs
+
+logger = logging.getLogger(__name__)
+
+scheduler_bp = Blueprint('scheduler', __name__)
+
+@scheduler_bp.route('/scheduler/runs', methods=['GET'])
+@operator_required
+def get_scheduler_runs():
+    try:
+        job = request.args.get('job')
+        if job and job not in JOBS:
+            return jsonify({'error': 'Unknown job'}), 404
+        
+        try:
+            limit = min(int(request.args.get('limit', 50)), 200)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        runs = get_job_runs(job=job, limit=limit)
+        
+        # Format response
+        formatted_runs = []
+        for run in runs:
+            formatted_runs.append({
+                '_id': str(run['_id']),
+                'job': run['job'],
+                'trigger': run.get('trigger'),
+                'owner': run.get('owner'),
+                'status': run['status'],
+                'started_at': run['started_at'],
+                'finished_at': run.get('finished_at'),
+                'duration_seconds': run.get('duration_seconds'),
+                'metrics': run.get('metrics'),
+                'error': run.get('error')
+            })
+        
+        return jsonify({
+            'success': True,
+            'jobs': sorted(JOBS),
+            'runs': formatted_runs
+        }), 200
+        
+    except Exception:
+        logger.exception("Get scheduler runs error")
+        return jsonify({'error': 'Failed to fetch scheduler runs'}), 500
@@ -1,8 +1,29 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from contextlib import nullcontext
 from bson import ObjectId
+from bson.errors import InvalidId
 from src.models.user import get_db, User
+from src.models.session_accounting import complete_sessions, MAX_BULK_COMPLETE
+from src.models.session_history import (
+    find_user_sessions, DEFAULT_SESSION_PAGE_SIZE, SESSION_STATUSES
+)
+from src.models.session_buckets import (
+    sync_sessions, index_sessions, reindex_session_ids, calendar_entries, busy_blocks, free_blocks, utc_naive, CALENDAR_MAX_DAYS
+)
+from src.models.scheduling import (
+    find_conflicts, outside_availability, suggest_mutual_slots, participant_locks, MAX_SESSION_MINUTES,
+    DEFAULT_SUGGESTION_COUNT, MAX_SUGGESTION_COUNT, DEFAULT_SUGGESTION_DAYS, DEFAULT_SLOT_STEP_MINUTES
+)
+from src.models.locks import LockBusy
+from src.models.participant_snapshots import (
+    build_snapshot, fill_missing_snapshots, participant_view, SNAPSHOT_SOURCE_FIELDS
+)
+from src.services.tracing import start_span
+
+logger = logging.getLogger(__name__)
 
 session_bp = Blueprint('session', __name__)
 
@@ -20,7 +41,9 @@ def create_session():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Check if participant exists
-        participant = User.find_by_id(data['participant_id'])
+        participant = User.find_by_id(
+            data['participant_id'], fields=list(SNAPSHOT_SOURCE_FIELDS) + ['availability_schedule']
+        )
         if not participant:
             return jsonify({'error': 'Participant not found'}), 404
         
@@ -38,14 +61,41 @@ def create_session():
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
         
+        try:
+            duration = int(data['duration'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'duration must be a number of minutes'}), 400
+        if not 0 < duration <= MAX_SESSION_MINUTES:
+            return jsonify({'error': f'duration must be between 1 and {MAX_SESSION_MINUTES} minutes'}), 400
+        
+        start = utc_naive(scheduled_date)
+        end = start + timedelta(minutes=duration)
+        participant_ids = [current_user_id, data['participant_id']]
+        
+        teacher = User.find_by_id(current_user_id, fields=list(SNAPSHOT_SOURCE_FIELDS) + ['availability_schedule'])
+        if not teacher:
+            return jsonify({'error': 'User not found'}), 404
+        unavailable = outside_availability({
+            current_user_id: teacher.availability_schedule,
+            data['participant_id']: participant.availability_schedule
+        }, start, end)
+        if unavailable:
+            return jsonify({
+                'error': 'Session is outside the availability of a participant',
+                'user_ids': unavailable
+            }), 409
+        
         # Create session
         session_data = {
             'teacher_id': ObjectId(current_user_id),
             'student_id': ObjectId(data['participant_id']),
+            # Shown by the session lists without a join (see participant_snapshots)
+            'teacher': build_snapshot(teacher.to_dict()),
+            'student': build_snapshot(participant.to_dict()),
             'skill': data['skill'],
             'description': data.get('description', ''),
             'scheduled_date': scheduled_date,
-            'duration': int(data['duration']),  # Duration in minutes
+            'duration': duration,  # Duration in minutes
             'status': 'scheduled',  # scheduled, completed, cancelled, missed
             'meeting_link': data.get('meeting_link', ''),
             'notes': data.get('notes', ''),
@@ -53,7 +103,20 @@ def create_session():
             'updated_at': datetime.utcnow()
         }
         
-        result = db.sessions.insert_one(session_data)
+        # The overlap check and the write that makes the session visible to it
+        # happen under both participants' locks, so concurrent creates serialize
+        with participant_locks(db, participant_ids):
+            conflicts = find_conflicts(db, participant_ids, start, end)
+            if conflicts:
+                return _conflict_response(conflicts)
+            
+            result = db.sessions.insert_one(session_data)
+            try:
+                index_sessions(db, [session_data])
+            except Exception:
+                # Unindexed, the session would be invisible to the next check
+                db.sessions.delete_one({'_id': result.inserted_id})
+                raise
         
         if result.inserted_id:
             return jsonify({
@@ -64,10 +127,41 @@ def create_session():
         else:
             return jsonify({'error': 'Failed to schedule session'}), 500
             
-    except Exception as e:
-        print(f"Create session error: {str(e)}")
+    except LockBusy as e:
+        return _schedule_busy_response(e)
+    except Exception:
+        logger.exception("Create session error")
         return jsonify({'error': 'Failed to schedule session'}), 500
 
+def _restore_session(db, session, update_data):
+    """Put back the fields an update changed, as they were in `session`.
+
+    updated_at keeps the new time, so the reconcile job re-buckets the
+    restored session if the failed re-index left its buckets half-written.
+    """
+    fields = [field for field in update_data if field != 'updated_at']
+    restore = {field: session[field] for field in fields if field in session}
+    missing = {field: '' for field in fields if field not in session}
+    update = {'$set': restore}
+    if missing:
+        update['$unset'] = missing
+    db.sessions.update_one({'_id': session['_id']}, update)
+
+def _schedule_busy_response(error):
+    response = jsonify({'error': 'Another session is being scheduled for a participant, please retry'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def _conflict_response(conflicts):
+    return jsonify({
+        'error': 'Session overlaps an existing session',
+        # Only the blocked time, so the other participant's sessions stay private
+        'conflicts': [
+            {'user_id': str(user_id), 'start': entry['start'], 'end': entry['end']}
+            for user_id, entry in conflicts
+        ]
+    }), 409
+
 @session_bp.route('/sessions/user/<user_id>', methods=['GET'])
 @jwt_required()
 def get_user_sessions(user_id):
@@ -82,81 +176,212 @@ def get_user_sessions(user_id):
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get sessions where user is either teacher or student
-        pipeline = [
-            {
-                '$match': {
-                    '$or': [
-                        {'teacher_id': ObjectId(user_id)},
-                        {'student_id': ObjectId(user_id)}
-                    ]
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'teacher_id',
-                    'foreignField': '_id',
-                    'as': 'teacher'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'student_id',
-                    'foreignField': '_id',
-                    'as': 'student'
-                }
-            },
-            {
-                '$unwind': '$teacher'
-            },
-            {
-                '$unwind': '$student'
-            },
-            {
-                '$sort': {'scheduled_date': -1}
-            }
-        ]
+        after = request.args.get('after') or None
+        
+        try:
+            limit = int(request.args.get('limit', DEFAULT_SESSION_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        # Optional date range [from, to) and status filters
+        try:
+            start = _parse_date_param('from')
+            end = _parse_date_param('to')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        statuses = None
+        if request.args.get('status'):
+            statuses = [status.strip() for status in request.args['status'].split(',') if status.strip()]
+            if any(status not in SESSION_STATUSES for status in statuses):
+                return jsonify({'error': f"status must be one of: {', '.join(SESSION_STATUSES)}"}), 400
         
-        sessions = list(db.sessions.aggregate(pipeline))
+        # One page of sessions where the user is either teacher or student
+        try:
+            with start_span('sessions.find'):
+                sessions, next_cursor = find_user_sessions(
+                    db, user_id, limit=limit, after=after, start=start, end=end, statuses=statuses
+                )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         # Format response
-        formatted_sessions = []
-        for session in sessions:
-            formatted_session = {
-                '_id': str(session['_id']),
-                'teacher': {
-                    '_id': str(session['teacher']['_id']),
-                    'name': session['teacher']['name'],
-                    'photo_url': session['teacher'].get('photo_url', '')
-                },
-                'student': {
-                    '_id': str(session['student']['_id']),
-                    'name': session['student']['name'],
-                    'photo_url': session['student'].get('photo_url', '')
-                },
-                'skill': session['skill'],
-                'description': session['description'],
-                'scheduled_date': session['scheduled_date'],
-                'duration': session['duration'],
-                'status': session['status'],
-                'meeting_link': session['meeting_link'],
-                'notes': session['notes'],
-                'created_at': session['created_at'],
-                'updated_at': session['updated_at']
-            }
-            formatted_sessions.append(formatted_session)
+        with start_span('sessions.format', count=len(sessions)):
+            formatted_sessions = [_format_history_session(session) for session in sessions]
         
         return jsonify({
             'success': True,
-            'sessions': formatted_sessions
+            'sessions': formatted_sessions,
+            'next_cursor': next_cursor
         }), 200
         
-    except Exception as e:
-        print(f"Get user sessions error: {str(e)}")
+    except Exception:
+        logger.exception("Get user sessions error")
         return jsonify({'error': 'Failed to fetch sessions'}), 500
 
+def _parse_date_param(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    # Stored dates are naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _format_history_session(session):
+    return {
+        '_id': str(session['_id']),
+        'teacher': participant_view(session, 'teacher_id', 'teacher'),
+        'student': participant_view(session, 'student_id', 'student'),
+        'skill': session['skill'],
+        'description': session['description'],
+        'scheduled_date': session['scheduled_date'],
+        'duration': session['duration'],
+        'status': session['status'],
+        'meeting_link': session['meeting_link'],
+        'notes': session['notes'],
+        'created_at': session['created_at'],
+        'updated_at': session['updated_at']
+    }
+
+@session_bp.route('/sessions/calendar', methods=['GET'])
+@jwt_required()
+def get_calendar():
+    try:
+        current_user_id = get_jwt_identity()
+        
+        try:
+            start = _parse_date_param('from')
+            end = _parse_date_param('to')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        if start is None or end is None:
+            return jsonify({'error': 'from and to are required'}), 400
+        if end <= start:
+            return jsonify({'error': 'to must be after from'}), 400
+        if end - start > timedelta(days=CALENDAR_MAX_DAYS):
+            return jsonify({'error': f'At most {CALENDAR_MAX_DAYS} days can be requested at once'}), 400
+        
+        other_user_id = request.args.get('with')
+        if other_user_id is not None:
+            if not ObjectId.is_valid(other_user_id):
+                return jsonify({'error': 'Invalid user id'}), 400
+            if other_user_id == current_user_id:
+                return jsonify({'error': 'Cannot compare a calendar with itself'}), 400
+        try:
+            min_minutes = max(1, int(request.args.get('min_minutes', 30)))
+        except ValueError:
+            return jsonify({'error': 'min_minutes must be an integer'}), 400
+        
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Database not available'}), 500
+        
+        entries = calendar_entries(db, current_user_id, start, end)
+        counterpart_ids = list({entry['with_id'] for entry in entries})
+        names = {
+            user['_id']: user.get('name')
+            for user in db.users.find({'_id': {'$in': counterpart_ids}}, {'name': 1})
+        } if counterpart_ids else {}
+        
+        calendar = {
+            'from': start,
+            'to': end,
+            'sessions': [{
+                'session_id': str(entry['session_id']),
+                'start': entry['start'],
+                'end': entry['end'],
+                'status': entry['status'],
+                'skill': entry['skill'],
+                'role': entry['role'],
+                'with': {'_id': str(entry['with_id']), 'name': names.get(entry['with_id'])}
+            } for entry in entries]
+        }
+        
+        # Free/busy only: the other user's sessions are not disclosed
+        if other_user_id is not None:
+            busy = busy_blocks(entries)
+            other_busy = busy_blocks(calendar_entries(db, other_user_id, start, end))
+            free = free_blocks([busy, other_busy], start, end, timedelta(minutes=min_minutes))
+            calendar.update({
+                'busy': {
+                    current_user_id: [{'start': s, 'end': e} for s, e in busy],
+                    other_user_id: [{'start': s, 'end': e} for s, e in other_busy]
+                },
+                'free': [{'start': s, 'end': e} for s, e in free]
+            })
+        
+        return jsonify(calendar), 200
+        
+    except Exception:
+        logger.exception("Get calendar error")
+        return jsonify({'error': 'Failed to fetch calendar'}), 500
+
+@session_bp.route('/sessions/suggestions', methods=['GET'])
+@jwt_required()
+def get_slot_suggestions():
+    try:
+        current_user_id = get_jwt_identity()
+        
+        other_user_id = request.args.get('with')
+        if not other_user_id or not ObjectId.is_valid(other_user_id):
+            return jsonify({'error': 'with must be a user id'}), 400
+        if other_user_id == current_user_id:
+            return jsonify({'error': 'Cannot schedule session with yourself'}), 400
+        
+        try:
+            duration = int(request.args.get('duration', 60))
+            count = int(request.args.get('count', DEFAULT_SUGGESTION_COUNT))
+            step = int(request.args.get('step', DEFAULT_SLOT_STEP_MINUTES))
+        except ValueError:
+            return jsonify({'error': 'duration, count and step must be integers'}), 400
+        if not 0 < duration <= MAX_SESSION_MINUTES:
+            return jsonify({'error': f'duration must be between 1 and {MAX_SESSION_MINUTES} minutes'}), 400
+        count = max(1, min(count, MAX_SUGGESTION_COUNT))
+        step = max(5, min(step, 24 * 60))
+        
+        try:
+            start = _parse_date_param('from')
+            end = _parse_date_param('to')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        now = datetime.utcnow()
+        start = max(start or now, now)
+        end = end or start + timedelta(days=DEFAULT_SUGGESTION_DAYS)
+        if end <= start:
+            return jsonify({'error': 'to must be after from'}), 400
+        if end - start > timedelta(days=CALENDAR_MAX_DAYS):
+            return jsonify({'error': f'At most {CALENDAR_MAX_DAYS} days can be searched at once'}), 400
+        
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Database not available'}), 500
+        
+        schedules = {
+            str(user['_id']): user.get('availability_schedule')
+            for user in db.users.find(
+                {'_id': {'$in': [ObjectId(current_user_id), ObjectId(other_user_id)]}},
+                {'availability_schedule': 1}
+            )
+        }
+        if other_user_id not in schedules:
+            return jsonify({'error': 'User not found'}), 404
+        schedules.setdefault(current_user_id, None)
+        
+        slots = suggest_mutual_slots(
+            db, schedules, start, end, timedelta(minutes=duration), count, timedelta(minutes=step)
+        )
+        
+        return jsonify({
+            'duration': duration,
+            'slots': [{'start': slot_start, 'end': slot_end} for slot_start, slot_end in slots]
+        }), 200
+        
+    except Exception:
+        logger.exception("Get slot suggestions error")
+        return jsonify({'error': 'Failed to suggest slots'}), 500
+
 @session_bp.route('/sessions/<session_id>', methods=['PUT'])
 @jwt_required()
 def update_session(session_id):
@@ -193,27 +418,67 @@ def update_session(session_id):
                 else:
                     update_data[field] = data[field]
         
-        # Update session
-        result = db.sessions.update_one(
-            {'_id': ObjectId(session_id)},
-            {'$set': update_data}
+        if 'duration' in update_data:
+            try:
+                update_data['duration'] = int(update_data['duration'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'duration must be a number of minutes'}), 400
+            if not 0 < update_data['duration'] <= MAX_SESSION_MINUTES:
+                return jsonify({'error': f'duration must be between 1 and {MAX_SESSION_MINUTES} minutes'}), 400
+        
+        # A session that is (again) scheduled must not overlap either participant's
+        # other sessions: checked on a new time, and when it comes back from
+        # another status such as cancelled
+        rescheduled = 'scheduled_date' in update_data or 'duration' in update_data
+        needs_check = update_data.get('status', session['status']) == 'scheduled' and (
+            rescheduled or session['status'] != 'scheduled'
         )
+        participant_ids = [session['teacher_id'], session['student_id']]
+        
+        if needs_check:
+            start = utc_naive(update_data.get('scheduled_date', session['scheduled_date']))
+            end = start + timedelta(minutes=int(update_data.get('duration', session['duration'])))
+            schedules = {
+                str(user['_id']): user.get('availability_schedule')
+                for user in db.users.find({'_id': {'$in': participant_ids}}, {'availability_schedule': 1})
+            }
+            unavailable = outside_availability(schedules, start, end)
+            if unavailable:
+                return jsonify({
+                    'error': 'Session is outside the availability of a participant',
+                    'user_ids': unavailable
+                }), 409
+        
+        with participant_locks(db, participant_ids) if needs_check else nullcontext():
+            if needs_check:
+                conflicts = find_conflicts(db, participant_ids, start, end, exclude_id=session['_id'])
+                if conflicts:
+                    return _conflict_response(conflicts)
+            
+            # Completion goes through the accounting path so the session is counted exactly once
+            completing = update_data.get('status') == 'completed'
+            if completing:
+                del update_data['status']
+            
+            # Update session
+            result = db.sessions.update_one(
+                {'_id': ObjectId(session_id)},
+                {'$set': update_data}
+            )
+            
+            # Re-bucketed before the locks are released, so the next check sees the new time
+            if result.modified_count > 0 and not completing and {'scheduled_date', 'duration', 'status'} & set(update_data):
+                try:
+                    reindex_session_ids(db, [session['_id']])
+                except Exception:
+                    # Unindexed, the new time would be invisible to the next check
+                    _restore_session(db, session, update_data)
+                    raise
         
         if result.modified_count > 0:
             # If session is marked as completed, update user stats
-            if data.get('status') == 'completed':
-                # Update teacher's session count
-                teacher = User.find_by_id(str(session['teacher_id']))
-                if teacher:
-                    teacher.total_sessions_taught += 1
-                    teacher.update_badge_level()
-                    teacher.save()
-                
-                # Update student's session count
-                student = User.find_by_id(str(session['student_id']))
-                if student:
-                    student.total_sessions_attended += 1
-                    student.save()
+            if completing:
+                complete_sessions(db, [session['_id']])
             
             return jsonify({
                 'success': True,
@@ -222,10 +487,65 @@ def update_session(session_id):
         else:
             return jsonify({'error': 'Failed to update session'}), 500
             
-    except Exception as e:
-        print(f"Update session error: {str(e)}")
+    except LockBusy as e:
+        return _schedule_busy_response(e)
+    except Exception:
+        logger.exception("Update session error")
         return jsonify({'error': 'Failed to update session'}), 500
 
+@session_bp.route('/sessions/complete', methods=['POST'])
+@jwt_required()
+def complete_many_sessions():
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        session_ids = data.get('session_ids')
+        if not isinstance(session_ids, list) or not session_ids:
+            return jsonify({'error': 'session_ids is required'}), 400
+        if len(session_ids) > MAX_BULK_COMPLETE:
+            return jsonify({'error': f'At most {MAX_BULK_COMPLETE} sessions can be completed at once'}), 400
+        
+        try:
+            object_ids = list({ObjectId(session_id) for session_id in session_ids})
+        except (InvalidId, TypeError):
+            return jsonify({'error': 'Invalid session id'}), 400
+        
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Database not available'}), 500
+        
+        # Only sessions the current user takes part in can be completed
+        sessions = db.sessions.find(
+            {'_id': {'$in': object_ids}},
+            {'teacher_id': 1, 'student_id': 1, 'status': 1}
+        )
+        user_object_id = ObjectId(current_user_id)
+        results = {str(object_id): 'not_found' for object_id in object_ids}
+        allowed = []
+        for session in sessions:
+            if user_object_id not in (session['teacher_id'], session['student_id']):
+                results[str(session['_id'])] = 'unauthorized'
+            elif session['status'] == 'completed':
+                results[str(session['_id'])] = 'already_completed'
+            else:
+                allowed.append(session['_id'])
+        
+        completed = set(complete_sessions(db, allowed))
+        for session_id in allowed:
+            # Lost a race with another completion of the same session
+            results[str(session_id)] = 'completed' if session_id in completed else 'already_completed'
+        
+        return jsonify({
+            'success': True,
+            'completed': len(completed),
+            'results': results
+        }), 200
+        
+    except Exception:
+        logger.exception("Complete sessions error")
+        return jsonify({'error': 'Failed to complete sessions'}), 500
+
 @session_bp.route('/sessions/<session_id>', methods=['DELETE'])
 @jwt_required()
 def delete_session(session_id):
@@ -249,6 +569,7 @@ def delete_session(session_id):
         result = db.sessions.delete_one({'_id': ObjectId(session_id)})
         
         if result.deleted_count > 0:
+            sync_sessions(db, deleted_ids=[session['_id']])
             return jsonify({
                 'success': True,
                 'message': 'Session deleted successfully'
@@ -256,8 +577,8 @@ def delete_session(session_id):
         else:
             return jsonify({'error': 'Failed to delete session'}), 500
             
-    except Exception as e:
-        print(f"Delete session error: {str(e)}")
+    except Exception:
+        logger.exception("Delete session error")
         return jsonify({'error': 'Failed to delete session'}), 500
 
 @session_bp.route('/sessions/upcoming', methods=['GET'])
@@ -270,85 +591,45 @@ def get_upcoming_sessions():
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get upcoming sessions (next 7 days)
-        now = datetime.utcnow()
-        next_week = now + timedelta(days=7)
-        
-        pipeline = [
-            {
-                '$match': {
-                    '$and': [
-                        {
-                            '$or': [
-                                {'teacher_id': ObjectId(current_user_id)},
-                                {'student_id': ObjectId(current_user_id)}
-                            ]
-                        },
-                        {'scheduled_date': {'$gte': now, '$lte': next_week}},
-                        {'status': 'scheduled'}
-                    ]
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'teacher_id',
-                    'foreignField': '_id',
-                    'as': 'teacher'
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'student_id',
-                    'foreignField': '_id',
-                    'as': 'student'
-                }
-            },
-            {
-                '$unwind': '$teacher'
-            },
-            {
-                '$unwind': '$student'
-            },
-            {
-                '$sort': {'scheduled_date': 1}
-            }
-        ]
-        
-        sessions = list(db.sessions.aggregate(pipeline))
-        
-        # Format response
-        formatted_sessions = []
-        for session in sessions:
-            formatted_session = {
-                '_id': str(session['_id']),
-                'teacher': {
-                    '_id': str(session['teacher']['_id']),
-                    'name': session['teacher']['name'],
-                    'photo_url': session['teacher'].get('photo_url', '')
-                },
-                'student': {
-                    '_id': str(session['student']['_id']),
-                    'name': session['student']['name'],
-                    'photo_url': session['student'].get('photo_url', '')
-                },
-                'skill': session['skill'],
-                'description': session['description'],
-                'scheduled_date': session['scheduled_date'],
-                'duration': session['duration'],
-                'status': session['status'],
-                'meeting_link': session['meeting_link'],
-                'role': 'teacher' if str(session['teacher_id']) == current_user_id else 'student'
-            }
-            formatted_sessions.append(formatted_session)
-        
         return jsonify({
             'success': True,
-            'sessions': formatted_sessions
+            'sessions': list_upcoming_sessions(db, current_user_id)
         }), 200
         
-    except Exception as e:
-        print(f"Get upcoming sessions error: {str(e)}")
+    except Exception:
+        logger.exception("Get upcoming sessions error")
         return jsonify({'error': 'Failed to fetch upcoming sessions'}), 500
 
+def list_upcoming_sessions(db, user_id):
+    """The user's scheduled sessions in the next 7 days, soonest first"""
+    # Get upcoming sessions (next 7 days)
+    now = datetime.utcnow()
+    next_week = now + timedelta(days=7)
+    
+    user_oid = ObjectId(user_id)
+    upcoming = {'scheduled_date': {'$gte': now, '$lte': next_week}, 'status': 'scheduled'}
+    sessions = list(db.sessions.find({'$or': [
+        dict(upcoming, teacher_id=user_oid),
+        dict(upcoming, student_id=user_oid)
+    ]}).sort('scheduled_date', 1))
+    fill_missing_snapshots(db, sessions, [('teacher_id', 'teacher'), ('student_id', 'student')])
+    
+    # Format response
+    formatted_sessions = []
+    for session in sessions:
+        formatted_session = {
+            '_id': str(session['_id']),
+            'teacher': participant_view(session, 'teacher_id', 'teacher'),
+            'student': participant_view(session, 'student_id', 'student'),
+            'skill': session['skill'],
+            'description': session['description'],
+            'scheduled_date': session['scheduled_date'],
+            'duration': session['duration'],
+            'status': session['status'],
+            'meeting_link': session['meeting_link'],
+            'role': 'teacher' if str(session['teacher_id']) == user_id else 'student'
+        }
+        formatted_sessions.append(formatted_session)
+    
+    return formatted_sessions
+
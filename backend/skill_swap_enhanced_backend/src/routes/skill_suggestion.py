@@ -1,8 +1,12 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from bson import ObjectId
 from src.models.user import get_db, User
+from src.services.tracing import start_span
+
+logger = logging.getLogger(__name__)
 
 skill_suggestion_bp = Blueprint('skill_suggestion', __name__)
 
@@ -113,7 +117,7 @@ def get_skill_suggestions(user_id):
         if current_user_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=['skills_learn'])
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -145,7 +149,7 @@ def get_skill_suggestions(user_id):
                 'skills_learn': {'$in': user.skills_learn},
                 '_id': {'$ne': ObjectId(user_id)},
                 'is_public': True
-            }).limit(10)
+            }, {'skills_learn': 1}).limit(10)
             
             for similar_user in similar_users:
                 for skill in similar_user.get('skills_learn', []):
@@ -181,8 +185,8 @@ def get_skill_suggestions(user_id):
             'suggestions': suggestions
         }), 200
         
-    except Exception as e:
-        print(f"Get skill suggestions error: {str(e)}")
+    except Exception:
+        logger.exception("Get skill suggestions error")
         return jsonify({'error': 'Failed to fetch skill suggestions'}), 500
 
 @skill_suggestion_bp.route('/skill-categories', methods=['GET'])
@@ -202,8 +206,8 @@ def get_skill_categories():
             'categories': categories
         }), 200
         
-    except Exception as e:
-        print(f"Get skill categories error: {str(e)}")
+    except Exception:
+        logger.exception("Get skill categories error")
         return jsonify({'error': 'Failed to fetch skill categories'}), 500
 
 @skill_suggestion_bp.route('/skills/search', methods=['GET'])
@@ -214,14 +218,15 @@ def search_skills():
             return jsonify({'error': 'Query parameter is required'}), 400
         
         # Search through all skills
-        matching_skills = []
-        for category, data in SKILL_CATEGORIES.items():
-            for skill in data['skills']:
-                if query in skill.lower():
-                    matching_skills.append({
-                        'skill': skill,
-                        'category': category
-                    })
+        with start_span('skills.catalog_scan'):
+            matching_skills = []
+            for category, data in SKILL_CATEGORIES.items():
+                for skill in data['skills']:
+                    if query in skill.lower():
+                        matching_skills.append({
+                            'skill': skill,
+                            'category': category
+                        })
         
         # Also search in database for user-defined skills
         db = get_db()
@@ -235,7 +240,8 @@ def search_skills():
                 {'$limit': 10}
             ]
             
-            teach_skills = list(db.users.aggregate(teach_pipeline))
+            with start_span('skills.aggregate'):
+                teach_skills = list(db.users.aggregate(teach_pipeline))
             for skill_data in teach_skills:
                 skill = skill_data['_id']
                 if not any(s['skill'].lower() == skill.lower() for s in matching_skills):
@@ -256,8 +262,8 @@ def search_skills():
             'skills': sorted_skills[:20]  # Limit to 20 results
         }), 200
         
-    except Exception as e:
-        print(f"Search skills error: {str(e)}")
+    except Exception:
+        logger.exception("Search skills error")
         return jsonify({'error': 'Failed to search skills'}), 500
 
 @skill_suggestion_bp.route('/skills/popular', methods=['GET'])
@@ -311,7 +317,7 @@ def get_popular_skills():
             }
         }), 200
         
-    except Exception as e:
-        print(f"Get popular skills error: {str(e)}")
+    except Exception:
+        logger.exception("Get popular skills error")
         return jsonify({'error': 'Failed to fetch popular skills'}), 500
 
@@ -1,8 +1,14 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from bson import ObjectId
 from src.models.user import get_db, User
+from src.models.participant_snapshots import (
+    snapshot_users, build_snapshot, fill_missing_snapshots, participant_view, SNAPSHOT_SOURCE_FIELDS
+)
+
+logger = logging.getLogger(__name__)
 
 swap_request_bp = Blueprint('swap_request', __name__)
 
@@ -18,7 +24,7 @@ def create_swap_request():
             return jsonify({'error': 'Target user ID is required'}), 400
         
         # Check if target user exists
-        target_user = User.find_by_id(data['target_user_id'])
+        target_user = User.find_by_id(data['target_user_id'], fields=list(SNAPSHOT_SOURCE_FIELDS))
         if not target_user:
             return jsonify({'error': 'Target user not found'}), 404
         
@@ -40,10 +46,15 @@ def create_swap_request():
         if existing_request:
             return jsonify({'error': 'Request already sent to this user'}), 400
         
+        requester = snapshot_users(db, [current_user_id]).get(ObjectId(current_user_id))
+        
         # Create swap request
         swap_request = {
             'requester_id': ObjectId(current_user_id),
             'target_user_id': ObjectId(data['target_user_id']),
+            # Shown by the sent/received lists without a join (see participant_snapshots)
+            'requester': requester or build_snapshot({}),
+            'target_user': build_snapshot(target_user.to_dict()),
             'message': data.get('message', ''),
             'status': 'pending',
             'created_at': datetime.utcnow(),
@@ -61,8 +72,8 @@ def create_swap_request():
         else:
             return jsonify({'error': 'Failed to create swap request'}), 500
             
-    except Exception as e:
-        print(f"Create swap request error: {str(e)}")
+    except Exception:
+        logger.exception("Create swap request error")
         return jsonify({'error': 'Failed to create swap request'}), 500
 
 @swap_request_bp.route('/swap-requests/sent/<user_id>', methods=['GET'])
@@ -79,58 +90,40 @@ def get_sent_requests(user_id):
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get sent requests with target user details
-        pipeline = [
-            {
-                '$match': {
-                    'requester_id': ObjectId(user_id)
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'target_user_id',
-                    'foreignField': '_id',
-                    'as': 'target_user'
-                }
-            },
-            {
-                '$unwind': '$target_user'
-            },
-            {
-                '$sort': {'created_at': -1}
-            }
-        ]
-        
-        requests = list(db.swap_requests.aggregate(pipeline))
-        
-        # Format response
-        formatted_requests = []
-        for req in requests:
-            formatted_req = {
-                '_id': str(req['_id']),
-                'target_user': {
-                    '_id': str(req['target_user']['_id']),
-                    'name': req['target_user']['name'],
-                    'photo_url': req['target_user'].get('photo_url', ''),
-                    'skills_teach': req['target_user'].get('skills_teach', [])
-                },
-                'message': req['message'],
-                'status': req['status'],
-                'created_at': req['created_at'],
-                'updated_at': req['updated_at']
-            }
-            formatted_requests.append(formatted_req)
-        
         return jsonify({
             'success': True,
-            'requests': formatted_requests
+            'requests': list_sent_requests(db, user_id)
         }), 200
         
-    except Exception as e:
-        print(f"Get sent requests error: {str(e)}")
+    except Exception:
+        logger.exception("Get sent requests error")
         return jsonify({'error': 'Failed to fetch sent requests'}), 500
 
+def list_sent_requests(db, user_id):
+    """Swap requests sent by the user, newest first"""
+    # Newest first from the swap_requests_requester_created index; the
+    # target_user snapshot on each request replaces the join to users
+    requests = list(db.swap_requests.find(
+        {'requester_id': ObjectId(user_id)},
+        {'target_user_id': 1, 'target_user': 1, 'message': 1, 'status': 1, 'created_at': 1, 'updated_at': 1}
+    ).sort('created_at', -1))
+    fill_missing_snapshots(db, requests, [('target_user_id', 'target_user')])
+    
+    # Format response
+    formatted_requests = []
+    for req in requests:
+        formatted_req = {
+            '_id': str(req['_id']),
+            'target_user': participant_view(req, 'target_user_id', 'target_user', include_skills=True),
+            'message': req['message'],
+            'status': req['status'],
+            'created_at': req['created_at'],
+            'updated_at': req['updated_at']
+        }
+        formatted_requests.append(formatted_req)
+    
+    return formatted_requests
+
 @swap_request_bp.route('/swap-requests/received/<user_id>', methods=['GET'])
 @jwt_required()
 def get_received_requests(user_id):
@@ -145,58 +138,40 @@ def get_received_requests(user_id):
         if db is None:
             return jsonify({'error': 'Database not available'}), 500
         
-        # Get received requests with requester details
-        pipeline = [
-            {
-                '$match': {
-                    'target_user_id': ObjectId(user_id)
-                }
-            },
-            {
-                '$lookup': {
-                    'from': 'users',
-                    'localField': 'requester_id',
-                    'foreignField': '_id',
-                    'as': 'requester'
-                }
-            },
-            {
-                '$unwind': '$requester'
-            },
-            {
-                '$sort': {'created_at': -1}
-            }
-        ]
-        
-        requests = list(db.swap_requests.aggregate(pipeline))
-        
-        # Format response
-        formatted_requests = []
-        for req in requests:
-            formatted_req = {
-                '_id': str(req['_id']),
-                'requester': {
-                    '_id': str(req['requester']['_id']),
-                    'name': req['requester']['name'],
-                    'photo_url': req['requester'].get('photo_url', ''),
-                    'skills_teach': req['requester'].get('skills_teach', [])
-                },
-                'message': req['message'],
-                'status': req['status'],
-                'created_at': req['created_at'],
-                'updated_at': req['updated_at']
-            }
-            formatted_requests.append(formatted_req)
-        
         return jsonify({
             'success': True,
-            'requests': formatted_requests
+            'requests': list_received_requests(db, user_id)
         }), 200
         
-    except Exception as e:
-        print(f"Get received requests error: {str(e)}")
+    except Exception:
+        logger.exception("Get received requests error")
         return jsonify({'error': 'Failed to fetch received requests'}), 500
 
+def list_received_requests(db, user_id):
+    """Swap requests received by the user, newest first"""
+    # Newest first from the swap_requests_target_created index; the
+    # requester snapshot on each request replaces the join to users
+    requests = list(db.swap_requests.find(
+        {'target_user_id': ObjectId(user_id)},
+        {'requester_id': 1, 'requester': 1, 'message': 1, 'status': 1, 'created_at': 1, 'updated_at': 1}
+    ).sort('created_at', -1))
+    fill_missing_snapshots(db, requests, [('requester_id', 'requester')])
+    
+    # Format response
+    formatted_requests = []
+    for req in requests:
+        formatted_req = {
+            '_id': str(req['_id']),
+            'requester': participant_view(req, 'requester_id', 'requester', include_skills=True),
+            'message': req['message'],
+            'status': req['status'],
+            'created_at': req['created_at'],
+            'updated_at': req['updated_at']
+        }
+        formatted_requests.append(formatted_req)
+    
+    return formatted_requests
+
 @swap_request_bp.route('/swap-requests/<request_id>/accept', methods=['PUT'])
 @jwt_required()
 def accept_request(request_id):
@@ -235,8 +210,8 @@ def accept_request(request_id):
         else:
             return jsonify({'error': 'Failed to accept request'}), 500
             
-    except Exception as e:
-        print(f"Accept request error: {str(e)}")
+    except Exception:
+        logger.exception("Accept request error")
         return jsonify({'error': 'Failed to accept request'}), 500
 
 @swap_request_bp.route('/swap-requests/<request_id>/reject', methods=['PUT'])
@@ -277,8 +252,8 @@ def reject_request(request_id):
         else:
             return jsonify({'error': 'Failed to reject request'}), 500
             
-    except Exception as e:
-        print(f"Reject request error: {str(e)}")
+    except Exception:
+        logger.exception("Reject request error")
         return jsonify({'error': 'Failed to reject request'}), 500
 
 @swap_request_bp.route('/swap-requests/<request_id>', methods=['DELETE'])
@@ -311,7 +286,7 @@ def delete_request(request_id):
         else:
             return jsonify({'error': 'Failed to delete request'}), 500
             
-    except Exception as e:
-        print(f"Delete request error: {str(e)}")
+    except Exception:
+        logger.exception("Delete request error")
         return jsonify({'error': 'Failed to delete request'}), 500
 
@@ -1,60 +1,69 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, send_from_directory
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import cloudinary
-import cloudinary.uploader
-import os
-from src.models.user import User
+from src.models.user import User, DEFAULT_SEARCH_LIMIT, ConcurrentModificationError
+from src.models.identity import issue_access_token
+from src.models.stats_rollups import record_visibility_change
+from src.models.availability import normalize_schedule
+from src.services.image_pipeline import (
+    submit_profile_image, get_upload_job, InvalidImage, IMAGE_STORAGE_BACKEND, IMAGE_STORAGE_DIR
+)
+
+logger = logging.getLogger(__name__)
 
 user_bp = Blueprint('user', __name__)
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+# Only the fields the stats endpoint serializes
+USER_STATS_FIELDS = [
+    'total_sessions_taught', 'total_sessions_attended', 'rating', 'badge_level',
+    'skills_teach', 'skills_learn'
+]
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
     try:
         # Get query parameters
-        is_public = request.args.get('is_public', 'true').lower() == 'true'
-        search = request.args.get('search', '')
+        search = request.args.get('search', '').strip()
+        skill = request.args.get('skill', '').strip()
+        after = request.args.get('after') or None
+        fields = request.args.get('fields')
         
-        if is_public:
-            users = User.get_all_public_users()
-        else:
-            # For now, only return public users
-            users = User.get_all_public_users()
-        
-        # Filter by search term if provided
-        if search:
-            search_lower = search.lower()
-            filtered_users = []
-            for user in users:
-                if (search_lower in user.name.lower() or 
-                    search_lower in user.bio.lower() or
-                    any(search_lower in skill.lower() for skill in user.skills_teach) or
-                    any(search_lower in skill.lower() for skill in user.skills_learn)):
-                    filtered_users.append(user)
-            users = filtered_users
+        try:
+            limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        
+        # Only public users are listed; filtering and paging happen in MongoDB
+        try:
+            users, next_cursor, total, total_is_exact = User.search_public_users(
+                search=search,
+                skill=skill,
+                limit=limit,
+                after=after,
+                fields=fields
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         # Convert to dict format
         users_data = []
-        for user in users:
-            user_dict = user.to_dict()
-            user_dict['_id'] = str(user_dict['_id'])
-            # Remove sensitive information
-            user_dict.pop('password', None)
-            users_data.append(user_dict)
+        for user_data in users:
+            user_data['_id'] = str(user_data['_id'])
+            users_data.append(user_data)
         
         return jsonify({
             'success': True,
-            'users': users_data
+            'users': users_data,
+            'next_cursor': next_cursor,
+            'total_estimate': total,
+            'total_is_exact': total_is_exact
         }), 200
         
-    except Exception as e:
-        print(f"Get users error: {str(e)}")
+    except Exception:
+        logger.exception("Get users error")
         return jsonify({'error': 'Failed to fetch users'}), 500
 
 @user_bp.route('/users/<user_id>', methods=['GET'])
@@ -74,8 +83,8 @@ def get_user(user_id):
             'user': user_dict
         }), 200
         
-    except Exception as e:
-        print(f"Get user error: {str(e)}")
+    except Exception:
+        logger.exception("Get user error")
         return jsonify({'error': 'Failed to fetch user'}), 500
 
 @user_bp.route('/users', methods=['POST'])
@@ -99,10 +108,19 @@ def create_user_profile():
             user.skills_learn = data['skills_learn']
         if 'availability' in data:
             user.availability = data['availability']
+        if 'availability_schedule' in data:
+            try:
+                user.availability_schedule = normalize_schedule(data['availability_schedule'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         if 'is_public' in data:
+            was_public = user.is_public
             user.is_public = data['is_public']
         
         if user.save():
+            if 'is_public' in data and bool(was_public) != bool(user.is_public):
+                record_visibility_change(user.is_public)
+            
             user_dict = user.to_dict()
             user_dict['_id'] = str(user_dict['_id'])
             user_dict.pop('password', None)
@@ -110,13 +128,15 @@ def create_user_profile():
             return jsonify({
                 'success': True,
                 'message': 'Profile updated successfully',
-                'user': user_dict
+                'user': user_dict,
+                # Carries the new profile version so other processes stop serving the cached profile
+                'token': issue_access_token(user._id, user.version)
             }), 200
         else:
             return jsonify({'error': 'Failed to update profile'}), 500
             
-    except Exception as e:
-        print(f"Create user profile error: {str(e)}")
+    except Exception:
+        logger.exception("Create user profile error")
         return jsonify({'error': 'Failed to update profile'}), 500
 
 @user_bp.route('/users/<user_id>', methods=['PUT'])
@@ -135,6 +155,11 @@ def update_user(user_id):
         
         data = request.get_json()
         
+        # Clients that send the version they edited get a conflict instead of overwriting newer changes
+        check_version = 'version' in data
+        if check_version and data['version'] != user.version:
+            return jsonify({'error': 'Profile was modified by another request', 'version': user.version}), 409
+        
         # Update user profile
         if 'name' in data:
             user.name = data['name']
@@ -146,12 +171,26 @@ def update_user(user_id):
             user.skills_learn = data['skills_learn']
         if 'availability' in data:
             user.availability = data['availability']
+        if 'availability_schedule' in data:
+            try:
+                user.availability_schedule = normalize_schedule(data['availability_schedule'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         if 'is_public' in data:
+            was_public = user.is_public
             user.is_public = data['is_public']
         if 'notification_preferences' in data:
             user.notification_preferences = data['notification_preferences']
         
-        if user.save():
+        try:
+            saved = user.save(check_version=check_version)
+        except ConcurrentModificationError:
+            return jsonify({'error': 'Profile was modified by another request'}), 409
+        
+        if saved:
+            if 'is_public' in data and bool(was_public) != bool(user.is_public):
+                record_visibility_change(user.is_public)
+            
             user_dict = user.to_dict()
             user_dict['_id'] = str(user_dict['_id'])
             user_dict.pop('password', None)
@@ -159,13 +198,15 @@ def update_user(user_id):
             return jsonify({
                 'success': True,
                 'message': 'Profile updated successfully',
-                'user': user_dict
+                'user': user_dict,
+                # Carries the new profile version so other processes stop serving the cached profile
+                'token': issue_access_token(user._id, user.version)
             }), 200
         else:
             return jsonify({'error': 'Failed to update profile'}), 500
             
-    except Exception as e:
-        print(f"Update user error: {str(e)}")
+    except Exception:
+        logger.exception("Update user error")
         return jsonify({'error': 'Failed to update profile'}), 500
 
 @user_bp.route('/users/upload-image', methods=['POST'])
@@ -173,10 +214,6 @@ def update_user(user_id):
 def upload_profile_image():
     try:
         current_user_id = get_jwt_identity()
-        user = User.find_by_id(current_user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
         
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
@@ -185,38 +222,51 @@ def upload_profile_image():
         if file.filename == '':
             return jsonify({'error': 'No image file selected'}), 400
         
-        # Upload to Cloudinary
+        # Spool and validate here; resizing and the storage upload happen in the background
         try:
-            upload_result = cloudinary.uploader.upload(
-                file,
-                folder="skillswap/profile_images",
-                transformation=[
-                    {'width': 400, 'height': 400, 'crop': 'fill'},
-                    {'quality': 'auto'},
-                    {'format': 'jpg'}
-                ]
-            )
-            
-            image_url = upload_result['secure_url']
-            
-            # Update user's photo URL
-            user.photo_url = image_url
-            user.save()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Image uploaded successfully',
-                'imageUrl': image_url
-            }), 200
-            
-        except Exception as upload_error:
-            print(f"Cloudinary upload error: {str(upload_error)}")
-            return jsonify({'error': 'Failed to upload image'}), 500
+            job_id = submit_profile_image(current_user_id, file)
+        except InvalidImage as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': 'Image accepted for processing',
+            'job_id': job_id
+        }), 202
             
-    except Exception as e:
-        print(f"Upload image error: {str(e)}")
+    except Exception:
+        logger.exception("Upload image error")
         return jsonify({'error': 'Failed to upload image'}), 500
 
+@user_bp.route('/users/upload-image/<job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_status(job_id):
+    try:
+        current_user_id = get_jwt_identity()
+        
+        job = get_upload_job(job_id)
+        if not job or job['user_id'] != current_user_id:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['_id'],
+            'status': job['status'],
+            'imageUrl': job.get('photo_url'),
+            'error': job.get('last_error') if job['status'] == 'failed' else None
+        }), 200
+        
+    except Exception:
+        logger.exception("Get upload status error")
+        return jsonify({'error': 'Failed to fetch upload status'}), 500
+
+@user_bp.route('/images/<path:filename>', methods=['GET'])
+def serve_local_image(filename):
+    # Only used with IMAGE_STORAGE_BACKEND=local; Cloudinary serves its own URLs
+    if IMAGE_STORAGE_BACKEND != 'local':
+        return jsonify({'error': 'Not found'}), 404
+    return send_from_directory(IMAGE_STORAGE_DIR, filename)
+
 @user_bp.route('/users/<user_id>', methods=['DELETE'])
 @jwt_required()
 def delete_user(user_id):
@@ -229,44 +279,51 @@ def delete_user(user_id):
         
         # For now, we'll just mark the user as inactive instead of deleting
         # In a real application, you might want to handle this differently
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=['is_public'])
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
+        was_public = user.is_public
         user.is_public = False
         user.save()
+        if was_public:
+            record_visibility_change(False)
         
         return jsonify({
             'success': True,
             'message': 'Account deactivated successfully'
         }), 200
         
-    except Exception as e:
-        print(f"Delete user error: {str(e)}")
+    except Exception:
+        logger.exception("Delete user error")
         return jsonify({'error': 'Failed to delete account'}), 500
 
 @user_bp.route('/users/<user_id>/stats', methods=['GET'])
 def get_user_stats(user_id):
     try:
-        user = User.find_by_id(user_id)
+        user = User.find_by_id(user_id, fields=USER_STATS_FIELDS)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
             'success': True,
-            'stats': {
-                'total_sessions_taught': user.total_sessions_taught,
-                'total_sessions_attended': user.total_sessions_attended,
-                'rating': user.rating,
-                'badge_level': user.badge_level,
-                'skills_count': {
-                    'teaching': len(user.skills_teach),
-                    'learning': len(user.skills_learn)
-                }
-            }
+            'stats': user_stats(user)
         }), 200
         
-    except Exception as e:
-        print(f"Get user stats error: {str(e)}")
+    except Exception:
+        logger.exception("Get user stats error")
         return jsonify({'error': 'Failed to fetch user stats'}), 500
 
+def user_stats(user):
+    """Stats for a user loaded with USER_STATS_FIELDS"""
+    return {
+        'total_sessions_taught': user.total_sessions_taught,
+        'total_sessions_attended': user.total_sessions_attended,
+        'rating': user.rating,
+        'badge_level': user.badge_level,
+        'skills_count': {
+            'teaching': len(user.skills_teach),
+            'learning': len(user.skills_learn)
+        }
+    }
+
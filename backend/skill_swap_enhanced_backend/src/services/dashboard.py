@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from src.services import metrics
+from src.services.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+# Section queries are I/O bound (the driver releases the GIL while waiting on
+# MongoDB), so a shared pool lets one request's sections overlap.
+DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', 16))
+# Sections allowed to wait for a worker; beyond this they run on the request thread
+DASHBOARD_QUEUE_SIZE = int(os.getenv('DASHBOARD_QUEUE_SIZE', 64))
+# Sections still running after this are reported as timed out
+DASHBOARD_TIMEOUT_SECONDS = float(os.getenv('DASHBOARD_TIMEOUT_SECONDS', 10))
+
+dashboard_section_seconds = metrics.histogram(
+    'dashboard_section_duration_seconds',
+    'Latency of each dashboard section query',
+    ('section', 'outcome')
+)
+
+class RequestMemo:
+    """Lookups shared by the sections of one request.
+
+    The first section to ask for a key runs the loader; sections asking while
+    it is in flight wait for the same result instead of issuing the query again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get(self, key, loader):
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+class SectionRunner:
+    def __init__(self, workers=DASHBOARD_WORKERS, queue_size=DASHBOARD_QUEUE_SIZE, timeout=DASHBOARD_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dashboard')
+        # Running plus queued sections; acquired without blocking so a full pool degrades to inline
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _section(self, name, loader, memo):
+        with start_span(f'dashboard.{name}'):
+            with dashboard_section_seconds.time(section=name):
+                return loader(memo)
+
+    def _submit(self, name, loader, memo):
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self._in_flight += 1
+
+        def release(_):
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        # Each section runs in a copy of the request's context, so its spans
+        # and log lines carry the request's trace and request ids
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._section, name, loader, memo)
+        future.add_done_callback(release)
+        return future
+
+    def run(self, loaders):
+        """Run {name: loader(memo)} concurrently; returns (results, errors) keyed by section"""
+        memo = RequestMemo()
+        futures = {}
+        inline = []
+        for name, loader in loaders.items():
+            future = self._submit(name, loader, memo)
+            if future is None:
+                inline.append(name)
+            else:
+                futures[name] = future
+
+        results = {}
+        errors = {}
+        for name in inline:
+            try:
+                results[name] = self._section(name, loaders[name], memo)
+            except Exception:
+                logger.exception("Dashboard section %s error", name)
+                errors[name] = 'Failed to load'
+
+        deadline = time.monotonic() + self.timeout
+        wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        for name, future in futures.items():
+            if not future.done():
+                errors[name] = 'Timed out'
+                continue
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.error("Dashboard section %s error", name, exc_info=future.exception())
+                errors[name] = 'Failed to load'
+        return results, errors
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+section_runner = SectionRunner()
+
+metrics.gauge('dashboard_sections_in_flight', 'Dashboard sections running or queued', section_runner.in_flight)
+
+def select_fields(value, fields):
+    """Keep only `fields` of a section: of each item for a list, of the object otherwise"""
+    if not fields:
+        return value
+    if isinstance(value, list):
+        return [{key: item[key] for key in fields if key in item} for item in value]
+    if isinstance(value, dict):
+        return {key: value[key] for key in fields if key in value}
+    return value
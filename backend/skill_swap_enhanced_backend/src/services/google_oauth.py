@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth import jwt as google_jwt
+from src.services.tracing import external_call
+
+logger = logging.getLogger(__name__)
+
+# Google OAuth configuration
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
+GOOGLE_CALLBACK_URL = os.getenv('GOOGLE_CALLBACK_URL')
+
+GOOGLE_AUTH_URI = 'https://accounts.google.com/o/oauth2/auth'
+GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# PEM certificates keyed by kid, which google.auth.jwt.decode accepts directly
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+GOOGLE_SCOPES = ['openid', 'email', 'profile']
+
+GOOGLE_HTTP_TIMEOUT = float(os.getenv('GOOGLE_HTTP_TIMEOUT', 10))
+# Used when Google's response has no max-age
+DEFAULT_CERT_MAX_AGE = 3600
+# An unknown kid triggers at most one early refetch per this many seconds
+UNKNOWN_KID_REFETCH_SECONDS = 60
+CLOCK_SKEW_SECONDS = 10
+# Certificates are refetched in the background this long before they expire
+CERT_REFRESH_AHEAD_SECONDS = 300
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+def _pooled_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount('https://', adapter)
+    return session
+
+# One keep-alive pool for the token exchange and certificate fetches
+http_session = _pooled_session()
+
+class HttpKeyServer:
+    """Fetches Google's signing certificates over the pooled session"""
+
+    def __init__(self, url=GOOGLE_CERTS_URL, session=None):
+        self.url = url
+        self.session = session or http_session
+
+    def fetch(self):
+        """(certificates keyed by kid, seconds they may be cached)"""
+        with external_call('google', 'certs'):
+            response = self.session.get(self.url, timeout=GOOGLE_HTTP_TIMEOUT)
+            response.raise_for_status()
+        match = _MAX_AGE.search(response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else DEFAULT_CERT_MAX_AGE
+        return response.json(), max_age
+
+class StaticKeyServer:
+    """Serves fixed certificates, for running the verifier offline"""
+
+    def __init__(self, certs, max_age=DEFAULT_CERT_MAX_AGE):
+        self.certs = certs
+        self.max_age = max_age
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return dict(self.certs), self.max_age
+
+class IdTokenVerifier:
+    """Verifies Google ID tokens against certificates cached for their max-age"""
+
+    def __init__(self, key_server=None, client_id=None):
+        self.key_server = key_server or HttpKeyServer()
+        self.client_id = client_id or GOOGLE_CLIENT_ID
+        self._lock = threading.Lock()
+        # Serializes blocking fetches so a burst of logins causes one download
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+        self._certs = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+
+    def _refresh(self):
+        certs, max_age = self.key_server.fetch()
+        now = time.monotonic()
+        with self._lock:
+            self._certs = certs
+            self._fetched_at = now
+            self._expires_at = now + max_age
+
+    def _refresh_in_background(self):
+        def run():
+            try:
+                self._refresh()
+            except Exception:
+                logger.exception("Google certificate refresh error")
+            finally:
+                self._refreshing = False
+        self._refreshing = True
+        threading.Thread(target=run, name='google-certs-refresh', daemon=True).start()
+
+    def warm(self):
+        """Fetch certificates ahead of the first login"""
+        self._refresh_in_background()
+
+    def _certs_for(self, kid):
+        now = time.monotonic()
+        with self._lock:
+            certs = self._certs
+            fetched_at = self._fetched_at
+            fresh = now < self._expires_at
+            known = kid in certs
+            refetch_allowed = now - self._fetched_at > UNKNOWN_KID_REFETCH_SECONDS
+            due = now >= self._expires_at - CERT_REFRESH_AHEAD_SECONDS
+        if fresh and known:
+            if due and not self._refreshing:
+                # Serve the current keys while new ones are fetched
+                self._refresh_in_background()
+            return certs
+        if not fresh or refetch_allowed:
+            # Nothing usable cached, or Google rotated keys before our copy expired
+            with self._fetch_lock:
+                # Another request may have fetched while this one waited
+                if self._fetched_at == fetched_at:
+                    self._refresh()
+            with self._lock:
+                return self._certs
+        return certs
+
+    def verify(self, token):
+        header = google_jwt.decode_header(token)
+        claims = google_jwt.decode(
+            token,
+            certs=self._certs_for(header.get('kid')),
+            audience=self.client_id,
+            clock_skew_in_seconds=CLOCK_SKEW_SECONDS
+        )
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+id_token_verifier = IdTokenVerifier()
+
+def warm_google_certs():
+    if GOOGLE_CLIENT_ID:
+        id_token_verifier.warm()
+
+def _code_challenge(code_verifier):
+    digest = hashlib.sha256(code_verifier.encode('ascii')).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+def authorization_request():
+    """(authorization URL, state, PKCE code verifier) for a new login"""
+    state = secrets.token_urlsafe(24)
+    code_verifier = secrets.token_urlsafe(64)
+    params = {
+        'response_type': 'code',
+        'client_id': GOOGLE_CLIENT_ID,
+        'redirect_uri': GOOGLE_CALLBACK_URL,
+        'scope': ' '.join(GOOGLE_SCOPES),
+        'state': state,
+        'access_type': 'offline',
+        'include_granted_scopes': 'true',
+        'code_challenge': _code_challenge(code_verifier),
+        'code_challenge_method': 'S256'
+    }
+    return f"{GOOGLE_AUTH_URI}?{urlencode(params)}", state, code_verifier
+
+def exchange_code(code, code_verifier=None):
+    """Trade an authorization code for tokens; returns Google's token response"""
+    data = {
+        'grant_type': 'authorization_code',
+        'code': code,
+        'client_id': GOOGLE_CLIENT_ID,
+        'client_secret': GOOGLE_CLIENT_SECRET,
+        'redirect_uri': GOOGLE_CALLBACK_URL
+    }
+    if code_verifier:
+        data['code_verifier'] = code_verifier
+    with external_call('google', 'token'):
+        response = http_session.post(GOOGLE_TOKEN_URI, data=data, timeout=GOOGLE_HTTP_TIMEOUT)
+        response.raise_for_status()
+    return response.json()
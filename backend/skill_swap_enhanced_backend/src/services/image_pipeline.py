@@ -0,0 +1,305 @@
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from PIL import Image, ImageOps
+import cloudinary
+import cloudinary.uploader
+from src.models.user import get_db, User
+from src.services import metrics
+from src.services.tracing import external_call
+
+logger = logging.getLogger(__name__)
+
+# Uploads are spooled here until a worker has pushed them to storage. Workers
+# must share this directory with the web processes (same host or a shared volume).
+IMAGE_SPOOL_DIR = os.getenv('IMAGE_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'skillswap-uploads'))
+# Set when IMAGE_SPOOL_DIR is a volume shared by every host; otherwise a job is
+# only claimed by workers on the host that spooled it
+IMAGE_SPOOL_SHARED = os.getenv('IMAGE_SPOOL_SHARED', 'false').lower() == 'true'
+SPOOL_HOST = socket.gethostname()
+# 'cloudinary', or 'local' to keep processed images on disk (development and tests)
+IMAGE_STORAGE_BACKEND = os.getenv('IMAGE_STORAGE_BACKEND', 'cloudinary')
+IMAGE_STORAGE_DIR = os.getenv('IMAGE_STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'skillswap-images'))
+IMAGE_PUBLIC_URL_BASE = os.getenv('IMAGE_PUBLIC_URL_BASE', '/api/images/')
+
+# Validation limits
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 40_000_000))
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+# Profile images are cropped to a square of this size, as the Cloudinary transformation did
+PROFILE_IMAGE_SIZE = 400
+
+# Worker tuning
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_POLL_SECONDS = float(os.getenv('IMAGE_POLL_SECONDS', 2))
+IMAGE_MAX_ATTEMPTS = int(os.getenv('IMAGE_MAX_ATTEMPTS', 5))
+IMAGE_BACKOFF_SECONDS = int(os.getenv('IMAGE_BACKOFF_SECONDS', 10))
+# A job claimed for longer than this is assumed to belong to a dead worker
+IMAGE_CLAIM_TIMEOUT_SECONDS = int(os.getenv('IMAGE_CLAIM_TIMEOUT_SECONDS', 300))
+
+# Job statuses: pending -> processing -> done, or back to pending for a retry, or failed
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Configure Cloudinary
+cloudinary.config(
+    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+    api_key=os.getenv('CLOUDINARY_API_KEY'),
+    api_secret=os.getenv('CLOUDINARY_API_SECRET')
+)
+
+class InvalidImage(Exception):
+    pass
+
+class CloudinaryStorage:
+    def store(self, path, name):
+        with external_call('cloudinary', 'upload'):
+            result = cloudinary.uploader.upload(path, folder="skillswap/profile_images", public_id=name)
+        return result['secure_url']
+
+class LocalStorage:
+    def __init__(self, directory=IMAGE_STORAGE_DIR, url_base=IMAGE_PUBLIC_URL_BASE):
+        self.directory = directory
+        self.url_base = url_base
+        os.makedirs(directory, exist_ok=True)
+
+    def store(self, path, name):
+        filename = f"{name}.jpg"
+        shutil.copyfile(path, os.path.join(self.directory, filename))
+        return f"{self.url_base}{filename}"
+
+def get_storage():
+    if IMAGE_STORAGE_BACKEND == 'local':
+        return LocalStorage()
+    return CloudinaryStorage()
+
+def _spool_path(job_id, suffix):
+    return os.path.join(IMAGE_SPOOL_DIR, f"{job_id}.{suffix}")
+
+def spool_upload(file_storage, job_id):
+    """Copy the request's file to the spool directory; returns the path"""
+    os.makedirs(IMAGE_SPOOL_DIR, exist_ok=True)
+    path = _spool_path(job_id, 'upload')
+    written = 0
+    with open(path, 'wb') as spooled:
+        while True:
+            chunk = file_storage.stream.read(64 * 1024)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > MAX_IMAGE_BYTES:
+                spooled.close()
+                os.remove(path)
+                raise InvalidImage(f'Image is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB')
+            spooled.write(chunk)
+    return path
+
+def validate_image(path):
+    """Check format and dimensions from the header, without decoding the pixels"""
+    try:
+        with Image.open(path) as image:
+            if image.format not in ALLOWED_IMAGE_FORMATS:
+                raise InvalidImage(f'Unsupported image format: {image.format}')
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise InvalidImage('File is not a readable image')
+    if width * height > MAX_IMAGE_PIXELS:
+        raise InvalidImage('Image dimensions are too large')
+    return width, height
+
+def process_image(source_path, target_path, size=PROFILE_IMAGE_SIZE):
+    """Square-crop, downsize and re-encode as JPEG; EXIF and other metadata are dropped"""
+    with Image.open(source_path) as image:
+        # Apply the EXIF orientation before the metadata is discarded
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+        image.save(target_path, 'JPEG', quality=85, optimize=True)
+
+def submit_profile_image(user_id, file_storage):
+    """Spool and validate an upload, then queue it; returns the job id"""
+    db = get_db()
+    if db is None:
+        raise Exception("Database not initialized")
+
+    job_id = uuid.uuid4().hex
+    path = spool_upload(file_storage, job_id)
+    try:
+        validate_image(path)
+    except InvalidImage:
+        os.remove(path)
+        raise
+
+    now = datetime.utcnow()
+    db.image_uploads.insert_one({
+        '_id': job_id,
+        'user_id': user_id,
+        'spool_path': path,
+        'spool_host': SPOOL_HOST,
+        'status': STATUS_PENDING,
+        'attempts': 0,
+        'last_error': None,
+        'photo_url': None,
+        'created_at': now,
+        'updated_at': now,
+        'next_attempt_at': now
+    })
+    _wake.set()
+    return job_id
+
+def get_upload_job(job_id):
+    db = get_db()
+    if db is None:
+        return None
+    return db.image_uploads.find_one({'_id': job_id})
+
+def _claimable(query):
+    if IMAGE_SPOOL_SHARED:
+        return query
+    # Jobs queued before spool_host was recorded are claimable anywhere
+    return dict(query, spool_host={'$in': [SPOOL_HOST, None]})
+
+def claim_job(db, worker_name):
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=IMAGE_CLAIM_TIMEOUT_SECONDS)
+    # Jobs whose workers died on every attempt are given up rather than reclaimed forever
+    db.image_uploads.update_many(
+        _claimable({'status': STATUS_PROCESSING, 'claimed_at': {'$lt': stale_before},
+                    'attempts': {'$gte': IMAGE_MAX_ATTEMPTS}}),
+        {'$set': {'status': STATUS_FAILED, 'last_error': 'Worker did not finish the job', 'updated_at': now}}
+    )
+    return db.image_uploads.find_one_and_update(
+        _claimable({
+            '$or': [
+                {'status': STATUS_PENDING, 'next_attempt_at': {'$lte': now}},
+                {'status': STATUS_PROCESSING, 'claimed_at': {'$lt': stale_before},
+                 'attempts': {'$lt': IMAGE_MAX_ATTEMPTS}}
+            ]
+        }),
+        {
+            '$set': {'status': STATUS_PROCESSING, 'claimed_by': worker_name, 'claimed_at': now},
+            '$inc': {'attempts': 1}
+        },
+        sort=[('next_attempt_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _mark_failed(db, job, error, permanent=False):
+    now = datetime.utcnow()
+    if permanent or job.get('attempts', 1) >= IMAGE_MAX_ATTEMPTS:
+        update = {'status': STATUS_FAILED}
+        _remove_spool_files(job)
+    else:
+        # Exponential backoff: 10s, 20s, 40s, ...
+        delay = IMAGE_BACKOFF_SECONDS * (2 ** (job.get('attempts', 1) - 1))
+        update = {'status': STATUS_PENDING, 'next_attempt_at': now + timedelta(seconds=delay)}
+    update.update({'last_error': str(error), 'updated_at': now})
+    db.image_uploads.update_one({'_id': job['_id']}, {'$set': update})
+
+def _remove_spool_files(job):
+    for path in (job['spool_path'], _spool_path(job['_id'], 'jpg')):
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_job(db, job, storage):
+    """Process one claimed job: downsize, push to storage, then point the user's photo_url at it"""
+    processed_path = _spool_path(job['_id'], 'jpg')
+    try:
+        # A retry after a storage failure reuses the processed file
+        if not os.path.exists(processed_path):
+            process_image(job['spool_path'], processed_path)
+    except (OSError, InvalidImage, Image.DecompressionBombError) as e:
+        _mark_failed(db, job, e, permanent=True)
+        return False
+    except Exception as e:
+        # Decoding the same file fails the same way on every attempt
+        logger.exception("Image processing error")
+        _mark_failed(db, job, e, permanent=True)
+        return False
+
+    try:
+        photo_url = storage.store(processed_path, f"{job['user_id']}-{job['_id']}")
+    except Exception as e:
+        logger.exception("Image upload error")
+        _mark_failed(db, job, e)
+        return False
+
+    try:
+        user = User.find_by_id(job['user_id'], fields=['photo_url'])
+        if user:
+            user.photo_url = photo_url
+            user.save()
+
+        now = datetime.utcnow()
+        db.image_uploads.update_one(
+            {'_id': job['_id']},
+            {'$set': {'status': STATUS_DONE, 'photo_url': photo_url, 'last_error': None,
+                      'completed_at': now, 'updated_at': now}}
+        )
+    except Exception as e:
+        logger.exception("Image job completion error")
+        _mark_failed(db, job, e)
+        return False
+    _remove_spool_files(job)
+    return True
+
+_workers = []
+_wake = threading.Event()
+
+def _upload_queue_depth():
+    db = get_db()
+    if db is None:
+        return None
+    return [({'status': status}, db.image_uploads.count_documents({'status': status}))
+            for status in (STATUS_PENDING, STATUS_PROCESSING)]
+
+metrics.gauge('image_upload_jobs', 'Profile image jobs waiting for or in processing', _upload_queue_depth, ('status',))
+
+class ImageWorker(threading.Thread):
+    def __init__(self, name, storage=None):
+        super().__init__(name=name, daemon=True)
+        self.storage = storage or get_storage()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                db = get_db()
+                job = claim_job(db, self.name) if db is not None else None
+                if job is not None:
+                    run_job(db, job, self.storage)
+                    continue
+            except Exception:
+                logger.exception("Image worker error")
+            _wake.wait(IMAGE_POLL_SECONDS)
+            _wake.clear()
+
+    def stop(self):
+        self.stopping.set()
+        _wake.set()
+
+def start_image_workers(count=IMAGE_WORKERS):
+    """Start the background upload pool once per process"""
+    if _workers:
+        return _workers
+    for index in range(count):
+        worker = ImageWorker(f"image-worker-{os.getpid()}-{index}")
+        worker.start()
+        _workers.append(worker)
+    return _workers
+
+def stop_image_workers(timeout=5):
+    for worker in _workers:
+        worker.stop()
+    for worker in _workers:
+        worker.join(timeout)
+    del _workers[:]
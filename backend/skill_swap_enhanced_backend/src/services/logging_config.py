@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import traceback
+import uuid
+from datetime import datetime, timezone
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from flask import request, g
+from src.services import metrics
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'json' for production; 'text' reads better in a local terminal
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Records waiting for the writer thread; when full, new records are dropped rather than block a request
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Per call site, the first LOG_SAMPLE_BURST records in each window are kept, then one in LOG_SAMPLE_EVERY
+LOG_SAMPLE_WINDOW_SECONDS = float(os.getenv('LOG_SAMPLE_WINDOW_SECONDS', 60))
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', 20))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 100))
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+_request_id = ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'trace_id', 'span_id', 'sampled_out'
+}
+
+def current_request_id():
+    return _request_id.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with request and trace ids and the full traceback"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'trace_id': getattr(record, 'trace_id', None),
+            'span_id': getattr(record, 'span_id', None),
+            'thread': record.threadName
+        }
+        if getattr(record, 'sampled_out', 0):
+            entry['sampled_out'] = record.sampled_out
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = {
+                'type': record.exc_info[0].__name__,
+                'message': str(record.exc_info[1]),
+                'traceback': ''.join(traceback.format_exception(*record.exc_info))
+            }
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        record.request_id = getattr(record, 'request_id', None) or '-'
+        return super().format(record)
+
+class ContextFilter(logging.Filter):
+    """Stamps the request id on records; runs on the caller's thread, before the record is queued"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class StormSampler(logging.Filter):
+    """Thins out repeated records from one call site, so an error storm can't flood the queue.
+
+    Kept records report how many were dropped since the previous one.
+    """
+
+    def __init__(self, window=LOG_SAMPLE_WINDOW_SECONDS, burst=LOG_SAMPLE_BURST, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.every = every
+        self._lock = threading.Lock()
+        # (logger, path, line) -> [window start, seen in window, dropped since last kept]
+        self._sites = {}
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                dropped = site[2] if site else 0
+                site = self._sites[key] = [now, 0, dropped]
+                if len(self._sites) > 10000:
+                    self._sites = {key: site}
+            site[1] += 1
+            if site[1] > self.burst and (site[1] - self.burst) % self.every:
+                site[2] += 1
+                return False
+            record.sampled_out = site[2]
+            site[2] = 0
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks: a full queue drops the record and counts it"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+
+def configure_logging():
+    """Route the root logger through a bounded queue to a background writer thread.
+
+    Records are formatted on the calling thread, so request and trace ids are
+    captured where they were logged; only the write to stdout is deferred.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter('%(message)s'))
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    handler.addFilter(ContextFilter())
+    handler.addFilter(StormSampler())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    metrics.gauge('log_records_dropped', 'Log records dropped because the log queue was full',
+                  lambda: handler.dropped)
+
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def install_request_ids(app):
+    """Give every request an id, taken from X-Request-Id when a proxy already set one"""
+
+    @app.before_request
+    def _assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        request_id = incoming if 0 < len(incoming) <= 128 else uuid.uuid4().hex
+        g.request_id = request_id
+        _request_id.set(request_id)
+
+    @app.after_request
+    def _return_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(error=None):
+        _request_id.set(None)
@@ -0,0 +1,285 @@
+import logging
+import os
+import time
+import socket
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from pymongo import ReturnDocument
+from src.models.user import get_db
+from src.services import metrics
+from src.services.tracing import external_call
+
+logger = logging.getLogger(__name__)
+
+# SMTP configuration; point SMTP_HOST/SMTP_PORT at a local server and set
+# SMTP_USE_TLS=false to run against a stand-in such as `python -m aiosmtpd -n`
+EMAIL_ID = os.getenv('EMAIL_ID')
+APP_PASSWORD = os.getenv('APP_PASSWORD')
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+# Connections idle longer than this are re-checked with NOOP before reuse
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', 60))
+
+# Queue tuning
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', 2))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 20))
+MAIL_POLL_SECONDS = float(os.getenv('MAIL_POLL_SECONDS', 2))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_BACKOFF_SECONDS = int(os.getenv('MAIL_BACKOFF_SECONDS', 30))
+# A message claimed for longer than this is assumed to belong to a dead worker
+MAIL_CLAIM_TIMEOUT_SECONDS = int(os.getenv('MAIL_CLAIM_TIMEOUT_SECONDS', 300))
+
+# Message statuses: pending -> sending -> sent, or back to pending for a retry, or failed
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# Errors that will not go away by retrying the same message
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+# Server replies that are only permanent with a 5xx code; 4xx means try again later
+PERMANENT_REPLY_ERRORS = (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+_workers = []
+_wake = threading.Event()
+
+def _outbox_depth():
+    db = get_db()
+    if db is None:
+        return None
+    return [({'status': status}, db.email_outbox.count_documents({'status': status}))
+            for status in (STATUS_PENDING, STATUS_SENDING)]
+
+metrics.gauge('mail_outbox_messages', 'Outbox messages waiting for or in delivery', _outbox_depth, ('status',))
+
+def _outbox_document(to_email, subject, body):
+    now = datetime.utcnow()
+    return {
+        'to': to_email,
+        'subject': subject,
+        'body': body,
+        'status': STATUS_PENDING,
+        'attempts': 0,
+        'last_error': None,
+        'created_at': now,
+        'updated_at': now,
+        'next_attempt_at': now,
+        'sent_at': None
+    }
+
+def enqueue_email(to_email, subject, body):
+    """Queue an HTML email for background delivery and return its outbox id"""
+    if not EMAIL_ID:
+        # No workers run without credentials, so a queued message would never leave
+        logger.warning("Email not queued: email credentials not configured")
+        return None
+    db = get_db()
+    if db is None:
+        logger.warning("Email not queued: database not available")
+        return None
+
+    result = db.email_outbox.insert_one(_outbox_document(to_email, subject, body))
+    _wake.set()
+    return result.inserted_id
+
+def enqueue_emails(messages):
+    """Queue many (to_email, subject, body) tuples with a single insert"""
+    if not messages:
+        return []
+    if not EMAIL_ID:
+        logger.warning("%d emails not queued: email credentials not configured", len(messages))
+        return []
+    db = get_db()
+    if db is None:
+        return []
+
+    result = db.email_outbox.insert_many(
+        [_outbox_document(to_email, subject, body) for to_email, subject, body in messages],
+        ordered=False
+    )
+    _wake.set()
+    return result.inserted_ids
+
+def get_email_status(email_id):
+    db = get_db()
+    if db is None:
+        return None
+    return db.email_outbox.find_one(
+        {'_id': email_id},
+        {'status': 1, 'attempts': 1, 'last_error': 1, 'sent_at': 1, 'next_attempt_at': 1}
+    )
+
+def build_message(to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_ID
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg.as_string()
+
+class SMTPConnection:
+    """One authenticated SMTP session that is kept open across messages"""
+
+    def __init__(self, host=None, port=None, use_tls=None, username=None, password=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.use_tls = SMTP_USE_TLS if use_tls is None else use_tls
+        self.username = EMAIL_ID if username is None else username
+        self.password = APP_PASSWORD if password is None else password
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        self.close()
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.server = server
+
+    def _ensure_connected(self):
+        if self.server is None:
+            self._connect()
+        elif time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+            # The server may have dropped an idle session; probe before reuse
+            try:
+                if self.server.noop()[0] != 250:
+                    self._connect()
+            except (smtplib.SMTPException, OSError):
+                self._connect()
+
+    def send(self, to_email, message):
+        with external_call('smtp', 'send'):
+            self._ensure_connected()
+            try:
+                self.server.sendmail(self.username or EMAIL_ID, to_email, message)
+            except (smtplib.SMTPServerDisconnected, socket.error):
+                # Reconnect once; a second failure goes back to the queue
+                self._connect()
+                self.server.sendmail(self.username or EMAIL_ID, to_email, message)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+def claim_batch(db, worker_name, batch_size=MAIL_BATCH_SIZE):
+    """Atomically claim up to batch_size due messages for one worker"""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=MAIL_CLAIM_TIMEOUT_SECONDS)
+    claimed = []
+    for _ in range(batch_size):
+        message = db.email_outbox.find_one_and_update(
+            {
+                '$or': [
+                    {'status': STATUS_PENDING, 'next_attempt_at': {'$lte': now}},
+                    {'status': STATUS_SENDING, 'claimed_at': {'$lt': stale_before}}
+                ]
+            },
+            {
+                '$set': {'status': STATUS_SENDING, 'claimed_by': worker_name, 'claimed_at': now},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('next_attempt_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if message is None:
+            break
+        claimed.append(message)
+    return claimed
+
+def _mark_sent(db, message):
+    now = datetime.utcnow()
+    db.email_outbox.update_one(
+        {'_id': message['_id']},
+        {'$set': {'status': STATUS_SENT, 'sent_at': now, 'updated_at': now, 'last_error': None}}
+    )
+
+def _mark_failed(db, message, error, permanent=False):
+    now = datetime.utcnow()
+    attempts = message.get('attempts', 1)
+    if permanent or attempts >= MAIL_MAX_ATTEMPTS:
+        update = {'status': STATUS_FAILED}
+    else:
+        # Exponential backoff: 30s, 60s, 120s, ...
+        delay = MAIL_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        update = {'status': STATUS_PENDING, 'next_attempt_at': now + timedelta(seconds=delay)}
+    update.update({'last_error': str(error), 'updated_at': now})
+    db.email_outbox.update_one({'_id': message['_id']}, {'$set': update})
+
+def _is_permanent(error):
+    if isinstance(error, PERMANENT_REPLY_ERRORS):
+        return error.smtp_code >= 500
+    return isinstance(error, PERMANENT_ERRORS)
+
+def deliver_batch(db, connection, messages):
+    """Send claimed messages over one connection; returns how many were sent"""
+    sent = 0
+    for message in messages:
+        try:
+            connection.send(message['to'], build_message(message['to'], message['subject'], message['body']))
+            _mark_sent(db, message)
+            sent += 1
+        except Exception as e:
+            if _is_permanent(e):
+                _mark_failed(db, message, e, permanent=True)
+                continue
+            logger.exception("Email delivery error")
+            _mark_failed(db, message, e)
+            # Start the next message on a fresh session
+            connection.close()
+    return sent
+
+class MailWorker(threading.Thread):
+    def __init__(self, name, connection=None):
+        super().__init__(name=name, daemon=True)
+        self.connection = connection or SMTPConnection()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                db = get_db()
+                messages = claim_batch(db, self.name) if db is not None else []
+                if messages:
+                    deliver_batch(db, self.connection, messages)
+                    continue
+            except Exception:
+                logger.exception("Mail worker error")
+            _wake.wait(MAIL_POLL_SECONDS)
+            _wake.clear()
+        self.connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        _wake.set()
+
+def start_mail_workers(count=MAIL_WORKERS):
+    """Start the background delivery pool once per process"""
+    if _workers:
+        return _workers
+    if not EMAIL_ID:
+        logger.warning("Email credentials not configured; mail workers not started")
+        return _workers
+    for index in range(count):
+        worker = MailWorker(f"mail-worker-{os.getpid()}-{index}")
+        worker.start()
+        _workers.append(worker)
+    return _workers
+
+def stop_mail_workers(timeout=5):
+    for worker in _workers:
+        worker.stop()
+    for worker in _workers:
+        worker.join(timeout)
+    del _workers[:]
@@ -0,0 +1,258 @@
+import logging
+import os
+import time
+import threading
+import itertools
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import request, g
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast cache hits up to slow external calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+class _ThreadToken:
+    """Held in a thread's locals only; it is collected when the thread exits"""
+
+class _Metric:
+    """Values are kept in one shard per thread, so recording never takes a lock.
+
+    A shard is only written by its own thread; the scrape sums every shard plus
+    the retired total. When a thread exits its shard is folded into the retired
+    total, so nothing is lost and shards are bounded by the live threads.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._shard_ids = itertools.count()
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            shard_id = next(self._shard_ids)
+            # Only taken the first time a thread records this metric
+            with self._shards_lock:
+                self._shards[shard_id] = shard
+            self._local.token = _ThreadToken()
+            weakref.finalize(self._local.token, self._retire, shard_id)
+        return shard
+
+    def _retire(self, shard_id):
+        # The owning thread has exited, so nothing writes the shard any more
+        with self._shards_lock:
+            shard = self._shards.pop(shard_id, None)
+            if shard:
+                self._merge(self._retired, shard)
+
+    def _merge(self, into, shard):
+        raise NotImplementedError
+
+    def _label_values(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _snapshot(self):
+        with self._shards_lock:
+            # dict() of a shard another thread is writing is safe under the GIL
+            return [dict(shard) for shard in self._shards.values()] + [dict(self._retired)]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._label_values(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, into, shard):
+        for key, value in shard.items():
+            into[key] = into.get(key, 0) + value
+
+    def samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            self._merge(totals, shard)
+        return [(self.name, key, value) for key, value in sorted(totals.items())]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._label_values(labels)
+        # [count per bucket..., count above the last bucket, sum]
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, labelled outcome=ok or error"""
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            if 'outcome' in self.labelnames:
+                labels['outcome'] = outcome
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _merge(self, into, shard):
+        for key, counts in shard.items():
+            total = into.setdefault(key, [0] * len(counts[:-1]) + [0.0])
+            for index, count in enumerate(counts):
+                total[index] += count
+
+    def samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            self._merge(totals, shard)
+
+        samples = []
+        label_names = self.labelnames + ('le',)
+        for key, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key + (_format_value(bound),), cumulative, label_names))
+            samples.append((f'{self.name}_count', key, cumulative))
+            samples.append((f'{self.name}_sum', key, counts[-1]))
+        return samples
+
+class Gauge:
+    """Read at scrape time from a callback returning a number or a list of (labels dict, value)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception:
+            logger.exception("Metrics gauge %s error", self.name)
+            return []
+        if values is None:
+            return []
+        if not isinstance(values, list):
+            return [(self.name, (), values)]
+        return [
+            (self.name, tuple(str(labels.get(name, '')) for name in self.labelnames), value)
+            for labels, value in values
+        ]
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            # Modules may be imported more than once (app reloads); keep the first
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                name, label_values, value = sample[:3]
+                label_names = sample[3] if len(sample) > 3 else metric.labelnames
+                lines.append(f'{name}{_format_labels(label_names, label_values)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+registry = Registry()
+
+def counter(name, help_text, labelnames=()):
+    return registry.register(Counter(name, help_text, labelnames))
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, help_text, labelnames, buckets))
+
+def gauge(name, help_text, callback, labelnames=()):
+    return registry.register(Gauge(name, help_text, callback, labelnames))
+
+def render_metrics():
+    return registry.render()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Shared by every outbound integration, labelled by service and operation
+external_call_seconds = histogram(
+    'external_call_duration_seconds',
+    'Latency of calls to external services',
+    ('service', 'operation', 'outcome')
+)
+
+http_request_seconds = histogram(
+    'http_request_duration_seconds',
+    'Request latency by blueprint, route and status',
+    ('blueprint', 'route', 'method', 'status')
+)
+
+def instrument_app(app):
+    """Time every request; routes are labelled by their rule so ids don't explode cardinality"""
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            rule = request.url_rule
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                blueprint=request.blueprint or '',
+                route=rule.rule if rule is not None else 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from src.models.user import User, BCRYPT_ROUNDS
+from src.services import metrics
+
+# bcrypt releases the GIL while stretching keys, so a small thread pool uses
+# real cores without holding up the request threads. Sized well below the
+# WSGI worker count so a login burst can't occupy every core.
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Hash jobs allowed to wait for a worker; beyond this requests are turned away
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 32))
+# Longest a request waits for its hash before giving up
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 10))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 2))
+
+class HasherBusy(Exception):
+    """The hashing pool is saturated; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after=PASSWORD_HASH_RETRY_AFTER):
+        super().__init__('Password hashing is saturated')
+        self.retry_after = retry_after
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash such as $2b$12$..."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE,
+                 rounds=BCRYPT_ROUNDS, timeout=PASSWORD_HASH_TIMEOUT_SECONDS):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        # Running plus queued jobs; acquired without blocking so overload fails fast
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._metrics = {
+            'hash': {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0},
+            'verify': {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0},
+            'rejected': 0,
+            'timed_out': 0
+        }
+
+    def _timed(self, operation, func, *args):
+        with self._lock:
+            self._running += 1
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                metric = self._metrics[operation]
+                metric['count'] += 1
+                metric['seconds'] += elapsed
+                metric['max_seconds'] = max(metric['max_seconds'], elapsed)
+
+    def _run(self, operation, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics['rejected'] += 1
+            raise HasherBusy()
+        with self._lock:
+            self._in_flight += 1
+
+        def release(_):
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        future = self._executor.submit(self._timed, operation, func, *args)
+        future.add_done_callback(release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._metrics['timed_out'] += 1
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run('hash', User.hash_password, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run('verify', User.check_password, password, hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'rounds': self.rounds,
+                'in_flight': self._in_flight,
+                'running': self._running,
+                'queue_depth': self._in_flight - self._running,
+                'rejected': self._metrics['rejected'],
+                'timed_out': self._metrics['timed_out']
+            }
+            for operation in ('hash', 'verify'):
+                metric = self._metrics[operation]
+                stats[operation] = {
+                    'count': metric['count'],
+                    'avg_ms': round(metric['seconds'] / metric['count'] * 1000, 1) if metric['count'] else None,
+                    'max_ms': round(metric['max_seconds'] * 1000, 1)
+                }
+            return stats
+
+password_hasher = PasswordHasher()
+
+metrics.gauge('password_hasher_in_flight', 'Hash jobs running or queued', lambda: password_hasher.stats()['in_flight'])
+metrics.gauge('password_hasher_queue_depth', 'Hash jobs waiting for a worker', lambda: password_hasher.stats()['queue_depth'])
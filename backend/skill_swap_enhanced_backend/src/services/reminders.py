@@ -0,0 +1,214 @@
+import os
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+from src.models.user import get_db, User
+from src.services.mail_queue import enqueue_emails
+
+# Sessions handled per round trip group (one user $in, one dedupe query, one insert_many)
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 1000))
+
+# User fields needed to build session reminders
+REMINDER_USER_FIELDS = ['name', 'email', 'notification_preferences']
+
+SESSION_REMINDER_FIELDS = {
+    'teacher_id': 1, 'student_id': 1, 'skill': 1, 'scheduled_date': 1, 'duration': 1, 'meeting_link': 1
+}
+
+DUPLICATE_KEY_ERROR = 11000
+
+def _email_body(recipient, session, session_time, role_label, participant_label, participant_name):
+    meeting_link = session.get('meeting_link')
+    return f"""
+    <html>
+    <body>
+        <h2>Session Reminder</h2>
+        <p>Hi {recipient.name},</p>
+        <p>You have an upcoming {role_label} session:</p>
+        <ul>
+            <li><strong>Skill:</strong> {session['skill']}</li>
+            <li><strong>{participant_label}:</strong> {participant_name}</li>
+            <li><strong>Date & Time:</strong> {session_time}</li>
+            <li><strong>Duration:</strong> {session['duration']} minutes</li>
+        </ul>
+        {f'<p><strong>Meeting Link:</strong> <a href="{meeting_link}">{meeting_link}</a></p>' if meeting_link else ''}
+        <p>Best regards,<br>The SkillSwap Team</p>
+    </body>
+    </html>
+    """
+
+def _build_reminders(session, teacher, student, window, now):
+    """Notification and email for each participant who wants session reminders"""
+    session_id = str(session['_id'])
+    session_time = session['scheduled_date'].strftime('%Y-%m-%d at %H:%M UTC')
+    participants = [
+        (teacher, session['teacher_id'], 'Upcoming Teaching Session', 'teaching', 'Student', student,
+         f'You have a session to teach "{session["skill"]}" to {student.name} on {session_time}'),
+        (student, session['student_id'], 'Upcoming Learning Session', 'learning', 'Teacher', teacher,
+         f'You have a session to learn "{session["skill"]}" from {teacher.name} on {session_time}'),
+    ]
+
+    reminders = []
+    for recipient, recipient_id, title, role_label, participant_label, participant, message in participants:
+        preferences = recipient.notification_preferences or {}
+        if not preferences.get('session_reminders', True):
+            continue
+
+        notification = {
+            'user_id': recipient_id,
+            'type': 'session_reminder',
+            'title': title,
+            'message': message,
+            'read': False,
+            'created_at': now,
+            'data': {
+                'session_id': session_id,
+                'participant_name': participant.name,
+                'skill': session['skill'],
+                'reminder_window': window
+            }
+        }
+        email = None
+        if preferences.get('email_notifications', True):
+            email = (
+                recipient.email,
+                f"SkillSwap: {title}",
+                _email_body(recipient, session, session_time, role_label, participant_label, participant.name)
+            )
+        reminders.append((notification, email))
+    return reminders
+
+def _already_reminded(db, session_ids, window):
+    """(session_id, user_id) pairs that already have a reminder for this window"""
+    windows = [window]
+    # Reminders written before windows existed count as the 24h reminder
+    if window == '24h':
+        windows.append(None)
+    existing = db.notifications.find(
+        {
+            'type': 'session_reminder',
+            'data.session_id': {'$in': session_ids},
+            'data.reminder_window': {'$in': windows}
+        },
+        {'user_id': 1, 'data.session_id': 1}
+    )
+    return {(reminder['data']['session_id'], reminder['user_id']) for reminder in existing}
+
+def _insert_reminders(db, notifications):
+    """Insert in bulk; duplicates rejected by the unique index are skipped.
+
+    Returns the set of positions in `notifications` that were written.
+    """
+    if not notifications:
+        return set()
+    written = set(range(len(notifications)))
+    try:
+        db.notifications.insert_many(notifications, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            if error.get('code') != DUPLICATE_KEY_ERROR:
+                raise
+            written.discard(error['index'])
+    return written
+
+def _process_batch(db, sessions, window, metrics):
+    user_ids = set()
+    for session in sessions:
+        user_ids.add(session['teacher_id'])
+        user_ids.add(session['student_id'])
+    users = User.find_many_by_ids(user_ids, fields=REMINDER_USER_FIELDS)
+    reminded = _already_reminded(db, [str(session['_id']) for session in sessions], window)
+
+    now = datetime.utcnow()
+    notifications = []
+    emails = []
+    for session in sessions:
+        teacher = users.get(session['teacher_id'])
+        student = users.get(session['student_id'])
+        if not teacher or not student:
+            continue
+        for notification, email in _build_reminders(session, teacher, student, window, now):
+            if (notification['data']['session_id'], notification['user_id']) in reminded:
+                metrics['duplicates_skipped'] += 1
+                continue
+            notifications.append(notification)
+            emails.append(email)
+
+    written = _insert_reminders(db, notifications)
+    metrics['duplicates_skipped'] += len(notifications) - len(written)
+    metrics['reminders_created'] += len(written)
+
+    # Only email reminders that were actually written, so a lost race can't double-send
+    queued = enqueue_emails([emails[index] for index in sorted(written) if emails[index]])
+    metrics['emails_queued'] += len(queued)
+
+def remind_sessions(session_query, window='24h', batch_size=REMINDER_BATCH_SIZE):
+    """Create reminders for every scheduled session matching session_query.
+
+    Sessions are processed in batches, each costing one participant $in query,
+    one dedupe query, one insert_many and one outbox insert. Returns run metrics.
+    """
+    db = get_db()
+    if db is None:
+        raise Exception("Database not initialized")
+
+    metrics = {
+        'window': window,
+        'sessions_scanned': 0,
+        'reminders_created': 0,
+        'duplicates_skipped': 0,
+        'emails_queued': 0,
+        'batches': 0
+    }
+    started = time.monotonic()
+
+    cursor = db.sessions.find(session_query, SESSION_REMINDER_FIELDS).batch_size(batch_size)
+
+    batch = []
+    for session in cursor:
+        batch.append(session)
+        if len(batch) >= batch_size:
+            _process_batch(db, batch, window, metrics)
+            metrics['sessions_scanned'] += len(batch)
+            metrics['batches'] += 1
+            batch = []
+    if batch:
+        _process_batch(db, batch, window, metrics)
+        metrics['sessions_scanned'] += len(batch)
+        metrics['batches'] += 1
+
+    elapsed = time.monotonic() - started
+    metrics['duration_seconds'] = round(elapsed, 3)
+    metrics['sessions_per_second'] = round(metrics['sessions_scanned'] / elapsed, 1) if elapsed > 0 else None
+    return metrics
+
+def run_session_reminders(start, end, window='24h', batch_size=REMINDER_BATCH_SIZE):
+    """Create reminders for scheduled sessions starting in [start, end]"""
+    return remind_sessions(
+        {'scheduled_date': {'$gte': start, '$lte': end}, 'status': 'scheduled'},
+        window=window,
+        batch_size=batch_size
+    )
+
+def run_incremental_reminders(window, horizon, high_water_mark, changed_since, now=None):
+    """Remind sessions that entered the window since the last scan.
+
+    Covers sessions whose start moved past the previous high-water mark, plus
+    sessions created or rescheduled since the last scan that already fall
+    inside the window. Rows matched twice are dropped by the unique index.
+    """
+    now = now or datetime.utcnow()
+    end = now + horizon
+    query = {
+        '$or': [
+            {'status': 'scheduled', 'scheduled_date': {'$gt': high_water_mark, '$lte': end}},
+            {'status': 'scheduled', 'updated_at': {'$gt': changed_since}, 'scheduled_date': {'$gte': now, '$lte': end}}
+        ]
+    }
+    metrics = remind_sessions(query, window=window)
+    metrics['high_water_mark'] = end
+    return metrics
+
+def send_upcoming_reminders(hours=24, window='24h'):
+    now = datetime.utcnow()
+    return run_session_reminders(now, now + timedelta(hours=hours), window=window)
@@ -0,0 +1,260 @@
+import logging
+import os
+import time
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from src.models.user import get_db, ensure_db_setup
+from src.services.reminders import run_incremental_reminders
+from src.models.stats_rollups import rebuild_rollups, month_key
+from src.models.session_accounting import recover_pending_accounting
+from src.models.session_buckets import rebuild_session_buckets, reindex_changed_sessions
+from src.models.participant_snapshots import backfill_snapshots, refresh_changed_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+SCHEDULER_TICK_SECONDS = float(os.getenv('SCHEDULER_TICK_SECONDS', 5))
+# The leader must renew its lease within this time or another process takes over
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 30))
+REMINDER_INTERVAL_SECONDS = int(os.getenv('REMINDER_INTERVAL_SECONDS', 60))
+# Rescan a little behind the last mark to absorb clock skew between app servers
+SCAN_OVERLAP_SECONDS = int(os.getenv('SCAN_OVERLAP_SECONDS', 60))
+ROLLUP_RECONCILE_SECONDS = int(os.getenv('ROLLUP_RECONCILE_SECONDS', 900))
+ACCOUNTING_RECOVERY_SECONDS = int(os.getenv('ACCOUNTING_RECOVERY_SECONDS', 60))
+SESSION_BUCKET_RECONCILE_SECONDS = int(os.getenv('SESSION_BUCKET_RECONCILE_SECONDS', 300))
+# How soon a profile change reaches the snapshots on swap requests and sessions
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv('SNAPSHOT_REFRESH_SECONDS', 60))
+
+LEADER_LEASE = 'scheduler-leader'
+
+# Unique per process so leases can tell workers apart; job runs add a
+# per-call token so a second trigger in the same process can't share the lease
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class Job:
+    def __init__(self, name, interval_seconds, func, timeout_seconds=600):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        # func(state) -> (metrics, state_updates); state is the job's scheduler_state document
+        self.func = func
+        self.timeout_seconds = timeout_seconds
+
+JOBS = {}
+
+def register_job(name, interval_seconds, func, timeout_seconds=600):
+    JOBS[name] = Job(name, interval_seconds, func, timeout_seconds)
+    return JOBS[name]
+
+def acquire_lease(db, name, owner=OWNER_ID, ttl_seconds=SCHEDULER_LEASE_SECONDS):
+    """Take or renew a named lease; True if `owner` holds it afterwards"""
+    now = datetime.utcnow()
+    try:
+        db.scheduler_leases.find_one_and_update(
+            {'_id': name, '$or': [{'owner': owner}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=ttl_seconds), 'renewed_at': now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease document exists and is held by someone else
+        return False
+
+def release_lease(db, name, owner=OWNER_ID):
+    # Deleted rather than expired: stored times are millisecond precision, so an
+    # expiry of "now" could still look live to an acquire in the same millisecond
+    db.scheduler_leases.delete_one({'_id': name, 'owner': owner})
+
+def run_job(name, trigger='schedule'):
+    """Run a job under its own lease and record the run.
+
+    Returns the run document, or None when another process is already running
+    the job, so overlapping triggers never execute it twice at once.
+    """
+    db = get_db()
+    if db is None:
+        raise Exception("Database not initialized")
+
+    job = JOBS[name]
+    lease_name = f"job:{name}"
+    owner = f"{OWNER_ID}:{uuid.uuid4().hex}"
+    if not acquire_lease(db, lease_name, owner=owner, ttl_seconds=job.timeout_seconds):
+        return None
+
+    started_at = datetime.utcnow()
+    run = {
+        'job': name,
+        'trigger': trigger,
+        'owner': owner,
+        'started_at': started_at,
+        'status': 'running'
+    }
+    run['_id'] = db.scheduler_runs.insert_one(run).inserted_id
+
+    state = db.scheduler_state.find_one({'_id': name}) or {'_id': name}
+    try:
+        metrics, state_updates = job.func(state)
+        run.update({'status': 'succeeded', 'metrics': metrics})
+        state_updates = dict(state_updates or {})
+        state_updates['last_success_at'] = started_at
+    except Exception as e:
+        logger.exception("Scheduled job %s error", name)
+        run.update({'status': 'failed', 'error': str(e)})
+        state_updates = {}
+    finally:
+        release_lease(db, lease_name, owner=owner)
+
+    finished_at = datetime.utcnow()
+    run['finished_at'] = finished_at
+    run['duration_seconds'] = round((finished_at - started_at).total_seconds(), 3)
+    db.scheduler_runs.update_one({'_id': run['_id']}, {'$set': run})
+
+    state_updates.update({
+        'last_run_at': started_at,
+        'last_status': run['status'],
+        'next_run_at': started_at + timedelta(seconds=job.interval_seconds)
+    })
+    db.scheduler_state.update_one({'_id': name}, {'$set': state_updates}, upsert=True)
+    return run
+
+def get_job_runs(job=None, limit=50):
+    db = get_db()
+    if db is None:
+        return []
+    query = {'job': job} if job else {}
+    return list(db.scheduler_runs.find(query).sort('started_at', -1).limit(limit))
+
+def _due_jobs(db, now):
+    states = {state['_id']: state for state in db.scheduler_state.find(
+        {'_id': {'$in': list(JOBS)}}, {'next_run_at': 1}
+    )}
+    return [
+        name for name in JOBS
+        if states.get(name, {}).get('next_run_at') is None or states[name]['next_run_at'] <= now
+    ]
+
+def _reminder_job(window, horizon):
+    """Incremental reminder scan that resumes from the stored high-water mark"""
+    def run(state):
+        now = datetime.utcnow()
+        overlap = timedelta(seconds=SCAN_OVERLAP_SECONDS)
+        high_water_mark = state.get('high_water_mark') or now
+        changed_since = (state.get('last_success_at') or now) - overlap
+        metrics = run_incremental_reminders(window, horizon, high_water_mark - overlap, changed_since, now=now)
+        return metrics, {'high_water_mark': metrics.pop('high_water_mark')}
+    return run
+
+# Session reminder windows
+REMINDER_WINDOWS = [
+    ('24h', timedelta(hours=24)),
+    ('1h', timedelta(hours=1)),
+    ('10min', timedelta(minutes=10)),
+]
+
+for _window, _horizon in REMINDER_WINDOWS:
+    register_job(f"session_reminders_{_window}", REMINDER_INTERVAL_SECONDS, _reminder_job(_window, _horizon))
+
+def _reconcile_rollups(state):
+    """Correct drift in the write-time stats counters for the current month"""
+    summary = rebuild_rollups(get_db(), months=[month_key(datetime.utcnow())])
+    return summary, {}
+
+register_job('stats_rollup_reconcile', ROLLUP_RECONCILE_SECONDS, _reconcile_rollups)
+
+def _recover_accounting(state):
+    return recover_pending_accounting(get_db()), {}
+
+register_job('session_accounting_recovery', ACCOUNTING_RECOVERY_SECONDS, _recover_accounting)
+
+def _reconcile_session_buckets(state):
+    """Backfill the calendar buckets once, then re-index sessions changed since the last run"""
+    now = datetime.utcnow()
+    if state.get('backfilled_at') is None:
+        return {'sessions_indexed': rebuild_session_buckets(get_db())}, {'backfilled_at': now}
+    changed_since = (state.get('last_success_at') or now) - timedelta(seconds=SCAN_OVERLAP_SECONDS)
+    return {'sessions_indexed': reindex_changed_sessions(get_db(), changed_since)}, {}
+
+register_job('session_buckets_reconcile', SESSION_BUCKET_RECONCILE_SECONDS, _reconcile_session_buckets)
+
+def _refresh_participant_snapshots(state):
+    """Backfill participant snapshots once, then fan out profiles changed since the last run"""
+    now = datetime.utcnow()
+    if state.get('backfilled_at') is None:
+        return backfill_snapshots(get_db()), {'backfilled_at': now}
+    changed_since = (state.get('last_success_at') or now) - timedelta(seconds=SCAN_OVERLAP_SECONDS)
+    return refresh_changed_snapshots(get_db(), changed_since), {}
+
+register_job('participant_snapshot_refresh', SNAPSHOT_REFRESH_SECONDS, _refresh_participant_snapshots)
+
+class Scheduler(threading.Thread):
+    """Runs due jobs while this process holds the leader lease"""
+
+    def __init__(self):
+        super().__init__(name=f"scheduler-{os.getpid()}", daemon=True)
+        self.stopping = threading.Event()
+        self.is_leader = False
+
+    def tick(self):
+        db = get_db()
+        # Jobs rely on the registered indexes (unique reminders, TTLs), so wait for setup
+        if db is None or not ensure_db_setup():
+            return
+        self.is_leader = acquire_lease(db, LEADER_LEASE)
+        if not self.is_leader:
+            return
+        for name in _due_jobs(db, datetime.utcnow()):
+            if self.stopping.is_set():
+                break
+            run_job(name)
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Scheduler error")
+            self.stopping.wait(SCHEDULER_TICK_SECONDS)
+        db = get_db()
+        if self.is_leader and db is not None:
+            release_lease(db, LEADER_LEASE)
+
+    def stop(self):
+        self.stopping.set()
+
+_scheduler = None
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None and SCHEDULER_ENABLED:
+        _scheduler = Scheduler()
+        _scheduler.start()
+    return _scheduler
+
+def stop_scheduler(timeout=10):
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler.join(timeout)
+        _scheduler = None
+
+if __name__ == '__main__':
+    # Sidecar mode: run the scheduler in its own process from the backend directory
+    # with `python -m src.services.scheduler`; set SCHEDULER_ENABLED=false on the web workers.
+    from dotenv import load_dotenv
+    from src.models.user import init_db
+
+    load_dotenv()
+    init_db()
+    scheduler = Scheduler()
+    scheduler.start()
+    try:
+        while scheduler.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        scheduler.join()
@@ -0,0 +1,305 @@
+import os
+import re
+import sys
+import time
+import random
+import secrets
+import logging
+import tempfile
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request, g
+from flask.json.provider import DefaultJSONProvider
+from src.services.metrics import external_call_seconds
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+# Requests slower than this keep their full span tree in memory for /api/traces
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', 500))
+# Fraction of other requests kept as well, as a baseline to compare against
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.0))
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', 200))
+# Spans beyond this per request are counted but not kept, so a loop of queries can't exhaust memory
+TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', 500))
+
+# Opt-in sampling profiler. Every in-flight request is sampled while enabled;
+# stacks are written out only for requests over the threshold.
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_THRESHOLD_MS = float(os.getenv('PROFILER_THRESHOLD_MS', 1000))
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', 5))
+PROFILER_DIR = os.getenv('PROFILER_DIR', os.path.join(tempfile.gettempdir(), 'skillswap-profiles'))
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current_span = ContextVar('current_span', default=None)
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'duration', 'error')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def finish(self, duration=None):
+        self.duration = time.perf_counter() - self.start if duration is None else duration
+        self.trace.add(self)
+
+    def to_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'offset_ms': round((self.start - self.trace.start) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+class Trace:
+    """The spans of one request, appended by its thread and any workers it fans out to"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def summary(self, root):
+        """Time per span name, plus the root's self time (Python work not covered by a child span)"""
+        by_name = {}
+        child_seconds = 0.0
+        for span in self.spans:
+            if span is root:
+                continue
+            entry = by_name.setdefault(span.name, {'count': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += span.duration * 1000
+            if span.parent_id == root.span_id:
+                child_seconds += span.duration
+        for entry in by_name.values():
+            entry['total_ms'] = round(entry['total_ms'], 3)
+        return {
+            'by_name': by_name,
+            'self_ms': round(max(0.0, root.duration - child_seconds) * 1000, 3)
+        }
+
+    def to_dict(self, root):
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'attributes': root.attributes,
+            'started_at': self.started_at,
+            'duration_ms': round(root.duration * 1000, 3),
+            'summary': self.summary(root),
+            'spans': [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)],
+            'dropped_spans': self.dropped
+        }
+
+def current_span():
+    return _current_span.get()
+
+def current_trace_ids():
+    """(trace id, span id) of the active span, or (None, None) outside a trace"""
+    span = _current_span.get()
+    if span is None:
+        return None, None
+    return span.trace.trace_id, span.span_id
+
+@contextmanager
+def start_span(name, **attributes):
+    """Time the block as a child of the current span; a no-op outside a traced request"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+
+def record_span(name, duration, error=None, **attributes):
+    """Attach an already finished operation, such as a MongoDB command seen by a listener"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    span = Span(parent.trace, name, parent.span_id, attributes)
+    span.start -= duration
+    span.error = error
+    span.finish(duration)
+
+@contextmanager
+def external_call(service, operation):
+    """Latency histogram plus a span for one call to an outside service"""
+    with start_span(f'{service}.{operation}'):
+        with external_call_seconds.time(service=service, operation=operation):
+            yield
+
+_recent_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+
+def recent_traces(limit=50):
+    return list(_recent_traces)[-limit:][::-1]
+
+class SamplingProfiler:
+    """Samples the Python stacks of in-flight requests from a background thread.
+
+    Stacks are kept in collapsed form ("outer;inner;leaf count"), which
+    flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, interval_ms=PROFILER_INTERVAL_MS, directory=PROFILER_DIR):
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self._lock = threading.Lock()
+        # thread id -> Counter of collapsed stacks
+        self._active = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def begin(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+
+    def end(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._collapse(frame)] += 1
+
+    def save(self, trace_id, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{int(time.time())}-{trace_id}.folded')
+        with open(path, 'w') as output:
+            for stack, count in stacks.most_common():
+                output.write(f'{stack} {count}\n')
+        return path
+
+profiler = SamplingProfiler()
+
+class TracingJSONProvider(DefaultJSONProvider):
+    """Times response serialization as its own span"""
+
+    def dumps(self, obj, **kwargs):
+        with start_span('json.serialize'):
+            return super().dumps(obj, **kwargs)
+
+_record_factory = logging.getLogRecordFactory()
+
+def _record_with_trace(*args, **kwargs):
+    record = _record_factory(*args, **kwargs)
+    record.trace_id, record.span_id = current_trace_ids()
+    return record
+
+def _incoming_trace_id():
+    match = _TRACEPARENT.match(request.headers.get('traceparent', '').strip().lower())
+    return match.group(1) if match else None
+
+def install_tracing(app):
+    """Open a root span per request and collect child spans for Mongo, external calls and JSON"""
+    if not TRACING_ENABLED:
+        return
+
+    app.json = TracingJSONProvider(app)
+    # Log records made inside a request carry trace_id and span_id
+    logging.setLogRecordFactory(_record_with_trace)
+    if PROFILER_ENABLED:
+        profiler.start()
+
+    @app.before_request
+    def _start_trace():
+        trace = Trace(_incoming_trace_id())
+        root = Span(trace, f'{request.method} {request.path}')
+        g.trace_root = root
+        _current_span.set(root)
+        if PROFILER_ENABLED:
+            profiler.begin(threading.get_ident())
+
+    @app.after_request
+    def _finish_trace(response):
+        root = g.pop('trace_root', None)
+        if root is None:
+            return response
+        # Serialization happened in the view, so the root can close here
+        rule = request.url_rule
+        root.attributes.update({
+            'route': rule.rule if rule is not None else 'unmatched',
+            'status': response.status_code
+        })
+        root.finish()
+        _current_span.set(None)
+        response.headers['X-Trace-Id'] = root.trace.trace_id
+
+        duration_ms = root.duration * 1000
+        profile_path = None
+        if PROFILER_ENABLED:
+            stacks = profiler.end(threading.get_ident())
+            if stacks and duration_ms >= PROFILER_THRESHOLD_MS:
+                try:
+                    profile_path = profiler.save(root.trace.trace_id, stacks)
+                except OSError:
+                    logger.exception("Profile save error")
+
+        slow = duration_ms >= TRACE_SLOW_MS
+        if slow or profile_path or (TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE):
+            trace = root.trace.to_dict(root)
+            trace['profile'] = profile_path
+            _recent_traces.append(trace)
+            if slow:
+                logger.warning("Slow request: %s took %.1fms", root.name, duration_ms, extra={
+                    'slow_trace_id': root.trace.trace_id,
+                    'duration_ms': round(duration_ms, 1),
+                    'self_ms': trace['summary']['self_ms'],
+                    'profile': profile_path
+                })
+        return response
+
+    @app.teardown_request
+    def _drop_trace(error=None):
+        # after_request doesn't run when building the response itself fails
+        if g.pop('trace_root', None) is not None and PROFILER_ENABLED:
+            profiler.end(threading.get_ident())
+        _current_span.set(None)
@@ -72,15 +72,25 @@ export const authAPI = {
   refresh: () => api.post('/auth/refresh'),
 }
 
+// Profile updates return a token carrying the new profile version; keep it
+// so later requests don't read a cached copy of the old profile
+const storeProfileToken = (response) => {
+  if (response.data?.token) {
+    localStorage.setItem('token', response.data.token)
+  }
+  return response
+}
+
 // User API
 export const userAPI = {
   getUsers: (params = {}) => api.get('/api/users', { params }),
   getUser: (userId) => api.get(`/api/users/${userId}`),
-  updateProfile: (userData) => api.post('/api/users', userData),
-  updateUser: (userId, userData) => api.put(`/api/users/${userId}`, userData),
+  updateProfile: (userData) => api.post('/api/users', userData).then(storeProfileToken),
+  updateUser: (userId, userData) => api.put(`/api/users/${userId}`, userData).then(storeProfileToken),
   uploadImage: (formData) => api.post('/api/users/upload-image', formData, {
     headers: { 'Content-Type': 'multipart/form-data' }
   }),
+  getUploadStatus: (jobId) => api.get(`/api/users/upload-image/${jobId}`),
   getUserStats: (userId) => api.get(`/api/users/${userId}/stats`),
   deleteUser: (userId) => api.delete(`/api/users/${userId}`),
 }
@@ -98,10 +108,12 @@ export const swapRequestAPI = {
 // Session API
 export const sessionAPI = {
   createSession: (sessionData) => api.post('/api/sessions', sessionData),
-  getUserSessions: (userId) => api.get(`/api/sessions/user/${userId}`),
+  getUserSessions: (userId, params = {}) => api.get(`/api/sessions/user/${userId}`, { params }),
   updateSession: (sessionId, sessionData) => api.put(`/api/sessions/${sessionId}`, sessionData),
   deleteSession: (sessionId) => api.delete(`/api/sessions/${sessionId}`),
   getUpcomingSessions: () => api.get('/api/sessions/upcoming'),
+  getCalendar: (params = {}) => api.get('/api/sessions/calendar', { params }),
+  suggestSlots: (params = {}) => api.get('/api/sessions/suggestions', { params }),
 }
 
 // Badge API
@@ -129,5 +141,10 @@ export const skillSuggestionAPI = {
   getPopularSkills: () => api.get('/api/skills/popular'),
 }
 
+// Dashboard API: every dashboard section in one request; params.sections and params.fields narrow it
+export const dashboardAPI = {
+  getDashboard: (userId, params = {}) => api.get(`/api/dashboard/${userId}`, { params }),
+}
+
 export default api
 